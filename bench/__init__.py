@@ -0,0 +1 @@
+"""Offline benchmarks: a mock TikTok server and runners driving the real clients."""
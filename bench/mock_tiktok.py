@@ -0,0 +1,311 @@
+"""
+Local stand-in for the TikTok endpoints the monitor and the recorder use.
+
+Serves, on a single host:
+- /tiktok/room/api/sign        (tikrec.com signing service)
+- /api-live/user/room/         (username -> room id)
+- /webcast/room/check_alive/   (batched liveness)
+- /webcast/room/info/          (title, owner and stream urls)
+- /api/user/list/, /foryou, /live  (followers mode and recorder init)
+- /stream/<room_id>.flv        (an endless FLV stream at a fixed bitrate)
+
+Latency, 5xx error rate and WAF answers are configurable. Point the
+clients at it with the environment returned by MockTikTok.env().
+
+Standalone:  python -m bench.mock_tiktok --users 100 --live-ratio 0.1
+"""
+
+import argparse
+import json
+import random
+import struct
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SEC_UID = 'MS4wLjABAAAAmockSecUid'
+FOLLOWING_PAGE_SIZE = 30
+FLV_HEADER = b'FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00'
+
+
+def flv_tag(tag_type: int, timestamp: int, payload: bytes) -> bytes:
+    header = struct.pack('>B', tag_type) + len(payload).to_bytes(3, 'big')
+    header += (timestamp & 0xFFFFFF).to_bytes(3, 'big') + bytes([timestamp >> 24 & 0xFF])
+    header += b'\x00\x00\x00'  # stream id
+    return header + payload + struct.pack('>I', 11 + len(payload))
+
+
+ROUTES = (
+    ('/tiktok/room/api/sign', 'sign'),
+    ('/api-live/user/room', 'user_room'),
+    ('/webcast/room/check_alive', 'check_alive'),
+    ('/webcast/room/info', 'room_info'),
+    ('/api/user/list', 'user_list'),
+    ('/foryou', 'foryou'),
+    ('/live', 'live'),
+)
+
+
+@dataclass
+class Answer:
+    endpoint: str
+    status: int
+    body: bytes
+    content_type: str = 'application/json'
+    headers: dict = field(default_factory=dict)
+
+    @classmethod
+    def json(cls, endpoint: str, data: dict, headers=None):
+        return cls(endpoint, 200, json.dumps(data).encode(), headers=headers or {})
+
+
+class MockTikTok:
+    """Synthetic user population behind a threaded HTTP server"""
+
+    def __init__(self, users=100, live_ratio=0.1, latency=0.05, error_rate=0.0,
+                 waf_rate=0.0, bitrate=2_000_000, host='127.0.0.1', port=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.waf_rate = waf_rate
+        self.bitrate = bitrate
+        self.random = random.Random(seed)
+
+        self.users = {f'user{i:05d}': str(7_000_000_000_000_000_000 + i) for i in range(users)}
+        self.owners = {room_id: user for user, room_id in self.users.items()}
+        self.live = set(self.random.sample(sorted(self.users), round(users * live_ratio)))
+
+        self.requests = Counter()  # endpoint label -> requests
+        self.statuses = Counter()  # HTTP status -> answers
+        self.first_byte_at = {}  # room_id -> epoch of the first FLV byte sent
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def env(self) -> dict:
+        """Environment that points TikTokAPI and the bot at this server"""
+        return {
+            'TIKREC_TIKTOK_URL': self.url,
+            'TIKREC_WEBCAST_URL': self.url,
+            'TIKREC_SIGN_URL': self.url,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_live(self, user: str, live: bool = True):
+        with self._lock:
+            (self.live.add if live else self.live.discard)(user)
+
+    def is_live(self, user: str) -> bool:
+        with self._lock:
+            return user in self.live
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.statuses.clear()
+            self.first_byte_at.clear()
+
+    def _count(self, endpoint: str, status: int):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.statuses[status] += 1
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+    def respond(self, path: str) -> 'Answer':
+        """
+        Answer to a GET of path (with query string), apart from the FLV
+        stream. Used by the HTTP handler and, without sockets, by the
+        scale simulator.
+        """
+        parsed = urlparse(path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        endpoint = next((name for prefix, name in ROUTES if parsed.path.startswith(prefix)), None)
+        if endpoint is None:
+            answer = Answer('other', 404, b'not found', 'text/plain')
+        elif self._roll(self.waf_rate):
+            # The room endpoint answers 200 with a challenge page, others 403
+            status = 200 if endpoint == 'user_room' else 403
+            answer = Answer(endpoint, status, b'<html>Please wait...</html>', 'text/html')
+        elif self._roll(self.error_rate):
+            answer = Answer(endpoint, 500, b'', 'text/plain')
+        else:
+            answer = getattr(self, f'_{endpoint}')(endpoint, query)
+
+        self._count(answer.endpoint, answer.status)
+        return answer
+
+    def _sign(self, endpoint, query):
+        user = query.get('unique_id', '')
+        return Answer.json(endpoint, {'signed_path': f'/api-live/user/room/?aid=1988&uniqueId={user}&sourceType=54'})
+
+    def _user_room(self, endpoint, query):
+        room_id = self.users.get(query.get('uniqueId', ''))
+        if room_id is None:
+            return Answer.json(endpoint, {'data': {}, 'statusCode': 19881007})
+        status = 2 if self.is_live(self.owners[room_id]) else 4
+        return Answer.json(endpoint, {'data': {'user': {'roomId': room_id, 'status': status}}, 'statusCode': 0})
+
+    def _check_alive(self, endpoint, query):
+        room_ids = [r for r in query.get('room_ids', '').split(',') if r]
+        data = []
+        for room_id in room_ids:
+            owner = self.owners.get(room_id)
+            data.append({
+                'alive': bool(owner and self.is_live(owner)),
+                'room_id': int(room_id) if room_id.isdigit() else 0,
+                'room_id_str': room_id,
+            })
+        return Answer.json(endpoint, {'data': data, 'status_code': 0})
+
+    def _room_info(self, endpoint, query):
+        room_id = query.get('room_id', '')
+        owner = self.owners.get(room_id)
+        if owner is None or not self.is_live(owner):
+            return Answer.json(endpoint, {'data': {'status': 4}, 'status_code': 0})
+
+        flv = f'{self.url}/stream/{room_id}.flv'
+        stream_data = {'data': {'origin': {'main': {'flv': flv, 'hls': ''}}}}
+        return Answer.json(endpoint, {
+            'data': {
+                'status': 2,
+                'title': f'{owner} live',
+                'owner': {'display_id': owner},
+                'stream_url': {
+                    'live_core_sdk_data': {
+                        'pull_data': {
+                            'stream_data': json.dumps(stream_data),
+                            'options': {'qualities': [{'sdk_key': 'origin', 'level': 10}]},
+                        }
+                    },
+                    'flv_pull_url': {'FULL_HD1': flv},
+                },
+            },
+            'status_code': 0,
+        })
+
+    def _user_list(self, endpoint, query):
+        following = sorted(self.users)
+        cursor = int(query.get('maxCursor') or 0)
+        page = following[cursor:cursor + FOLLOWING_PAGE_SIZE]
+        has_more = cursor + FOLLOWING_PAGE_SIZE < len(following)
+        return Answer.json(endpoint, {
+            'userList': [{'user': {'uniqueId': user, 'roomId': self.users[user]}} for user in page],
+            'hasMore': has_more,
+            'minCursor': cursor + len(page),
+        }, headers={'Set-Cookie': f'msToken=mock{cursor}; Path=/'})
+
+    def _foryou(self, endpoint, query):
+        body = f'<script>{{"secUid":"{SEC_UID}","uniqueId":"me"}}</script>'
+        return Answer(endpoint, 200, body.encode(), 'text/html')
+
+    def _live(self, endpoint, query):
+        return Answer(endpoint, 200, b'<html>live</html>', 'text/html')
+
+    def _delay(self):
+        if self.latency:
+            with self._lock:
+                factor = self.random.uniform(0.5, 1.5)
+            time.sleep(self.latency * factor)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'MockTikTok/1.0'
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    @property
+    def mock(self) -> MockTikTok:
+        return self.server.mock
+
+    def do_GET(self):
+        self.mock._delay()
+        if urlparse(self.path).path.startswith('/stream/'):
+            return self._stream(urlparse(self.path).path)
+
+        answer = self.mock.respond(self.path)
+        self.send_response(answer.status)
+        self.send_header('Content-Type', answer.content_type)
+        self.send_header('Content-Length', str(len(answer.body)))
+        for name, value in answer.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(answer.body)
+
+    def _stream(self, path):
+        room_id = path.rsplit('/', 1)[-1].split('.')[0]
+        owner = self.mock.owners.get(room_id)
+        if owner is None or not self.mock.is_live(owner):
+            self.mock._count('stream', 404)
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.mock._count('stream', 200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/x-flv')
+        self.end_headers()  # no length: the stream ends when the connection closes
+
+        # ~10 video tags per second, like a 10 fps keyframe-only stream
+        payload_size = max(1, self.mock.bitrate // 8 // 10)
+        timestamp = 0
+        try:
+            with self.mock._lock:
+                self.mock.first_byte_at.setdefault(room_id, time.time())
+            self.wfile.write(FLV_HEADER)
+            while self.mock.is_live(owner):
+                payload = b'\x17\x01\x00\x00\x00' + bytes(payload_size)
+                self.wfile.write(flv_tag(9, timestamp, payload))
+                self.wfile.flush()
+                timestamp += 100
+                time.sleep(0.1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the mock TikTok server')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--live-ratio', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean seconds per answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 500 answers')
+    parser.add_argument('--waf-rate', type=float, default=0.0, help='share of WAF answers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    mock = MockTikTok(args.users, args.live_ratio, args.latency, args.error_rate,
+                      args.waf_rate, host=args.host, port=args.port)
+    print(f'Mock TikTok on {mock.url} ({len(mock.live)}/{len(mock.users)} users live)')
+    for name, value in mock.env().items():
+        print(f'export {name}={value}')
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
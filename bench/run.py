@@ -0,0 +1,239 @@
+"""
+Detection benchmark against the mock TikTok server.
+
+    python -m bench.run --users 200 --live-ratio 0.1 --latency 0.05
+
+Runs one detection cycle over the whole population with the bot's
+check_user_live, the recorder's automatic mode (one user per process)
+and its followers mode, then measures the time from detection to the
+first stream byte for the bot's recorder subprocess and for the
+recorder in process. Everything goes through the real clients; only
+the server is fake.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from bench.mock_tiktok import MockTikTok
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDER_PATH = os.path.join(ROOT, 'record_wrapper.py')
+TTFB_TIMEOUT = 30
+
+
+@dataclass
+class Result:
+    scenario: str
+    users: int
+    seconds: float = 0.0  # detection cycle, or mean time to first byte
+    requests: dict = field(default_factory=dict)
+    detected: int = 0
+    expected: int = 0
+    samples: list = field(default_factory=list)
+    note: str = ''
+
+    @property
+    def requests_per_user(self) -> float:
+        return sum(self.requests.values()) / self.users if self.users else 0.0
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def bench_bot(mock: MockTikTok) -> Result:
+    """One monitoring_loop cycle of the bot, without its pacing sleeps"""
+    import bot_final_working as bot
+
+    users = sorted(mock.users)
+    mock.reset_stats()
+    start = time.perf_counter()
+    detected = sum(bot.check_user_live(user) for user in users)
+    elapsed = time.perf_counter() - start
+
+    return Result(
+        'bot check_user_live', len(users), elapsed, dict(mock.requests), detected, len(mock.live),
+        note=f'+{bot.CHECK_PACING * len(users)}s of pacing in monitoring_loop',
+    )
+
+
+def bench_automatic(mock: MockTikTok) -> Result:
+    """The checks of an automatic-mode recorder, one per user"""
+    from core.tiktok_api import TikTokAPI
+
+    api = TikTokAPI(proxy=None, cookies={})
+    users = sorted(mock.users)
+    mock.reset_stats()
+    detected = 0
+    start = time.perf_counter()
+    for user in users:
+        try:
+            room_id = api.get_room_id_from_user(user)
+            detected += bool(room_id and api.is_room_alive(room_id))
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - start
+
+    return Result('recorder automatic', len(users), elapsed, dict(mock.requests), detected,
+                  len(mock.live))
+
+
+def bench_followers(mock: MockTikTok, output: str) -> list:
+    """A first and a steady-state pass of followers mode"""
+    from core.tiktok_recorder import FOLLOWERS_LOOKUP_WORKERS, TikTokRecorder
+    from utils.enums import Mode
+
+    recorder = TikTokRecorder(
+        url=None, user=None, room_id=None, mode=Mode.FOLLOWERS, automatic_interval=1,
+        cookies={}, proxy=None, output=output, duration=None, use_telegram=False,
+    )
+
+    results = []
+    with ThreadPoolExecutor(max_workers=FOLLOWERS_LOOKUP_WORKERS) as pool:
+        for scenario in ('recorder followers (first pass)', 'recorder followers (next pass)'):
+            mock.reset_stats()
+            start = time.perf_counter()
+            try:
+                followers = recorder.tiktok.get_followers_list(recorder.sec_uid)
+                room_ids = recorder._resolve_room_ids(pool, followers)
+                alive = recorder.tiktok.are_rooms_alive(list(room_ids.values()))
+            except Exception as e:
+                # followers_mode backs off and retries the whole pass
+                results.append(Result(scenario, len(mock.users), time.perf_counter() - start,
+                                      dict(mock.requests), 0, len(mock.live),
+                                      note=f'pass failed: {e!r}'))
+                continue
+            elapsed = time.perf_counter() - start
+            results.append(Result(scenario, len(followers), elapsed, dict(mock.requests),
+                                  sum(alive.values()), len(mock.live)))
+    return results
+
+
+def ttfb_recorder(mock: MockTikTok, samples: int) -> Result:
+    """Detection to first byte inside a running recorder"""
+    from core.tiktok_api import TikTokAPI
+
+    api = TikTokAPI(proxy=None, cookies={})
+    users = sorted(mock.live)[:samples]
+    mock.reset_stats()
+    times = []
+    for user in users:
+        start = time.perf_counter()
+        try:
+            live_url = api.get_live_url(mock.users[user])
+            stream = api.download_live_stream(live_url)
+            next(stream)
+            times.append(time.perf_counter() - start)
+            stream.close()
+        except Exception:
+            pass
+
+    return Result('ttfb recorder (in process)', len(users), sum(times) / len(times) if times else 0,
+                  dict(mock.requests), len(times), len(users), times)
+
+
+def ttfb_bot(mock: MockTikTok, samples: int, output: str) -> Result:
+    """Detection to first byte through the recorder subprocess the bot starts"""
+    users = sorted(mock.live)[:samples]
+    mock.reset_stats()
+    env = {**os.environ, **mock.env()}
+    env.pop('TIKREC_GOVERNOR_DB', None)
+
+    times = []
+    for user in users:
+        room_id = mock.users[user]
+        detected_at = time.time()
+        process = subprocess.Popen(
+            [sys.executable, RECORDER_PATH, user, output, '10', 'flv',
+             '--room-id', room_id, '--detected-at', str(detected_at)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, cwd=ROOT,
+        )
+        try:
+            deadline = time.time() + TTFB_TIMEOUT
+            while room_id not in mock.first_byte_at and time.time() < deadline:
+                if process.poll() is not None:
+                    break
+                time.sleep(0.005)
+            if room_id in mock.first_byte_at:
+                times.append(mock.first_byte_at[room_id] - detected_at)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return Result('ttfb bot (subprocess)', len(users), sum(times) / len(times) if times else 0,
+                  dict(mock.requests), len(times), len(users), times)
+
+
+def report(results: list):
+    print(f"{'scenario':<34} {'users':>6} {'seconds':>8} {'ms/user':>8} {'req/user':>8} "
+          f"{'detected':>9} {'p50':>7} {'p95':>7}")
+    for r in results:
+        per_user = r.seconds / r.users * 1000 if r.users and not r.samples else float('nan')
+        print(f"{r.scenario:<34} {r.users:>6} {r.seconds:>8.2f} {per_user:>8.1f} "
+              f"{r.requests_per_user:>8.2f} {f'{r.detected}/{r.expected}':>9} "
+              f"{percentile(r.samples, 0.5):>7.3f} {percentile(r.samples, 0.95):>7.3f}")
+    for r in results:
+        requests = ', '.join(f'{k}={v}' for k, v in sorted(r.requests.items()))
+        print(f"  {r.scenario}: {requests}{f' ({r.note})' if r.note else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark live detection against a mock TikTok')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--live-ratio', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean seconds per answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 500 answers')
+    parser.add_argument('--waf-rate', type=float, default=0.0, help='share of WAF answers')
+    parser.add_argument('--ttfb-samples', type=int, default=3)
+    parser.add_argument('--scenarios', default='bot,automatic,followers,ttfb',
+                        help='comma-separated subset of bot,automatic,followers,ttfb')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    mock = MockTikTok(args.users, args.live_ratio, args.latency, args.error_rate, args.waf_rate)
+    mock.start()
+    os.environ.update(mock.env())
+    os.environ.pop('TIKREC_GOVERNOR_DB', None)
+
+    # Import the clients only now, and quietly
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, 'tiktok-live-recorder', 'src'))
+    from utils.logger_manager import logger
+    logger.setLevel(logging.CRITICAL)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    scenarios = set(args.scenarios.split(','))
+    results = []
+    with tempfile.TemporaryDirectory() as output:
+        if 'bot' in scenarios:
+            results.append(bench_bot(mock))
+            logging.getLogger().setLevel(logging.WARNING)  # the bot sets up logging on import
+        if 'automatic' in scenarios:
+            results.append(bench_automatic(mock))
+        if 'followers' in scenarios:
+            results.extend(bench_followers(mock, output))
+        if 'ttfb' in scenarios:
+            results.append(ttfb_bot(mock, args.ttfb_samples, output))
+            results.append(ttfb_recorder(mock, args.ttfb_samples))
+
+    mock.stop()
+    report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
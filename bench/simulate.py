@@ -0,0 +1,367 @@
+"""
+Scale simulator for the bot's monitoring loop.
+
+    python -m bench.simulate --users 100,1000,10000 --hours 12 --go-live-prob 0.05
+
+Runs the real monitoring_loop of bot_final_working.py over a synthetic
+population on a simulated clock, so hours of monitoring take seconds:
+
+- every user goes live with --go-live-prob per hour and stays live for
+  an exponentially distributed time around --live-minutes;
+- TikTok requests are answered in process by bench/mock_tiktok.py and
+  cost --latency simulated seconds each;
+- start_recording is replaced by a model of the recorder subprocess the
+  bot launches: it keeps running after the live ends and checks the
+  user by itself every RECORDER_INTERVAL minutes (3 requests), so later
+  lives of the user are detected by it rather than by the bot.
+
+Each user count runs in its own process and reports detection latency,
+request volume, memory and thread/process counts.
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+
+from bench.mock_tiktok import MockTikTok
+from bench.run import ROOT, percentile
+
+RECORDER_SRC = os.path.join(ROOT, 'tiktok-live-recorder', 'src')
+START_EPOCH = 1_700_000_000.0
+
+# Threads of a running bot that the simulation does not start: telegram
+# polling, notifier, retention, the supervisor (one thread for all
+# recorders) and its 4 workers, 4 side_tasks workers. The monitoring loop
+# and anything it starts are measured.
+BOT_UNSIMULATED_THREADS = 11
+
+
+class SimClock:
+    """Stands in for the time module of the bot; sleeping runs due events"""
+
+    def __init__(self, until: float, stop_event: threading.Event):
+        self.now = START_EPOCH
+        self.until = until
+        self.stop_event = stop_event
+        self._events = []
+        self._seq = 0
+
+    def time(self) -> float:
+        return self.now
+
+    perf_counter = monotonic = time
+
+    def schedule(self, at: float, action, *args):
+        self._seq += 1
+        heapq.heappush(self._events, (at, self._seq, action, args))
+
+    def sleep(self, seconds: float):
+        target = self.now + max(0.0, seconds)
+        while self._events and self._events[0][0] <= target:
+            at, _, action, args = heapq.heappop(self._events)
+            self.now = max(self.now, at)
+            action(*args)
+        self.now = target
+        if self.now >= self.until:
+            self.stop_event.set()
+
+
+@dataclass
+class Session:
+    user: str
+    start: float
+    end: float
+    detected_at: float = None
+    detected_by: str = None
+
+
+class SimResponse:
+    def __init__(self, answer):
+        self.status_code = answer.status
+        self.content = answer.body
+        self.text = answer.body.decode()
+        self.headers = {'Content-Type': answer.content_type, **answer.headers}
+        self.cookies = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class SimSession:
+    """requests.Session look-alike answering from the mock, on the simulated clock"""
+
+    def __init__(self, mock: MockTikTok, clock: SimClock, latency: float, rng: random.Random):
+        self.mock = mock
+        self.clock = clock
+        self.latency = latency
+        self.rng = rng
+        self.headers = {}
+
+    def request(self, method, url, **kwargs):
+        self.clock.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        path = url.split('://', 1)[-1]
+        return SimResponse(self.mock.respond(path[path.find('/'):]))
+
+
+@dataclass
+class Report:
+    users: int
+    hours: float
+    cycles: int = 0
+    cycle_seconds: float = 0.0
+    sessions: int = 0
+    detected_by_bot: int = 0
+    detected_by_recorder: int = 0
+    missed: int = 0
+    latency_p50: float = 0.0
+    latency_p95: float = 0.0
+    latency_p99: float = 0.0
+    latency_max: float = 0.0
+    bot_requests: int = 0
+    recorder_requests: int = 0
+    requests_per_minute: float = 0.0
+    peak_processes: int = 0
+    peak_threads: int = 0
+    rss_mb: float = 0.0
+    loop_memory_mb: float = 0.0
+    wall_seconds: float = 0.0
+    requests: dict = field(default_factory=dict)
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return rss_mb()
+
+
+def recorder_rss_mb() -> float:
+    """Resident memory of an idle recorder process (imports loaded)"""
+    code = (
+        'import resource, sys; sys.path.insert(0, sys.argv[1]); '
+        'import core.tiktok_recorder; '
+        'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+    )
+    try:
+        out = subprocess.run([sys.executable, '-c', code, RECORDER_SRC], capture_output=True,
+                             text=True, timeout=60)
+        return int(out.stdout.strip()) / 1024
+    except (subprocess.SubprocessError, ValueError):
+        return float('nan')
+
+
+def simulate(users: int, hours: float, go_live_prob: float, live_minutes: float,
+             latency: float, check_interval: int, error_rate: float, waf_rate: float,
+             seed: int) -> Report:
+    import time as wall
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, RECORDER_SRC)
+    import bot_final_working as bot
+    from utils.logger_manager import logger
+    logger.setLevel(logging.CRITICAL)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(seed)
+    stop_event = threading.Event()
+    clock = SimClock(START_EPOCH + hours * 3600, stop_event)
+    mock = MockTikTok(users, live_ratio=0, latency=0, error_rate=error_rate, waf_rate=waf_rate,
+                      seed=seed)
+
+    # Go-live schedule: a Poisson process per user, lives don't overlap
+    sessions = []
+    current = {}  # user -> live Session
+    rate = -math.log1p(-go_live_prob) / 3600 if go_live_prob < 1 else 1 / 60
+    for user in mock.users:
+        t = START_EPOCH + rng.expovariate(rate)
+        while t < clock.until:
+            end = t + rng.expovariate(1 / (live_minutes * 60))
+            sessions.append(Session(user, t, end))
+            t = end + rng.expovariate(rate)
+
+    # Recorder subprocesses: never exit, poll their user once the live ended
+    recorders = set()
+    next_poll = {}  # user -> time of the recorder's pending poll
+    recorder_requests = Counter()
+    peak = {'processes': 0, 'threads': threading.active_count()}
+
+    def go_live(session):
+        current[session.user] = session
+        mock.set_live(session.user, True)
+
+    def go_offline(session):
+        current.pop(session.user, None)
+        mock.set_live(session.user, False)
+        if session.user in recorders:
+            recorder_request(session.user, 'check_alive')  # reconnect check
+            schedule_poll(session.user)
+
+    for session in sessions:
+        clock.schedule(session.start, go_live, session)
+        clock.schedule(session.end, go_offline, session)
+
+    def recorder_request(user, endpoint):
+        room_id = mock.users[user]
+        path = {
+            'sign': f'/tiktok/room/api/sign?unique_id={user}',
+            'user_room': f'/api-live/user/room/?uniqueId={user}',
+            'check_alive': f'/webcast/room/check_alive/?room_ids={room_id}',
+        }[endpoint]
+        recorder_requests[mock.respond(path).endpoint] += 1
+
+    def schedule_poll(user):
+        if user not in next_poll:
+            next_poll[user] = clock.now + bot.RECORDER_INTERVAL * 60
+            clock.schedule(next_poll[user], recorder_poll, user)
+
+    def recorder_poll(user):
+        del next_poll[user]
+        for endpoint in ('sign', 'user_room', 'check_alive'):
+            recorder_request(user, endpoint)
+        session = current.get(user)
+        if session and session.detected_at is None:
+            session.detected_at, session.detected_by = clock.now, 'recorder'
+        elif not session:
+            schedule_poll(user)
+
+    def start_recording(username, detected_at=None):
+        with bot.recordings_lock:
+            if username in bot.active_recordings:
+                return False
+            bot.active_recordings[username] = object()
+        recorders.add(username)
+        peak['processes'] = max(peak['processes'], len(recorders))
+        peak['threads'] = max(peak['threads'], threading.active_count())
+
+        session = current.get(username)
+        if session and session.detected_at is None:
+            session.detected_at, session.detected_by = clock.now, 'bot'
+        elif session is None:
+            # Live already over: the recorder finds nothing and starts polling
+            schedule_poll(username)
+        return True
+
+    bot.time = clock
+    bot.config = {'recording': {'check_interval': check_interval}}
+    bot.monitoring_users = bot.UserRegistry(':memory:')
+    bot.monitoring_users.add_many(sorted(mock.users))
+    bot.http_session = bot.InstrumentedSession(SimSession(mock, clock, latency, rng))
+    bot.start_recording = start_recording
+
+    cycles = []
+    observe = bot.DETECTION_CYCLE.observe
+    bot.DETECTION_CYCLE.observe = lambda seconds, **labels: (cycles.append(seconds), observe(seconds, **labels))
+
+    rss_before = current_rss_mb()
+    wall_start = wall.perf_counter()
+    bot.monitoring_loop(stop_event)
+    wall_seconds = wall.perf_counter() - wall_start
+    peak['threads'] = max(peak['threads'], threading.active_count())
+
+    bot_requests = Counter(mock.requests)
+    bot_requests.subtract(recorder_requests)
+
+    ended = [s for s in sessions if s.start < clock.until]
+    latencies = [s.detected_at - s.start for s in ended if s.detected_at is not None]
+    total_requests = sum(mock.requests.values())
+    sim_minutes = (clock.now - START_EPOCH) / 60
+
+    return Report(
+        users=users,
+        hours=hours,
+        cycles=len(cycles),
+        cycle_seconds=sum(cycles) / len(cycles) if cycles else clock.now - START_EPOCH,
+        sessions=len(ended),
+        detected_by_bot=sum(s.detected_by == 'bot' for s in ended),
+        detected_by_recorder=sum(s.detected_by == 'recorder' for s in ended),
+        missed=sum(s.detected_at is None and s.end <= clock.now for s in ended),
+        latency_p50=percentile(latencies, 0.5),
+        latency_p95=percentile(latencies, 0.95),
+        latency_p99=percentile(latencies, 0.99),
+        latency_max=max(latencies, default=float('nan')),
+        bot_requests=sum(bot_requests.values()),
+        recorder_requests=sum(recorder_requests.values()),
+        requests_per_minute=total_requests / sim_minutes if sim_minutes else 0.0,
+        peak_processes=peak['processes'],
+        peak_threads=peak['threads'] + BOT_UNSIMULATED_THREADS,
+        rss_mb=rss_mb(),
+        loop_memory_mb=max(0.0, current_rss_mb() - rss_before),
+        wall_seconds=wall_seconds,
+        requests=dict(mock.requests),
+    )
+
+
+def report(results: list, recorder_mb: float):
+    print(f"{'users':>7} {'cycles':>6} {'cycle s':>8} {'lives':>6} {'bot':>5} {'rec':>5} "
+          f"{'missed':>6} {'p50 s':>7} {'p95 s':>7} {'max s':>8} {'req/min':>8} "
+          f"{'procs':>6} {'threads':>7} {'rss MB':>7} {'rec MB':>8} {'wall s':>6}")
+    for r in results:
+        print(f"{r['users']:>7} {r['cycles']:>6} {r['cycle_seconds']:>8.0f} {r['sessions']:>6} "
+              f"{r['detected_by_bot']:>5} {r['detected_by_recorder']:>5} {r['missed']:>6} "
+              f"{r['latency_p50']:>7.0f} {r['latency_p95']:>7.0f} {r['latency_max']:>8.0f} "
+              f"{r['requests_per_minute']:>8.1f} {r['peak_processes']:>6} {r['peak_threads']:>7} "
+              f"{r['rss_mb']:>7.1f} {r['peak_processes'] * recorder_mb:>8.0f} {r['wall_seconds']:>6.1f}")
+    print(f"\nrec MB: peak recorder processes x {recorder_mb:.0f} MB (RSS of an idle recorder)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the monitoring loop at scale')
+    parser.add_argument('--users', default='100,1000,10000', help='comma-separated user counts')
+    parser.add_argument('--hours', type=float, default=12, help='simulated duration')
+    parser.add_argument('--go-live-prob', type=float, default=0.05,
+                        help='probability a user goes live within an hour')
+    parser.add_argument('--live-minutes', type=float, default=60, help='mean live duration')
+    parser.add_argument('--latency', type=float, default=0.1, help='simulated seconds per request')
+    parser.add_argument('--check-interval', type=int, default=60,
+                        help="the bot's recording.check_interval")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--waf-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = simulate(int(args.users), args.hours, args.go_live_prob, args.live_minutes,
+                          args.latency, args.check_interval, args.error_rate, args.waf_rate,
+                          args.seed)
+        print(json.dumps(asdict(result)))
+        return
+
+    # One process per user count, so memory and threads don't carry over
+    results = []
+    for users in (int(u) for u in args.users.split(',')):
+        argv = [a for a in sys.argv[1:] if not a.startswith('--users') and a != args.users]
+        out = subprocess.run(
+            [sys.executable, '-m', 'bench.simulate', *argv, '--users', str(users), '--single'],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if out.returncode != 0:
+            print(f'{users} users: simulation failed\n{out.stderr}', file=sys.stderr)
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report(results, recorder_rss_mb())
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
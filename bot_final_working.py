@@ -4,18 +4,50 @@ TikTok Live Monitor - FINAL WORKING VERSION
 Uses the exact live detection method from tiktok-live-recorder
 """
 
+import asyncio
 import logging
 import json
+import contextvars
+import csv
+import io
+import re
+import html
 import time
 import requests
 import subprocess
 import sys
 import os
+import tempfile
 from datetime import datetime
 from pathlib import Path
-from threading import Thread, Lock
+from threading import Event, Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+
+# Shared modules from the recorder (catalog, enums, ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiktok-live-recorder', 'src'))
+
+from core.tiktok_api import service_url
+from http_utils.http_client import InstrumentedSession
+from http_utils import governor
+from http_utils.proxy_pool import ProxyPool
+from utils.catalog import RecordingCatalog
+from utils.custom_exceptions import IPBlockedByWAF
+from utils.enums import RecordingStatus, UploadState
+from utils.events import RecorderChannel
+from utils.flv_index import cut_clip
+from utils.metrics import REGISTRY, MetricsServer
+from utils.retry import Backoff, RetryableStatus, retry_call
+from utils.video_management import VideoManagement
+from utils import tracing
+
+from monitor.retention import RetentionManager
+from monitor.notifier import Notifier
+from monitor.journal import AdoptedRecorder, Journal, is_recorder_alive
+from monitor.registry import UserRegistry
+from monitor.sharding import ShardCoordinator
+from monitor.supervisor import Supervisor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,16 +57,59 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 CONFIG_FILE = "config.json"
-MONITORING_FILE = "monitoring_list.json"
+MONITORING_FILE = "monitoring_list.json"  # user list before the registry, imported once
+USERS_DB = "./recordings/users.db"
 RECORDER_PATH = "./record_wrapper.py"
 OUTPUT_DIR = "./recordings"
+CATALOG_FILE = "./recordings/catalog.db"
+FILES_PAGE_SIZE = 10
+CHECK_PACING = 2  # seconds between two users' live checks
+RECORDER_INTERVAL = 10  # minutes between a recorder's own checks once the live ended
+METRICS_DIR = os.path.join(tempfile.gettempdir(), "tiktok-monitor-metrics")
+TIKTOK_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9_.]{2,24}$')  # what TikTok allows in a unique id
+PROFILE_LINK = re.compile(r'tiktok\.com/@([^/?#\s]+)')
+IMPORT_LIMIT = 1000  # usernames per /addmany or document
+IMPORT_WORKERS = 8  # concurrent lookups, the governor paces them
+IMPORT_MAX_BYTES = 1024 * 1024
+CLIP_DEFAULT_MINUTES = 5
+CLIP_MAX_MINUTES = 60
 
 # Global variables
 config = {}
-monitoring_users = []
+monitoring_users = None  # UserRegistry
 monitoring_enabled = True
 active_recordings = {}
 recordings_lock = Lock()
+catalog = None
+retention = None
+notifier = None
+shard = None  # ShardCoordinator when several nodes share the user list
+journal = None  # Journal of the state to resume after a restart
+supervisor = None  # Supervisor watching every recorder subprocess
+live_users = set()  # users monitoring_loop saw go live and started recording
+http_session = InstrumentedSession(requests.Session())  # TikTok requests, may use the proxy pool
+telegram_session = InstrumentedSession(requests.Session())
+
+# Go-live work that must not delay the recorder (notifications, metadata)
+side_tasks = ThreadPoolExecutor(max_workers=4, thread_name_prefix="golive")
+
+# Metrics
+DETECTION_CYCLE = REGISTRY.histogram(
+    "detection_cycle_duration_seconds",
+    "Time to check every monitored user once.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+UPLOADS_PENDING = REGISTRY.gauge("uploads_pending", "Uploads waiting or in progress.")
+UPLOAD_BYTES = REGISTRY.counter("upload_bytes_total", "Bytes uploaded successfully.", ["uploader"])
+UPLOAD_DURATION = REGISTRY.histogram(
+    "upload_duration_seconds",
+    "Time spent uploading a recording.",
+    ["uploader"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
 
 
 def load_config():
@@ -58,58 +133,41 @@ def load_config():
         }
 
 
-def load_monitoring_list():
-    """Load monitoring list from file"""
-    global monitoring_users
-    try:
-        if Path(MONITORING_FILE).exists():
-            with open(MONITORING_FILE, 'r') as f:
-                data = json.load(f)
-                monitoring_users = data.get('users', [])
-            logger.info(f"✅ Loaded {len(monitoring_users)} users")
-        else:
-            monitoring_users = []
-            save_monitoring_list()
-    except Exception as e:
-        logger.error(f"❌ Load list error: {e}")
-        monitoring_users = []
+def open_user_registry(db_path: str, shared: bool = False) -> UserRegistry:
+    """Open the monitored users (imports monitoring_list.json the first time)"""
+    registry = UserRegistry(db_path, legacy_file=MONITORING_FILE, shared=shared)
+    logger.info(f"✅ Loaded {len(registry)} users")
+    return registry
 
 
-def save_monitoring_list():
-    """Save monitoring list to file"""
-    try:
-        data = {
-            'users': monitoring_users,
-            'last_updated': datetime.now().isoformat()
-        }
-        with open(MONITORING_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        logger.error(f"❌ Save error: {e}")
+def get_output_roots() -> list:
+    """Output directories recordings are spread over"""
+    return config['recording'].get('output_roots') or [OUTPUT_DIR]
 
 
-def send_telegram_message(message: str):
-    """Send message to Telegram channel"""
-    try:
-        bot_token = config['telegram']['bot_token']
-        chat_id = config['telegram']['chat_id']
+def get_proxy_spec() -> str:
+    """Comma-separated proxies from the 'proxy' config section ('' if disabled)"""
+    proxy_config = config.get('proxy', {})
+    if not proxy_config.get('enabled', False):
+        return ""
+    proxies = [proxy_config.get('http_proxy', ''), *proxy_config.get('proxies', [])]
+    return ",".join(p for p in proxies if p)
 
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        data = {
-            'chat_id': chat_id,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
 
-        response = requests.post(url, data=data, timeout=10)
-        return response.status_code == 200
-    except Exception as e:
-        logger.error(f"❌ Message error: {e}")
-        return False
+def send_telegram_message(message: str, group: str = None, summary: str = None):
+    """
+    Queue a message for the Telegram channel
+
+    Delivery is rate limited and retried by the notifier thread; messages
+    sharing a group are merged into a digest when they arrive in a burst.
+    """
+    notifier.notify(message, group=group, summary=summary)
+    return True
 
 
 def send_telegram_video(video_path: str, caption: str):
     """Upload video to Telegram channel"""
+    UPLOADS_PENDING.inc()
     try:
         # Check if file exists
         if not Path(video_path).exists():
@@ -131,108 +189,178 @@ def send_telegram_video(video_path: str, caption: str):
 
         url = f"https://api.telegram.org/bot{bot_token}/sendVideo"
 
-        with open(video_path, 'rb') as video:
-            files = {'video': video}
-            data = {
-                'chat_id': chat_id,
-                'caption': caption,
-                'parse_mode': 'HTML'
-            }
-
-            logger.info(f"📤 Uploading: {Path(video_path).name}")
-            response = requests.post(url, data=data, files=files, timeout=600)
+        data = {
+            'chat_id': chat_id,
+            'caption': caption,
+            'parse_mode': 'HTML'
+        }
 
-            if response.status_code == 200:
-                logger.info("✅ Video uploaded!")
-                return True
-            else:
-                logger.error(f"❌ Upload failed: HTTP {response.status_code}")
-                logger.error(f"❌ Response: {response.text}")
-                return False
+        def post_video():
+            with open(video_path, 'rb') as video:
+                response = requests.post(url, data=data, files={'video': video}, timeout=600)
+            if response.status_code == 429 or response.status_code >= 500:
+                try:
+                    retry_after = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    retry_after = None
+                raise RetryableStatus(response.status_code, retry_after)
+            return response
+
+        logger.info(f"📤 Uploading: {Path(video_path).name}")
+        start = time.perf_counter()
+        response = retry_call(post_video, loop="bot_upload")
+
+        if response.status_code == 200:
+            UPLOAD_DURATION.observe(time.perf_counter() - start, uploader="bot")
+            UPLOAD_BYTES.inc(file_size, uploader="bot")
+            logger.info("✅ Video uploaded!")
+            return True
+        else:
+            logger.error(f"❌ Upload failed: HTTP {response.status_code}")
+            logger.error(f"❌ Response: {response.text}")
+            return False
     except Exception as e:
         logger.error(f"❌ Upload error: {e}")
         import traceback
         logger.error(traceback.format_exc())
         return False
+    finally:
+        UPLOADS_PENDING.dec()
 
 
-def check_user_live(username: str) -> bool:
+def lookup_user_room(username: str) -> dict:
     """
-    Check if user is live using the exact method from tiktok-live-recorder
+    Signed room lookup of a user (steps 1 and 2 of a live check), None
+    if TikTok refused it. Raises RetryableStatus on 429/5xx, and when the
+    answer is not JSON (WAF)
     """
-    try:
-        # Step 1: Get signed URL from tikrec.com
-        sign_url = f"https://tikrec.com/tiktok/room/api/sign?unique_id={username}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+    # Step 1: Get signed URL from tikrec.com
+    sign_url = f"{service_url('TIKREC_SIGN_URL')}/tiktok/room/api/sign?unique_id={username}"
+    response = http_session.get(sign_url, headers=TIKTOK_HEADERS, timeout=10)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableStatus(response.status_code)
+    if response.status_code != 200:
+        return None
 
-        response = requests.get(sign_url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            return False
+    signed_path = response.json().get("signed_path")
+    if not signed_path:
+        return None
 
-        signed_data = response.json()
-        signed_path = signed_data.get("signed_path")
-        if not signed_path:
-            return False
+    # Step 2: Get room info
+    room_url = f"{service_url('TIKREC_TIKTOK_URL')}{signed_path}"
+    response = http_session.get(room_url, headers=TIKTOK_HEADERS, timeout=10)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableStatus(response.status_code)
+    if response.status_code != 200:
+        return None
+    return response.json()
 
-        # Step 2: Get room info
-        room_url = f"https://www.tiktok.com{signed_path}"
-        response = requests.get(room_url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            return False
 
-        room_data = response.json()
-        room_id = room_data.get("data", {}).get("user", {}).get("roomId")
-        if not room_id:
-            return False
+def is_room_alive(room_id: str) -> bool:
+    """Step 3 of a live check: whether the room is broadcasting"""
+    check_url = (
+        f"{service_url('TIKREC_WEBCAST_URL')}/webcast/room/check_alive/"
+        f"?aid=1988&region=CH&room_ids={room_id}&user_is_login=true"
+    )
 
-        # Step 3: Check if room is alive
-        check_url = (
-            f"https://webcast.tiktok.com/webcast/room/check_alive/"
-            f"?aid=1988&region=CH&room_ids={room_id}&user_is_login=true"
-        )
+    response = http_session.get(check_url, headers=TIKTOK_HEADERS, timeout=10)
+    if response.status_code != 200:
+        return False
 
-        response = requests.get(check_url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            return False
+    check_data = response.json()
+    if "data" in check_data and len(check_data["data"]) > 0:
+        return bool(check_data["data"][0].get("alive", False))
+    return False
 
-        check_data = response.json()
-        if "data" in check_data and len(check_data["data"]) > 0:
-            is_alive = check_data["data"][0].get("alive", False)
-            return is_alive
 
-        return False
+def check_user_live(username: str) -> bool:
+    """
+    Check if user is live using the exact method from tiktok-live-recorder.
+    The result and the room id of a live are noted in the registry; a user
+    live at the last check has that room asked about first, without the
+    sign and room lookup. Raises IPBlockedByWAF while TikTok blocks us:
+    the user's state is unknown
+    """
+    state = monitoring_users.get(username)
+    room_id = None
+    is_alive = False
+    try:
+        if state and state.room_id and state.last_live and state.last_live == state.last_check:
+            room_id = state.room_id
+            is_alive = is_room_alive(room_id)
+
+        if not is_alive:
+            room_data = lookup_user_room(username)
+            room_id = room_data and (room_data.get("data") or {}).get("user", {}).get("roomId")
+            is_alive = bool(room_id) and is_room_alive(room_id)
 
+    except IPBlockedByWAF:
+        raise
     except Exception as e:
         logger.debug(f"Check error for {username}: {e}")
-        return False
+        is_alive = False
 
+    monitoring_users.record_check(username, is_alive, str(room_id) if is_alive else None)
+    return is_alive
+
+
+def validate_user(username: str) -> str:
+    """
+    Whether username is a TikTok account: 'ok' (has a room), 'never_live',
+    'not_found', 'invalid' (not a possible username) or 'unverified'
+    (TikTok could not be asked)
+    """
+    if not USERNAME_PATTERN.match(username):
+        return 'invalid'
 
-def find_latest_video(username: str) -> str:
-    """Find latest video file"""
     try:
-        video_extensions = ['.mp4', '.mkv', '.flv', '.ts']
-        video_files = []
+        # An open WAF breaker is waited out rather than failing the import
+        room_data = retry_call(lookup_user_room, username, loop="import", attempts=3)
+    except Exception as e:
+        logger.debug(f"Validation error for {username}: {e}")
+        return 'unverified'
+    if room_data is None:
+        return 'unverified'
+
+    user = (room_data.get("data") or {}).get("user")
+    if not user:
+        return 'not_found'
+    return 'ok' if user.get("roomId") else 'never_live'
 
-        for ext in video_extensions:
-            # Try multiple patterns to catch different naming formats
-            patterns = [
-                f"{username}*{ext}",      # vasya.tv8*.mp4
-                f"*{username}*{ext}",     # TK_vasya.tv8*.mp4
-                f"TK_{username}*{ext}"    # TK_vasya.tv8*.mp4 (explicit)
-            ]
 
-            for pattern in patterns:
-                files = list(Path(OUTPUT_DIR).glob(pattern))
-                video_files.extend(files)
+def parse_usernames(text: str, csv_file: bool = False) -> list:
+    """
+    Usernames in a message or text document (separated by whitespace,
+    commas or semicolons, as @names or profile links), or in the first
+    column of a CSV document. Duplicates are dropped.
+    """
+    if csv_file:
+        tokens = [row[0] for row in csv.reader(io.StringIO(text)) if row]
+        if tokens and tokens[0].strip().lower() in ('username', 'user', 'unique_id'):
+            tokens = tokens[1:]  # header
+    else:
+        tokens = re.split(r'[\s,;]+', text)
+
+    usernames = []
+    for token in tokens:
+        link = PROFILE_LINK.search(token)
+        usernames.append((link.group(1) if link else token.strip()).lstrip('@'))
+    return list(dict.fromkeys(u for u in usernames if u))
+
+
+def find_latest_video(username: str) -> str:
+    """Latest video file of a user in the recording catalog, for recorders whose events were lost"""
+    try:
+        recording = catalog.latest_for_user(username)
+        if not recording:
+            return None
 
-        # Remove duplicates
-        video_files = list(set(video_files))
+        if recording.status == RecordingStatus.RECORDING:
+            # Recorder was terminated before it could close the entry
+            catalog.finish(recording.id, recording.path)
 
-        if video_files:
-            latest = max(video_files, key=lambda p: p.stat().st_mtime)
-            return str(latest)
+        if Path(recording.path).exists():
+            return recording.path
 
         return None
     except Exception as e:
@@ -240,134 +368,383 @@ def find_latest_video(username: str) -> str:
         return None
 
 
-def start_recording(username: str):
-    """Start recording a live stream"""
+def fetch_room_title(room_id: str) -> str:
+    """Get the live title of a room (best effort)"""
+    try:
+        response = http_session.get(
+            f"{service_url('TIKREC_WEBCAST_URL')}/webcast/room/info/?aid=1988&room_id={room_id}",
+            timeout=5
+        )
+        return response.json().get("data", {}).get("title") or ""
+    except Exception as e:
+        logger.debug(f"Room info error for {room_id}: {e}")
+        return ""
+
+
+def announce_recording(username: str, room_id: str, started_at: datetime):
+    """Notify the channel about a started recording (runs on side_tasks)"""
+    with tracing.span("room_metadata"):
+        title = fetch_room_title(room_id) if room_id else ""
+
+    message = f"🔴 <b>{username}</b> is LIVE!\n"
+    if title:
+        message += f"📝 {html.escape(title)}\n"
+    message += (
+        f"📹 Recording started\n"
+        f"Time: {started_at.strftime('%H:%M:%S')}\n"
+        f"Link: https://www.tiktok.com/@{username}/live"
+    )
+
+    summary = f'<a href="https://www.tiktok.com/@{username}/live">{username}</a>'
+    if title:
+        summary += f" - {html.escape(title)}"
+
+    with tracing.span("notify"):
+        send_telegram_message(message, group='live', summary=summary)
+
+
+def start_recording(username: str, detected_at: float = None) -> bool:
+    """
+    Start recording a live stream, returns True if the recorder was launched
+
+    The recorder is launched first; notification and room metadata run
+    on side_tasks afterwards so a slow Telegram API can't delay the
+    first byte of the stream.
+    """
+    detected_at = detected_at or time.time()
+
     if not Path(RECORDER_PATH).exists():
         logger.error(f"❌ Recorder not found")
-        return
+        return False
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with recordings_lock:
+        if username in active_recordings:
+            logger.info(f"ℹ️ Already recording: {username}")
+            return False
+
+    if not retention.has_headroom():
+        retention.enforce()
+        if not retention.has_headroom():
+            logger.error(f"❌ Not enough disk space to record {username}")
+            send_telegram_message(f"⚠️ Disk almost full - not recording <b>{username}</b>")
+            return False
+
+    # Another node may still be recording a user that moved to us
+    if shard and not shard.acquire(username):
+        logger.info(f"ℹ️ {username} is being recorded by another node")
+        return False
 
+    state = monitoring_users.get(username)
+    room_id = state.room_id if state else None
     cmd = [
         sys.executable,
         RECORDER_PATH,
         username,  # username (no -user flag)
-        OUTPUT_DIR,  # output directory
-        "10"  # check interval in minutes
+        ",".join(get_output_roots()),  # output directories
+        str(RECORDER_INTERVAL),  # check interval in minutes
+        config['recording'].get('stream_format', 'flv'),  # flv or hls
+        "--catalog", CATALOG_FILE,
+        "--min-free-bytes", str(retention.min_free_bytes),
+        "--metrics-dir", METRICS_DIR,
+        "--detected-at", str(detected_at)
     ]
+    if room_id:
+        cmd += ["--room-id", room_id]
+    if get_proxy_spec():
+        cmd += ["--proxy", get_proxy_spec()]
 
+    channel = RecorderChannel()
     try:
-        logger.info(f"🎬 Starting recording: {username}")
-
-        send_telegram_message(
-            f"🔴 <b>{username}</b> is LIVE!\n"
-            f"📹 Recording started\n"
-            f"Time: {datetime.now().strftime('%H:%M:%S')}\n"
-            f"Link: https://www.tiktok.com/@{username}/live"
-        )
-
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
-        )
+        with tracing.span("popen"):
+            try:
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    pass_fds=(channel.write_fd,),
+                    env={**os.environ, **tracing.context_env(), **channel.env()}
+                )
+            finally:
+                channel.close_write_end()
+        process.channel = channel
 
         with recordings_lock:
             active_recordings[username] = process
+        if journal:
+            journal.recorder_started(username, process.pid, room_id, shard.node_id if shard else None)
 
-        # Monitor in background
-        Thread(target=monitor_recording, args=(username, process), daemon=True).start()
+        supervisor.watch(username, process)
+
+        # Off the critical path: metadata, notification, logging
+        side_tasks.submit(
+            contextvars.copy_context().run,
+            announce_recording, username, room_id, datetime.now()
+        )
+        logger.info(f"🎬 Recording started: {username} ({time.time() - detected_at:.2f}s after detection)")
+        return True
 
     except Exception as e:
         logger.error(f"❌ Recording error: {e}")
+        if shard:
+            shard.release(username)
+        return False
 
 
-def monitor_recording(username: str, process: subprocess.Popen):
-    """Monitor recording and upload when done"""
-    try:
-        stdout, stderr = process.communicate()
+def format_stream_stats(stats: dict) -> str:
+    """One line of the stream statistics a recorder reports (see utils.flv_parser)"""
+    minutes, seconds = divmod(int(stats['duration']), 60)
+    text = f"⏱ {minutes // 60}:{minutes % 60:02d}:{seconds:02d} · {stats['video_kbps'] + stats['audio_kbps']} kbps · {stats['fps']} fps"
+    if stats.get('keyframe_interval'):
+        text += f" · GOP {stats['keyframe_interval']}s"
+    if stats.get('gaps'):
+        text += f" · {stats['gaps']} gaps ({stats['gap_seconds']}s)"
+    return text
+
+
+def on_recorder_event(username: str, process, event: dict):
+    """Handle an event of a recorder (runs on the supervisor thread, must not block)"""
+    kind = event.get('event')
+    if kind == 'started':
+        logger.info(f"💾 {username}: writing {event['path']}")
+    elif kind == 'reconnect':
+        logger.info(f"🔁 {username}: stream reconnected ({event.get('reconnects')})")
+    elif kind == 'finished':
+        logger.info(f"✅ {username}: recording finished ({event.get('status')})")
+        # The recorder keeps waiting for the next live, upload this one now
+        # (unless the upload was journaled before a restart and is resumed)
+        if (event.get('status') == RecordingStatus.FINISHED.value and not getattr(process, 'stopped_by_user', False)
+                and not (journal and event['path'] in journal.state.uploads)):
+            caption = (
+                f"📹 <b>{username}</b> - Live Recording\n"
+                f"Ended: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+            if event.get('stats'):
+                caption += f"\n{format_stream_stats(event['stats'])}"
+            supervisor.submit(upload_recording, username, event['path'], caption)
+
+
+def current_recording(process) -> dict:
+    """The recording a recorder is in the middle of, from its events or, once adopted, the catalog"""
+    channel = getattr(process, 'channel', None)
+    return channel.recording if channel else getattr(process, 'recording', None)
+
+
+def interrupted_recording(username: str, process) -> str:
+    """
+    File of the recording the recorder was stopped in the middle of, with
+    its catalog entry closed
+    """
+    recording = current_recording(process)
+    if not recording:
+        return None
+    if recording.get('recording_id'):
+        catalog.finish(recording['recording_id'], recording['path'], stats=recording.get('stats'))
+    return recording['path'] if Path(recording['path']).exists() else None
+
+
+def recorder_exited(username: str, process):
+    """Clean up after a recorder exited and upload what it left (runs on the supervisor pool)"""
+    if journal:
+        journal.recorder_exited(username, process.pid)
+
+    channel = getattr(process, 'channel', None)
+    if channel and channel.output:
+        logger.info(f"📝 Last recorder output for {username}:\n" + "\n".join(channel.output))
+
+    with recordings_lock:
+        if active_recordings.get(username) is process:
+            del active_recordings[username]
+    if shard:
+        shard.release(username)
+
+    logger.info(f"✅ Recorder exited: {username} (code {process.returncode})")
+
+    if getattr(process, 'stopped_by_user', False):
+        return
+
+    # Whatever was recorded when the recorder died
+    video_file = interrupted_recording(username, process)
+    if video_file:
+        caption = (
+            f"📹 <b>{username}</b> - Live Recording (interrupted)\n"
+            f"Ended: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        upload_recording(username, video_file, caption)
+
+
+def restart_recording(username: str, process):
+    """Replace a recorder that exited on its own, if the restart policy allows it"""
+    if getattr(process, 'stopped_by_user', False) or not monitoring_enabled:
+        return
+    if username not in monitoring_users or (shard and not shard.owns(username)):
+        return
+    start_recording(username)
 
-        # Log recorder output
-        if stdout:
-            logger.info(f"📝 Recorder output for {username}:\n{stdout}")
-        if stderr:
-            logger.error(f"❌ Recorder errors for {username}:\n{stderr}")
 
+def mark_offline(username: str):
+    """Forget that a user was live, so their next live starts a recording"""
+    live_users.discard(username)
+    if journal:
+        journal.offline(username)
+
+
+def upload_recording(username: str, video_file: str, caption: str, notify_failure: bool = True) -> bool:
+    """Upload a finished recording; journaled so a restart resumes it"""
+    if journal:
+        journal.upload_pending(video_file, username, caption)
+
+    uploaded = send_telegram_video(video_file, caption)
+    catalog.set_upload_state(video_file, UploadState.UPLOADED if uploaded else UploadState.FAILED)
+    if uploaded:
+        logger.info(f"✅ Uploaded: {username}")
+    elif notify_failure:
+        send_telegram_message(f"⚠️ Recording saved but upload failed: {username}")
+
+    if journal:
+        journal.upload_done(video_file)
+    return uploaded
+
+
+def adopt_recorders():
+    """
+    Take over the recorders of the previous bot process that are still
+    running. Returns the users whose recorder died with it.
+    """
+    orphaned = []
+    for username, recorder in list(journal.state.recorders.items()):
+        if not is_recorder_alive(recorder['pid'], username):
+            journal.recorder_exited(username, recorder['pid'])
+            orphaned.append(username)
+            continue
+
+        # Our node id changed with the restart, the lease is still the old one's
+        if shard and not shard.acquire(username, take_over=recorder.get('node')):
+            logger.warning(f"⚠️ Not adopting the recorder of {username} (pid {recorder['pid']}): "
+                           f"another node holds its lease")
+            journal.recorder_exited(username, recorder['pid'])
+            continue
+
+        process = AdoptedRecorder(recorder['pid'], username, catalog, recorder['started'])
         with recordings_lock:
-            if username in active_recordings:
-                del active_recordings[username]
+            active_recordings[username] = process
+        supervisor.watch(username, process)
+        logger.info(f"♻️ Re-adopted recorder of {username} (pid {recorder['pid']})")
 
-        logger.info(f"✅ Recording completed: {username}")
+    return orphaned
 
-        # Find and upload video
-        video_file = find_latest_video(username)
 
-        if video_file:
-            caption = (
-                f"📹 <b>{username}</b> - Live Recording\n"
+def resume_from_journal(orphaned: list):
+    """
+    Restart the recordings that died with the previous process if the
+    user is still live, and finish its uploads (runs in the background)
+    """
+    started = time.time()
+
+    # What was recorded until the restart is uploaded like a /stop
+    for username in orphaned:
+        video_file = find_latest_video(username)
+        if video_file and video_file not in journal.state.uploads:
+            journal.upload_pending(video_file, username, (
+                f"📹 <b>{username}</b> - Live Recording (interrupted by a restart)\n"
                 f"Ended: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
+            ))
 
-            if send_telegram_video(video_file, caption):
-                logger.info(f"✅ Uploaded: {username}")
-            else:
-                send_telegram_message(f"⚠️ Recording saved but upload failed: {username}")
+    def check_orphan(username):
+        try:
+            return check_user_live(username)
+        except IPBlockedByWAF:
+            return True  # can't ask TikTok right now, the recorder will find out
+
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix="resume") as pool:
+        still_live = dict(zip(orphaned, pool.map(check_orphan, orphaned)))
+    for username, is_live in still_live.items():
+        if is_live and start_recording(username):
+            logger.info(f"♻️ Restarted recording of {username}")
         else:
-            logger.warning(f"⚠️ No video found: {username}")
+            mark_offline(username)
 
-    except Exception as e:
-        logger.error(f"❌ Monitor error: {e}")
-        with recordings_lock:
-            if username in active_recordings:
-                del active_recordings[username]
+    logger.info(f"♻️ Resumed {len(orphaned)} recording(s) in {time.time() - started:.1f}s")
+
+    for video_file, upload in list(journal.state.uploads.items()):
+        if Path(video_file).exists():
+            upload_recording(upload['user'], video_file, upload['caption'] or f"📹 <b>{upload['user']}</b>")
+        else:
+            journal.upload_done(video_file)
 
 
-def monitoring_loop():
-    """Main monitoring loop"""
+def monitoring_loop(stop_event: Event = None):
+    """Main monitoring loop, runs until stop_event is set"""
     logger.info("🔍 Monitoring started")
+    stop_event = stop_event or Event()
 
-    checked = {}  # Track who we've notified about
+    backoff = Backoff("monitoring_loop")
 
-    while True:
+    while not stop_event.is_set():
         try:
             if not monitoring_enabled:
                 time.sleep(10)
                 continue
 
+            # The user list is shared with the other nodes
+            if shard:
+                monitoring_users.reload()
+
             if not monitoring_users:
                 time.sleep(config['recording']['check_interval'])
                 continue
 
-            for username in monitoring_users[:]:
+            cycle_start = time.perf_counter()
+            for username in monitoring_users.snapshot():
+                if stop_event.is_set():
+                    break
+
+                if shard and not shard.owns(username):
+                    mark_offline(username)
+                    continue  # Checked by another node
+
                 with recordings_lock:
                     if username in active_recordings:
                         continue  # Already recording
 
-                # Check if live
-                logger.info(f"🔍 Checking {username}...")
-                is_live = check_user_live(username)
-                logger.info(f"📊 {username}: {'🔴 LIVE' if is_live else '⚫ offline'}")
-
-                if is_live and username not in checked:
-                    # Just went live!
-                    logger.info(f"🔴 {username} is LIVE - starting recording!")
-                    checked[username] = True
-                    start_recording(username)
-
-                elif not is_live and username in checked:
-                    # Stream ended
-                    logger.info(f"⚫ {username} stream ended")
-                    del checked[username]
-
-                time.sleep(2)
+                # Traces are only exported when the check starts a recording
+                with tracing.trace("go_live", user=username):
+                    # Check if live
+                    logger.info(f"🔍 Checking {username}...")
+                    is_live = check_user_live(username)
+                    detected_at = time.time()
+                    logger.info(f"📊 {username}: {'🔴 LIVE' if is_live else '⚫ offline'}")
+
+                    if is_live and username not in live_users:
+                        # Just went live!
+                        if start_recording(username, detected_at):
+                            live_users.add(username)
+                            if journal:
+                                journal.live(username)
+                            logger.info(f"🔴 {username} is LIVE - recording started!")
+
+                    elif not is_live and username in live_users:
+                        # Stream ended
+                        logger.info(f"⚫ {username} stream ended")
+                        mark_offline(username)
+
+                time.sleep(CHECK_PACING)
+
+            DETECTION_CYCLE.observe(time.perf_counter() - cycle_start)
+            monitoring_users.flush()
+            backoff.reset()
 
             # Wait before next check
             time.sleep(config['recording']['check_interval'])
 
+        except IPBlockedByWAF as e:
+            # Every check would fail: back off instead of reporting users offline
+            logger.warning(f"⚠️ Live checks blocked, pausing the cycle: {e}")
+            monitoring_users.flush()
+            backoff.wait(e)
+
         except Exception as e:
             logger.error(f"❌ Monitoring error: {e}")
-            time.sleep(30)
+            backoff.wait(e)
 
 
 # ===== TELEGRAM BOT COMMANDS =====
@@ -379,12 +756,15 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🎬 <b>TikTok Live Monitor & Recorder</b>\n\n"
         "Commands:\n"
         "/add username - Add user to monitor\n"
+        "/addmany user1 user2 ... - Add several users (or send a .txt/.csv file)\n"
         "/remove username - Remove user\n"
         "/list - Show monitored users\n"
-        "/status - Show status\n\n"
+        "/status - Show status\n"
+        "/files [page] - List recordings\n\n"
         "<b>Manual Control:</b>\n"
         "/record username - Start recording now\n"
-        "/stop username - Stop recording and send video",
+        "/stop username - Stop recording and send video\n"
+        "/clip username [minutes] - Send the last minutes of a recording",
         parse_mode='HTML'
     )
 
@@ -394,22 +774,119 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"✅ ADD from {update.effective_user.username}")
 
     if not context.args:
-        await update.message.reply_text("Usage: /add username")
+        await update.message.reply_text("Usage: /add username [priority]")
         return
 
     username = context.args[0].strip().lstrip('@')
+    try:
+        priority = int(context.args[1]) if len(context.args) > 1 else 0
+    except ValueError:
+        await update.message.reply_text("Usage: /add username [priority]")
+        return
 
-    if username in monitoring_users:
+    if shard:
+        await asyncio.to_thread(monitoring_users.reload)
+
+    if not await asyncio.to_thread(monitoring_users.add, username, priority):
         await update.message.reply_text(f"ℹ️ Already monitoring @{username}")
         return
 
-    monitoring_users.append(username)
-    save_monitoring_list()
-
     await update.message.reply_text(f"✅ Added @{username}")
     logger.info(f"Added: {username}")
 
 
+def format_names(names: list, limit: int = 40) -> str:
+    text = ", ".join(html.escape(n) for n in names[:limit])
+    return text + (f" and {len(names) - limit} more" if len(names) > limit else "")
+
+
+async def import_users(update: Update, usernames: list):
+    """Validate usernames concurrently, add the ones that exist and report the rest"""
+    if len(usernames) > IMPORT_LIMIT:
+        await update.message.reply_text(f"⚠️ Only the first {IMPORT_LIMIT} of {len(usernames)} users are imported")
+        usernames = usernames[:IMPORT_LIMIT]
+
+    if shard:
+        await asyncio.to_thread(monitoring_users.reload)
+    new = [u for u in usernames if u not in monitoring_users]
+    already = len(usernames) - len(new)
+
+    progress = await update.message.reply_text(f"🔍 Validating {len(new)} users...")
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import") as pool:
+        async def validate(username):
+            return username, await loop.run_in_executor(pool, validate_user, username)
+
+        last_update = time.time()
+        for done in asyncio.as_completed([validate(u) for u in new]):
+            username, result = await done
+            results[username] = result
+            if time.time() - last_update >= 10:
+                last_update = time.time()
+                await progress.edit_text(f"🔍 Validated {len(results)}/{len(new)} users...")
+
+    by_status = {}
+    for username in new:
+        by_status.setdefault(results[username], []).append(username)
+
+    # Users TikTok could not be asked about are checked by the monitoring loop anyway
+    accepted = by_status.get('ok', []) + by_status.get('never_live', []) + by_status.get('unverified', [])
+    added = await asyncio.to_thread(monitoring_users.add_many, accepted)
+    logger.info(f"Imported {len(added)} of {len(usernames)} users")
+
+    lines = [f"✅ Added {len(added)} users"]
+    if by_status.get('never_live'):
+        lines.append(f"💤 Never live yet ({len(by_status['never_live'])}): {format_names(by_status['never_live'])}")
+    if by_status.get('unverified'):
+        lines.append(f"⚠️ Could not verify, added anyway ({len(by_status['unverified'])}): "
+                     f"{format_names(by_status['unverified'])}")
+    if already:
+        lines.append(f"ℹ️ Already monitored: {already}")
+    invalid = by_status.get('not_found', []) + by_status.get('invalid', [])
+    if invalid:
+        lines.append(f"❌ Invalid ({len(invalid)}): {format_names(invalid)}")
+    await progress.edit_text("\n".join(lines), parse_mode='HTML')
+
+
+async def addmany_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /addmany - Add several users at once"""
+    logger.info(f"✅ ADDMANY from {update.effective_user.username}")
+
+    usernames = parse_usernames(" ".join(context.args or []))
+    if not usernames:
+        await update.message.reply_text(
+            "Usage: /addmany user1 user2 ...\n"
+            "Or send a .txt or .csv file with one username per line"
+        )
+        return
+
+    await import_users(update, usernames)
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a .txt or .csv document - Add the users listed in it"""
+    document = update.message.document
+    logger.info(f"✅ DOCUMENT {document.file_name} from {update.effective_user.username}")
+
+    name = (document.file_name or "").lower()
+    if not name.endswith(('.txt', '.csv')):
+        await update.message.reply_text("ℹ️ Send a .txt or .csv file to import users")
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text("⚠️ File too large, the limit is 1MB")
+        return
+
+    data = await (await document.get_file()).download_as_bytearray()
+    usernames = parse_usernames(bytes(data).decode('utf-8-sig', errors='replace'), csv_file=name.endswith('.csv'))
+    if not usernames:
+        await update.message.reply_text("ℹ️ No usernames found in the file")
+        return
+
+    await import_users(update, usernames)
+
+
 async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /remove"""
     logger.info(f"✅ REMOVE from {update.effective_user.username}")
@@ -420,13 +897,13 @@ async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     username = context.args[0].strip().lstrip('@')
 
-    if username not in monitoring_users:
+    if shard:
+        await asyncio.to_thread(monitoring_users.reload)
+
+    if not await asyncio.to_thread(monitoring_users.remove, username):
         await update.message.reply_text(f"ℹ️ Not monitoring @{username}")
         return
 
-    monitoring_users.remove(username)
-    save_monitoring_list()
-
     await update.message.reply_text(f"✅ Removed @{username}")
     logger.info(f"Removed: {username}")
 
@@ -446,12 +923,26 @@ async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def recording_progress(process) -> str:
+    """Size, stream stats and reconnects of the recording in progress, for /status"""
+    recording = current_recording(process)
+    if not recording:
+        return ""
+    progress = f" - {recording['bytes'] / 1024 / 1024:.1f}MB, {(time.time() - recording['t']) / 60:.0f} min"
+    reconnects = getattr(getattr(process, 'channel', None), 'reconnects', 0)
+    if reconnects:
+        progress += f", {reconnects} reconnects"
+    if recording.get('stats'):
+        progress += f"\n    {format_stream_stats(recording['stats'])}"
+    return progress
+
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status"""
     logger.info(f"✅ STATUS from {update.effective_user.username}")
 
     with recordings_lock:
-        active = list(active_recordings.keys())
+        active = list(active_recordings.items())
 
     message = (
         f"📊 <b>Status</b>\n\n"
@@ -459,8 +950,14 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Active recordings: {len(active)}"
     )
 
+    if shard:
+        message += (
+            f"\nNode: {html.escape(shard.node_id)} "
+            f"({len(shard.owned(monitoring_users))} users, {len(shard.ring.nodes)} nodes)"
+        )
+
     if active:
-        active_text = "\n".join([f"🔴 @{u}" for u in active])
+        active_text = "\n".join([f"🔴 @{u}{recording_progress(p)}" for u, p in active])
         message += f"\n\n<b>Recording:</b>\n{active_text}"
 
     await update.message.reply_text(message, parse_mode='HTML')
@@ -481,13 +978,24 @@ async def record_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"ℹ️ Already recording @{username}")
             return
 
-    # Check if user is live
+    # Check if user is live (network calls run off the event loop,
+    # asyncio.to_thread carries the trace context along)
     await update.message.reply_text(f"🔍 Checking if @{username} is live...")
-    is_live = check_user_live(username)
+    started = False
+    with tracing.trace("go_live", user=username, manual=True):
+        try:
+            is_live = await asyncio.to_thread(check_user_live, username)
+        except IPBlockedByWAF:
+            await update.message.reply_text("⚠️ TikTok is blocking live checks right now, try again in a few minutes")
+            return
+
+        if is_live:
+            await update.message.reply_text(f"🔴 @{username} is LIVE!\n🎬 Starting recording...")
+            started = await asyncio.to_thread(start_recording, username)
 
-    if is_live:
-        await update.message.reply_text(f"🔴 @{username} is LIVE!\n🎬 Starting recording...")
-        start_recording(username)
+    if is_live and not started:
+        await update.message.reply_text(f"⚠️ Could not start recording @{username}, check the logs")
+    elif is_live:
         await update.message.reply_text(f"✅ Recording started for @{username}")
         logger.info(f"✅ Manual recording started: {username}")
     else:
@@ -498,25 +1006,32 @@ async def record_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /files - Debug: list recordings directory"""
+    """Handle /files [page] - List cataloged recordings"""
     logger.info(f"✅ FILES from {update.effective_user.username}")
 
     try:
-        if not Path(OUTPUT_DIR).exists():
-            await update.message.reply_text(f"⚠️ Directory {OUTPUT_DIR} does not exist")
+        total = await asyncio.to_thread(catalog.count)
+        if not total:
+            await update.message.reply_text("📁 No recordings yet")
             return
 
-        all_files = list(Path(OUTPUT_DIR).glob("*"))
+        pages = (total + FILES_PAGE_SIZE - 1) // FILES_PAGE_SIZE
+        page = int(context.args[0]) if context.args and context.args[0].isdigit() else 1
+        page = min(max(page, 1), pages)
 
-        if not all_files:
-            await update.message.reply_text(f"📁 Directory {OUTPUT_DIR} is empty")
-            return
-
-        files_list = "\n".join([f"• {f.name} ({f.stat().st_size // 1024 // 1024}MB)" for f in all_files[:10]])
-        await update.message.reply_text(
-            f"📁 <b>Files in {OUTPUT_DIR}:</b>\n\n{files_list}",
-            parse_mode='HTML'
+        recordings = await asyncio.to_thread(
+            catalog.list_recordings, FILES_PAGE_SIZE, (page - 1) * FILES_PAGE_SIZE
         )
+        files_list = "\n".join([
+            f"• {Path(r.path).name} ({r.size // 1024 // 1024}MB, {r.status}, {r.upload_state})"
+            for r in recordings
+        ])
+
+        message = f"📁 <b>Recordings (page {page}/{pages}, {total} total):</b>\n\n{files_list}"
+        if page < pages:
+            message += f"\n\nNext: /files {page + 1}"
+
+        await update.message.reply_text(message, parse_mode='HTML')
     except Exception as e:
         logger.error(f"❌ Error listing files: {e}")
         await update.message.reply_text(f"❌ Error: {str(e)}")
@@ -532,79 +1047,130 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     username = context.args[0].strip().lstrip('@')
 
+    # Only hold the lock to claim the process; waiting and uploading
+    # happen outside of it so /status and the monitor loop stay responsive
     with recordings_lock:
-        if username not in active_recordings:
-            await update.message.reply_text(f"ℹ️ No active recording for @{username}")
-            return
-
-        # Get the process
-        process = active_recordings[username]
+        process = active_recordings.pop(username, None)
+    if process is not None and shard:
+        shard.release(username)
 
-        # Terminate the recording
-        try:
-            process.terminate()
-            logger.info(f"🛑 Stopped recording for {username}")
-            await update.message.reply_text(f"⏹️ Stopping recording for @{username}...\n📤 Looking for video...")
+    if process is None:
+        await update.message.reply_text(f"ℹ️ No active recording for @{username}")
+        return
 
-            # Wait a moment for file to finalize
-            time.sleep(3)
+    # The /stop handler uploads this one, not recorder_exited
+    process.stopped_by_user = True
 
-            # Remove from active recordings
-            del active_recordings[username]
+    try:
+        process.terminate()
+        logger.info(f"🛑 Stopped recording for {username}")
+        await update.message.reply_text(f"⏹️ Stopping recording for @{username}...\n📤 Looking for video...")
 
-            # List all files in recordings dir for debugging
-            try:
-                all_files = list(Path(OUTPUT_DIR).glob("*"))
-                logger.info(f"📁 Files in {OUTPUT_DIR}: {[f.name for f in all_files]}")
-            except Exception as e:
-                logger.error(f"❌ Error listing files: {e}")
+        # Wait a moment for file to finalize
+        await asyncio.sleep(3)
 
-            # Find and upload the latest video
-            video_file = find_latest_video(username)
+        # The recorder reported the file it was writing
+        video_file = await asyncio.to_thread(interrupted_recording, username, process)
 
-            if video_file:
-                logger.info(f"📹 Found video: {video_file}")
+        if video_file:
+            logger.info(f"📹 Found video: {video_file}")
 
-                # Get file size
-                file_size_mb = Path(video_file).stat().st_size / 1024 / 1024
+            # Get file size
+            file_size_mb = Path(video_file).stat().st_size / 1024 / 1024
 
-                caption = (
-                    f"📹 <b>{username}</b> - Manual Stop\n"
-                    f"Stopped: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"Size: {file_size_mb:.1f}MB"
-                )
+            caption = (
+                f"📹 <b>{username}</b> - Manual Stop\n"
+                f"Stopped: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"Size: {file_size_mb:.1f}MB"
+            )
 
-                if send_telegram_video(video_file, caption):
-                    await update.message.reply_text(f"✅ Video uploaded for @{username}")
-                    logger.info(f"✅ Uploaded manually stopped recording: {username}")
-                else:
-                    # Check if file is too large
-                    if file_size_mb > 50:
-                        await update.message.reply_text(
-                            f"⚠️ Video too large: {file_size_mb:.1f}MB\n"
-                            f"Telegram limit: 50MB\n"
-                            f"File saved on server: {Path(video_file).name}"
-                        )
-                    else:
-                        await update.message.reply_text(
-                            f"⚠️ Upload failed ({file_size_mb:.1f}MB)\n"
-                            f"Check Railway logs for details"
-                        )
+            if await asyncio.to_thread(upload_recording, username, video_file, caption, False):
+                await update.message.reply_text(f"✅ Video uploaded for @{username}")
+                logger.info(f"✅ Uploaded manually stopped recording: {username}")
             else:
-                # Debug: list what files we tried to find
-                logger.warning(f"⚠️ No video found for {username} in {OUTPUT_DIR}")
-                await update.message.reply_text(
-                    f"⚠️ No video found for @{username}\n"
-                    f"Check Railway logs for file list"
-                )
+                # Check if file is too large
+                if file_size_mb > 50:
+                    await update.message.reply_text(
+                        f"⚠️ Video too large: {file_size_mb:.1f}MB\n"
+                        f"Telegram limit: 50MB\n"
+                        f"File saved on server: {Path(video_file).name}"
+                    )
+                else:
+                    await update.message.reply_text(
+                        f"⚠️ Upload failed ({file_size_mb:.1f}MB)\n"
+                        f"Check Railway logs for details"
+                    )
+        else:
+            logger.warning(f"⚠️ No video found for {username} in catalog")
+            await update.message.reply_text(f"⚠️ No video found for @{username}")
 
-        except Exception as e:
-            logger.error(f"❌ Error stopping recording: {e}")
-            await update.message.reply_text(f"❌ Error stopping recording: {str(e)}")
+    except Exception as e:
+        logger.error(f"❌ Error stopping recording: {e}")
+        await update.message.reply_text(f"❌ Error stopping recording: {str(e)}")
+
+async def clip_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /clip username [minutes] - Send the tail of a recording in progress"""
+    logger.info(f"✅ CLIP from {update.effective_user.username}")
+
+    if not context.args:
+        await update.message.reply_text(f"Usage: /clip username [minutes, default {CLIP_DEFAULT_MINUTES}]")
+        return
+
+    username = context.args[0].strip().lstrip('@')
+    minutes = CLIP_DEFAULT_MINUTES
+    if len(context.args) > 1:
+        try:
+            minutes = float(context.args[1])
+        except ValueError:
+            minutes = 0
+        if not 0 < minutes <= CLIP_MAX_MINUTES:
+            await update.message.reply_text(f"⚠️ Minutes must be between 0 and {CLIP_MAX_MINUTES}")
+            return
+
+    with recordings_lock:
+        process = active_recordings.get(username)
+    recording = await asyncio.to_thread(current_recording, process)
+    if not recording:
+        await update.message.reply_text(f"ℹ️ No recording in progress for @{username}")
+        return
+
+    # Copies bytes from the recorder's keyframe index, the recording goes on
+    with tempfile.TemporaryDirectory() as clip_dir:
+        clip_file = os.path.join(clip_dir, f"TK_{username}_clip_{datetime.now().strftime('%Y.%m.%d_%H-%M-%S')}_flv.mp4")
+        try:
+            covered = await asyncio.to_thread(cut_clip, recording['path'], minutes * 60, clip_file)
+        except OSError as e:
+            logger.error(f"❌ Error cutting clip of {username}: {e}")
+            covered = None
+        if covered is None:
+            await update.message.reply_text(f"⚠️ No clip available for @{username} yet (FLV recordings only)")
+            return
+
+        await asyncio.to_thread(VideoManagement.convert_flv_to_mp4, clip_file)
+        video_file = VideoManagement.converted_path(clip_file)
+        if not Path(video_file).exists():
+            await update.message.reply_text("❌ Could not convert the clip, check the logs")
+            return
+
+        file_size_mb = Path(video_file).stat().st_size / 1024 / 1024
+        caption = (
+            f"✂️ <b>{username}</b> - Last {covered / 60:.1f} min\n"
+            f"Clipped: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        if await asyncio.to_thread(send_telegram_video, video_file, caption):
+            await update.message.reply_text(f"✅ Clip of @{username} sent")
+        elif file_size_mb > 50:
+            await update.message.reply_text(
+                f"⚠️ Clip too large: {file_size_mb:.1f}MB (Telegram limit: 50MB)\n"
+                f"Try fewer minutes"
+            )
+        else:
+            await update.message.reply_text("❌ Clip upload failed, check the logs")
 
 
 def main():
     """Main entry point"""
+    global catalog, retention, notifier, shard, journal, supervisor, monitoring_users, MONITORING_FILE, USERS_DB
 
     print("""
 ╔═══════════════════════════════════════════════════════════╗
@@ -615,13 +1181,81 @@ def main():
 
     # Load config
     load_config()
-    load_monitoring_list()
+
+    # Several nodes: share the user list and split it by consistent hashing
+    sharding_config = config.get('sharding', {})
+    if sharding_config.get('enabled', False):
+        MONITORING_FILE = sharding_config.get('monitoring_file', MONITORING_FILE)
+        USERS_DB = sharding_config.get('users_db', './shared/users.db')
+        shard = ShardCoordinator.from_config(sharding_config)
+        Thread(target=shard.run, daemon=True).start()
+
+    monitoring_users = open_user_registry(USERS_DB, shared=shard is not None)
+
+    # Open recording catalog (imports files recorded before it existed)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    catalog = RecordingCatalog(CATALOG_FILE)
+    for root in get_output_roots():
+        os.makedirs(root, exist_ok=True)
+        catalog.backfill(root)
+
+    # One TikTok request budget and WAF breaker for the bot and every
+    # recorder subprocess (they inherit the path through the environment)
+    governor_config = config.get('governor', {})
+    if governor_config.get('enabled', True):
+        governor.configure(
+            governor_config.get('db', './recordings/governor.db'),
+            {endpoint: tuple(rate) for endpoint, rate in governor_config.get('rates', {}).items()}
+        )
+
+    # Spread TikTok requests over the configured proxies
+    proxy_spec = get_proxy_spec()
+    if proxy_spec:
+        http_session.proxy_pool = ProxyPool.shared(proxy_spec)
+
+    # Start outbound notification queue
+    notifier = Notifier.from_config(config['telegram'], config.get('notifications', {}), telegram_session)
+    Thread(target=notifier.run, daemon=True).start()
+
+    # Start disk retention thread
+    retention = RetentionManager.from_config(catalog, get_output_roots(), config.get('retention', {}))
+    Thread(target=retention.run, daemon=True).start()
+
+    # Export go-live traces (render with: python -m utils.tracing <file>)
+    tracing_config = config.get('tracing', {})
+    if tracing_config.get('enabled', True):
+        tracing.configure(os.path.abspath(tracing_config.get('file', './traces.jsonl')))
+
+    # Serve /metrics locally (recorder subprocesses export into METRICS_DIR)
+    metrics_config = config.get('metrics', {})
+    if metrics_config.get('enabled', True):
+        MetricsServer(
+            host=metrics_config.get('host', '127.0.0.1'),
+            port=metrics_config.get('port', 9108),
+            textfile_dir=METRICS_DIR
+        ).start()
 
     # Check recorder
     if not Path(RECORDER_PATH).exists():
         logger.error("❌ Recorder not found! Run ./setup.sh")
         return
 
+    # One thread watches every recorder, exits are handled on its pool
+    supervisor = Supervisor.from_config(
+        config.get('supervisor', {}), on_recorder_event, recorder_exited, restart_recording
+    )
+    Thread(target=supervisor.run, daemon=True).start()
+
+    # Pick up where the previous process left off (the container gets restarted)
+    journal_config = config.get('journal', {})
+    if journal_config.get('enabled', True):
+        journal = Journal(journal_config.get('file', './recordings/state.journal'))
+        state = journal.replay()
+        live_users.update(state.live)
+        orphaned = adopt_recorders()
+        if orphaned or state.uploads:
+            Thread(target=resume_from_journal, args=(orphaned,), daemon=True).start()
+
     # Start monitoring thread
     logger.info("🚀 Starting monitoring...")
     monitor_thread = Thread(target=monitoring_loop, daemon=True)
@@ -630,17 +1264,21 @@ def main():
 
     # Build bot
     bot_token = config['telegram']['bot_token']
-    application = Application.builder().token(bot_token).build()
+    # Handlers run concurrently, so a slow /record or /stop never holds up /status
+    application = Application.builder().token(bot_token).concurrent_updates(True).build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("add", add_command))
+    application.add_handler(CommandHandler("addmany", addmany_command))
+    application.add_handler(MessageHandler(filters.Document.ALL, import_document))
     application.add_handler(CommandHandler("remove", remove_command))
     application.add_handler(CommandHandler("list", list_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CommandHandler("record", record_command))
     application.add_handler(CommandHandler("stop", stop_command))
     application.add_handler(CommandHandler("files", files_command))
+    application.add_handler(CommandHandler("clip", clip_command))
 
     logger.info("✅ Bot started - send /start to @tiksnzbot")
 
@@ -0,0 +1,247 @@
+"""
+Append-only journal of the monitor's state.
+
+Every change to the state that a restart would lose is appended as one
+JSON line and fsynced: users seen live, recorder subprocesses (pid,
+room, shard node holding the lease) and recordings waiting for their
+upload. On startup the journal is replayed into a JournalState and
+rewritten as a snapshot, which also happens whenever it grows past
+compact_every lines. A line torn by a crash is ignored.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+
+from utils.enums import RecordingStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JournalState:
+    live: set = field(default_factory=set)  # users the monitoring loop saw live
+    recorders: dict = field(default_factory=dict)  # user -> {'pid', 'room_id', 'node', 'started'}
+    uploads: dict = field(default_factory=dict)  # path -> {'user', 'caption'}
+
+    def apply(self, entry: dict):
+        op = entry['op']
+        if op == 'live':
+            self.live.add(entry['user'])
+        elif op == 'offline':
+            self.live.discard(entry['user'])
+        elif op == 'recorder':
+            self.recorders[entry['user']] = {
+                'pid': entry['pid'], 'room_id': entry.get('room_id'), 'node': entry.get('node'),
+                'started': entry['t'],
+            }
+        elif op == 'recorder_exit':
+            if self.recorders.get(entry['user'], {}).get('pid') == entry['pid']:
+                del self.recorders[entry['user']]
+        elif op == 'upload':
+            self.uploads[entry['path']] = {'user': entry['user'], 'caption': entry.get('caption')}
+        elif op == 'uploaded':
+            self.uploads.pop(entry['path'], None)
+
+    def entries(self) -> list:
+        """The state as journal entries, for a snapshot"""
+        now = time.time()
+        entries = [{'op': 'live', 'user': user, 't': now} for user in sorted(self.live)]
+        entries += [
+            {'op': 'recorder', 'user': user, 'pid': r['pid'], 'room_id': r['room_id'], 'node': r['node'],
+             't': r['started']}
+            for user, r in self.recorders.items()
+        ]
+        entries += [
+            {'op': 'upload', 'path': path, 'user': u['user'], 'caption': u['caption'], 't': now}
+            for path, u in self.uploads.items()
+        ]
+        return entries
+
+
+class Journal:
+    """Crash-safe, append-only record of the monitor state"""
+
+    def __init__(self, path: str, compact_every: int = 1000):
+        self.path = path
+        self.compact_every = compact_every
+        self.state = JournalState()
+        self._lines = 0
+        self._snapshot_lines = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def replay(self) -> JournalState:
+        """Loads the journal written before the restart and compacts it"""
+        skipped = 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.state.apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        skipped += 1  # torn write of a crash, or garbage
+        except FileNotFoundError:
+            pass
+
+        if skipped:
+            logger.warning(f"⚠️ Skipped {skipped} unreadable journal line(s)")
+        with self._lock:
+            self._compact()
+        return self.state
+
+    def _compact(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._file:
+            self._file.close()
+
+        entries = self.state.entries()
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lines = self._snapshot_lines = len(entries)
+
+    def _append(self, op: str, **fields):
+        entry = {'op': op, **fields, 't': time.time()}
+        with self._lock:
+            self.state.apply(entry)
+            if self._file is None:
+                self._compact()
+            try:
+                self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._lines += 1
+                # A big state must not be rewritten on every append
+                if self._lines >= max(self.compact_every, 2 * self._snapshot_lines):
+                    self._compact()
+            except OSError as e:
+                logger.error(f"❌ Journal write error: {e}")
+
+    def live(self, user: str):
+        if user not in self.state.live:
+            self._append('live', user=user)
+
+    def offline(self, user: str):
+        if user in self.state.live:
+            self._append('offline', user=user)
+
+    def recorder_started(self, user: str, pid: int, room_id: str = None, node: str = None):
+        self._append('recorder', user=user, pid=pid, room_id=room_id, node=node)
+
+    def recorder_exited(self, user: str, pid: int):
+        self._append('recorder_exit', user=user, pid=pid)
+
+    def upload_pending(self, path: str, user: str, caption: str = None):
+        self._append('upload', path=path, user=user, caption=caption)
+
+    def upload_done(self, path: str):
+        if path in self.state.uploads:
+            self._append('uploaded', path=path)
+
+
+def is_recorder_alive(pid: int, user: str) -> bool:
+    """
+    Whether pid is still a recorder of user (and not a reused pid).
+    Without /proc only the pid is checked.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by someone else
+
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            args = f.read().split(b'\0')
+    except FileNotFoundError:
+        return not os.path.isdir('/proc')
+    except OSError:
+        return False
+    return user.encode() in args and any(arg.endswith(b'record_wrapper.py') for arg in args)
+
+
+class AdoptedRecorder:
+    """
+    Popen look-alike for a recorder started by a previous bot process.
+    Its output and event pipes died with that process, so what it is
+    recording, what it finished and how it ended are read from the
+    catalog it writes to.
+    """
+
+    def __init__(self, pid: int, user: str, catalog=None, started: float = None):
+        self.pid = pid
+        self.user = user
+        self.catalog = catalog
+        self.adopted_at = time.time()
+        self.started = started or self.adopted_at
+        self.returncode = None
+        self._reported = set()  # ids of the recordings read_events() returned
+
+    @property
+    def recording(self) -> dict:
+        """The recording in progress, like RecorderChannel.recording, or None"""
+        latest = self.catalog.latest_for_user(self.user) if self.catalog else None
+        if latest is None or latest.status != RecordingStatus.RECORDING:
+            return None
+        return {
+            'user': latest.user, 'room_id': latest.room_id, 'path': latest.path,
+            'recording_id': latest.id, 't': latest.started_at, 'bytes': latest.size,
+            'stats': latest.stats,
+        }
+
+    def read_events(self) -> list:
+        """
+        A 'finished' event, as the lost event pipe would have carried, for
+        each recording the recorder finished that is not uploaded yet.
+        Every recording is returned once.
+        """
+        if not self.catalog:
+            return []
+        events = []
+        for recording in self.catalog.pending_uploads(self.user, self.started):
+            if recording.id in self._reported:
+                continue
+            self._reported.add(recording.id)
+            events.append({
+                'event': 'finished', 't': recording.finished_at, 'user': recording.user,
+                'path': recording.path, 'status': recording.status.value, 'stats': recording.stats,
+            })
+        return events
+
+    def _exit_status(self) -> int:
+        """0 if the recorder finished a recording since it was adopted, else 1 (crashed or unknown)"""
+        latest = self.catalog.latest_for_user(self.user) if self.catalog else None
+        if latest and latest.status == RecordingStatus.FINISHED and (latest.finished_at or 0) >= self.adopted_at:
+            return 0
+        return 1
+
+    def poll(self):
+        if self.returncode is None and not is_recorder_alive(self.pid, self.user):
+            self.returncode = self._exit_status()
+        return self.returncode
+
+    def wait(self, timeout: float = None):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.poll() is None:
+            if deadline and time.time() >= deadline:
+                raise TimeoutError(f"recorder {self.pid} still running")
+            time.sleep(1)
+        return self.returncode
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,227 @@
+"""
+Outbound Telegram message queue.
+
+Messages are sent from a single background thread, spaced out per chat
+so we stay below Telegram's flood limits, and put back in the queue
+when Telegram answers 429 with a retry_after. Messages of the same
+group that pile up while a chat is throttled are coalesced into one
+digest, e.g. "5 users went live: ...".
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Event
+
+from utils.metrics import REGISTRY
+from utils.retry import BACKOFF, RETRIES, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+API_URL = 'https://api.telegram.org/bot{token}/sendMessage'
+MAX_MESSAGE_LENGTH = 4096
+
+# Digest headline per notification group
+DIGEST_TITLES = {
+    'live': '🔴 <b>{count} users went live:</b>',
+}
+DEFAULT_DIGEST_TITLE = '📣 <b>{count} notifications:</b>'
+
+SENT = REGISTRY.counter('notifications_sent_total', 'Telegram messages delivered.', ['kind'])
+DROPPED = REGISTRY.counter('notifications_dropped_total', 'Notifications given up on.')
+THROTTLED = REGISTRY.counter('notifications_throttled_total', 'HTTP 429 answers from Telegram.')
+QUEUED = REGISTRY.gauge('notifications_queued', 'Notifications waiting to be sent.')
+
+
+@dataclass
+class Notification:
+    chat_id: str
+    text: str
+    group: str = None    # notifications of one group can be merged into a digest
+    summary: str = None  # digest line, defaults to the first line of text
+    attempts: int = 0
+
+
+class _Chat:
+    """Queue and send history of one chat"""
+
+    def __init__(self):
+        self.pending = deque()
+        self.sent_at = deque()  # send times within the last minute
+        self.blocked_until = 0.0
+
+
+class Notifier:
+    """Rate-limited, coalescing sender for Telegram messages"""
+
+    def __init__(self, bot_token, chat_id, session, per_minute=20, min_interval=1.0,
+                 max_attempts=5, digest_limit=30):
+        self.url = API_URL.format(token=bot_token)
+        self.default_chat_id = chat_id
+        self.session = session
+        self.per_minute = per_minute
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.digest_limit = digest_limit
+        self._chats = {}
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, telegram: dict, settings: dict, session):
+        """Build from the 'telegram' and 'notifications' sections of config.json"""
+        return cls(
+            telegram['bot_token'],
+            telegram['chat_id'],
+            session,
+            per_minute=settings.get('per_chat_per_minute', 20),
+            min_interval=settings.get('min_interval', 1.0),
+            max_attempts=settings.get('max_attempts', 5),
+            digest_limit=settings.get('digest_limit', 30),
+        )
+
+    def notify(self, text: str, chat_id=None, group: str = None, summary: str = None):
+        """Queue a message; it is sent from the background thread"""
+        chat_id = chat_id or self.default_chat_id
+        with self._cond:
+            chat = self._chats.setdefault(chat_id, _Chat())
+            chat.pending.append(Notification(chat_id, text, group, summary))
+            QUEUED.inc()
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(chat.pending) for chat in self._chats.values())
+
+    def _ready_at(self, chat: _Chat, now: float) -> float:
+        """Earliest time the chat may be sent to again"""
+        while chat.sent_at and now - chat.sent_at[0] >= 60:
+            chat.sent_at.popleft()
+
+        ready = chat.blocked_until
+        if len(chat.sent_at) >= self.per_minute:
+            ready = max(ready, chat.sent_at[0] + 60)
+        return ready
+
+    def _take_batch(self, chat: _Chat) -> list:
+        """Pops the next notification plus the backlog of its group"""
+        first = chat.pending.popleft()
+        batch = [first]
+        if first.group is None:
+            return batch
+
+        for notification in list(chat.pending):
+            if len(batch) >= self.digest_limit:
+                break
+            if notification.group == first.group:
+                batch.append(notification)
+                chat.pending.remove(notification)
+        return batch
+
+    def _render(self, batch: list) -> str:
+        if len(batch) == 1:
+            return batch[0].text
+
+        title = DIGEST_TITLES.get(batch[0].group, DEFAULT_DIGEST_TITLE)
+        lines = [title.format(count=len(batch)), '']
+        length = len(lines[0])
+        for i, notification in enumerate(batch):
+            line = f"• {notification.summary or notification.text.splitlines()[0]}"
+            if length + len(line) + 40 > MAX_MESSAGE_LENGTH:
+                lines.append(f"…and {len(batch) - i} more")
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return '\n'.join(lines)
+
+    def _retry_delay(self, batch: list) -> float:
+        RETRIES.inc(loop="notifier", kind="network")
+        return backoff_delay(batch[0].attempts, *BACKOFF["network"])
+
+    def _requeue(self, chat: _Chat, batch: list, delay: float, count_attempt=True):
+        with self._cond:
+            if count_attempt:
+                for notification in batch:
+                    notification.attempts += 1
+                expired = [n for n in batch if n.attempts >= self.max_attempts]
+                if expired:
+                    DROPPED.inc(len(expired))
+                    QUEUED.dec(len(expired))
+                    logger.error(f"❌ Dropping {len(expired)} notification(s) after {self.max_attempts} attempts")
+                batch = [n for n in batch if n.attempts < self.max_attempts]
+
+            chat.pending.extendleft(reversed(batch))
+            chat.blocked_until = max(chat.blocked_until, time.time() + delay)
+            self._cond.notify()
+
+    def _deliver(self, chat: _Chat, batch: list):
+        chat_id = batch[0].chat_id
+        data = {
+            'chat_id': chat_id,
+            'text': self._render(batch),
+            'parse_mode': 'HTML'
+        }
+
+        try:
+            response = self.session.post(self.url, data=data, timeout=10)
+        except Exception as e:
+            logger.error(f"❌ Message error: {e}")
+            self._requeue(chat, batch, self._retry_delay(batch))
+            return
+
+        if response.status_code == 200:
+            SENT.inc(kind='digest' if len(batch) > 1 else 'message')
+            QUEUED.dec(len(batch))
+            return
+
+        if response.status_code == 429:
+            try:
+                retry_after = response.json()['parameters']['retry_after']
+            except (ValueError, KeyError, TypeError):
+                retry_after = 5
+            THROTTLED.inc()
+            RETRIES.inc(loop="notifier", kind="throttled")
+            logger.warning(f"⏳ Telegram throttled {chat_id}, retrying in {retry_after}s")
+            # Not a failure of the message itself, so no attempt is counted
+            self._requeue(chat, batch, retry_after, count_attempt=False)
+            return
+
+        if response.status_code >= 500:
+            logger.error(f"❌ Message failed: HTTP {response.status_code}")
+            self._requeue(chat, batch, self._retry_delay(batch))
+            return
+
+        # Other 4xx (bad markup, unknown chat) won't succeed on retry
+        logger.error(f"❌ Message rejected: HTTP {response.status_code} {response.text}")
+        DROPPED.inc(len(batch))
+        QUEUED.dec(len(batch))
+
+    def _next(self, now: float):
+        """Returns (chat, ready_at) of the chat that can be sent to first"""
+        best, best_ready = None, None
+        for chat in self._chats.values():
+            if not chat.pending:
+                continue
+            ready = self._ready_at(chat, now)
+            if best is None or ready < best_ready:
+                best, best_ready = chat, ready
+        return best, best_ready
+
+    def run(self, stop_event: Event = None):
+        """Background loop"""
+        logger.info("📨 Notifier started")
+        stop_event = stop_event or Event()
+        while not stop_event.is_set():
+            with self._cond:
+                now = time.time()
+                chat, ready = self._next(now)
+                if chat is None or ready > now:
+                    self._cond.wait(min(ready - now, 1.0) if chat else 1.0)
+                    continue
+
+                batch = self._take_batch(chat)
+                chat.sent_at.append(now)
+                chat.blocked_until = now + self.min_interval
+
+            self._deliver(chat, batch)
@@ -0,0 +1,219 @@
+"""
+Registry of the monitored users.
+
+Users are indexed in memory by name, each with a small state record
+(priority, when they were last checked and last seen live, the room id
+of that live), and persisted in SQLite, so adding or removing one user
+writes one row instead of the whole list. Iteration goes over an
+immutable snapshot, ordered by priority, that is only rebuilt after a
+change: the monitoring loop neither copies the list every cycle nor
+holds a lock while it checks.
+
+Check results change every cycle and are written by flush(), in one
+transaction. When several nodes share the database, reload() picks up
+the changes of the others and costs nothing when there are none. A
+monitoring_list.json from before the registry is imported once.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL DEFAULT 0,
+    added_at REAL NOT NULL,
+    last_check REAL,
+    last_live REAL,
+    room_id TEXT
+);
+"""
+
+
+@dataclass(slots=True)
+class UserState:
+    username: str
+    priority: int = 0
+    added_at: float = 0.0
+    last_check: float = None
+    last_live: float = None
+    room_id: str = None
+
+
+class UserRegistry:
+    """Monitored users with O(1) lookup and cheap snapshots"""
+
+    def __init__(self, db_path: str, legacy_file: str = None, shared: bool = False):
+        self.db_path = db_path
+        self._lock = Lock()
+        self._users = {}  # username -> UserState
+        self._snapshot = None  # tuple of usernames, None when stale
+        self._dirty = set()  # users whose check state is not written yet
+        self._data_version = None
+
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        if not shared:
+            # WAL needs shared memory, which network volumes don't provide
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._import_legacy(legacy_file)
+        self.reload()
+
+    def _transaction(self, statements):
+        """Runs (query, params or list of params) pairs atomically"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for query, params in statements:
+                    if isinstance(params, list):
+                        self._conn.executemany(query, params)
+                    else:
+                        self._conn.execute(query, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _import_legacy(self, legacy_file: str):
+        """Imports the users of monitoring_list.json the first time the registry is opened"""
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+
+        users = []
+        if legacy_file and Path(legacy_file).exists():
+            try:
+                with open(legacy_file) as f:
+                    users = json.load(f).get('users', [])
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Could not import {legacy_file}: {e}")
+                return
+
+        now = time.time()
+        self._transaction([
+            ("INSERT OR IGNORE INTO users (username, added_at) VALUES (?, ?)", [(u, now) for u in users]),
+            ("PRAGMA user_version=1", ()),
+        ])
+        if users:
+            logger.info(f"✅ Imported {len(users)} users from {legacy_file}")
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-reads the users if another connection changed them, returns True if it did"""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version and not force:
+                return False
+            self._data_version = version
+            rows = self._conn.execute(
+                "SELECT username, priority, added_at, last_check, last_live, room_id FROM users"
+            ).fetchall()
+
+            users = {}
+            for row in rows:
+                state = UserState(*row)
+                known = self._users.get(state.username)
+                if known and state.username in self._dirty:
+                    state = known  # newer than what was written
+                users[state.username] = state
+            self._users = users
+            self._snapshot = None
+        return True
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._users
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def snapshot(self) -> tuple:
+        """The usernames, highest priority first, then in the order they were added"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                states = sorted(self._users.values(), key=lambda s: (-s.priority, s.added_at, s.username))
+                snapshot = self._snapshot = tuple(s.username for s in states)
+        return snapshot
+
+    def get(self, username: str) -> UserState:
+        return self._users.get(username)
+
+    def add(self, username: str, priority: int = 0) -> bool:
+        """Adds a user, returns False if it was already there"""
+        return bool(self.add_many([username], priority))
+
+    def add_many(self, usernames, priority: int = 0) -> list:
+        """Adds users in one transaction, returns the ones that were new"""
+        now = time.time()
+        new = [u for u in dict.fromkeys(usernames) if u not in self._users]
+        if not new:
+            return []
+
+        self._transaction([(
+            "INSERT OR IGNORE INTO users (username, priority, added_at) VALUES (?, ?, ?)",
+            [(u, priority, now) for u in new]
+        )])
+        with self._lock:
+            for username in new:
+                self._users.setdefault(username, UserState(username, priority, now))
+            self._snapshot = None
+        return new
+
+    def remove(self, username: str) -> bool:
+        """Removes a user, returns False if it was not there"""
+        if username not in self._users:
+            return False
+
+        self._transaction([("DELETE FROM users WHERE username = ?", (username,))])
+        with self._lock:
+            self._users.pop(username, None)
+            self._dirty.discard(username)
+            self._snapshot = None
+        return True
+
+    def set_priority(self, username: str, priority: int) -> bool:
+        state = self._users.get(username)
+        if state is None:
+            return False
+
+        self._transaction([("UPDATE users SET priority = ? WHERE username = ?", (priority, username))])
+        with self._lock:
+            state.priority = priority
+            self._snapshot = None
+        return True
+
+    def record_check(self, username: str, live: bool, room_id: str = None):
+        """Notes a live check of username; written by the next flush()"""
+        state = self._users.get(username)
+        if state is None:
+            return
+
+        with self._lock:
+            state.last_check = time.time()
+            if live:
+                state.last_live = state.last_check
+                state.room_id = room_id or state.room_id
+            self._dirty.add(username)
+
+    def flush(self) -> int:
+        """Writes the check state noted since the last flush, returns the number of users"""
+        with self._lock:
+            dirty = [self._users[u] for u in self._dirty if u in self._users]
+            self._dirty = set()
+        if dirty:
+            self._transaction([(
+                "UPDATE users SET last_check = ?, last_live = ?, room_id = ? WHERE username = ?",
+                [(s.last_check, s.last_live, s.room_id, s.username) for s in dirty]
+            )])
+        return len(dirty)
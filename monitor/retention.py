@@ -0,0 +1,130 @@
+"""
+Disk retention for the recordings volume.
+
+Keeps usage between a low and a high watermark by evicting finished
+recordings whose upload is done (uploaded or failed) in policy order,
+and tells the bot when there is not enough headroom left to start a
+new recording.
+"""
+
+import logging
+import os
+import shutil
+from threading import Event
+
+from utils.enums import RecordingStatus, UploadState
+
+logger = logging.getLogger(__name__)
+
+# Sort keys for eviction, applied in the order given by the policy
+POLICY_KEYS = {
+    'uploaded': lambda r: r.upload_state != UploadState.UPLOADED,
+    'oldest': lambda r: r.started_at,
+    'largest': lambda r: -r.size,
+}
+
+DEFAULT_POLICY = ['uploaded', 'oldest', 'largest']
+
+# Recordings whose upload is done, one way or the other
+EVICTABLE_UPLOAD_STATES = (UploadState.UPLOADED, UploadState.FAILED)
+
+
+class RetentionManager:
+    """Watermark-based eviction of cataloged recordings"""
+
+    def __init__(self, catalog, roots, high_watermark=0.90, low_watermark=0.80,
+                 min_free_bytes=2 * 1024 ** 3, interval=60, policy=None):
+        if low_watermark >= high_watermark:
+            raise ValueError("low_watermark must be below high_watermark")
+
+        unknown = set(policy or []) - POLICY_KEYS.keys()
+        if unknown:
+            raise ValueError(f"Unknown retention policy keys: {sorted(unknown)}")
+
+        self.catalog = catalog
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+        self.policy = policy or DEFAULT_POLICY
+
+    @classmethod
+    def from_config(cls, catalog, roots, settings: dict):
+        """Build from the 'retention' section of config.json"""
+        return cls(
+            catalog,
+            roots,
+            high_watermark=settings.get('high_watermark', 0.90),
+            low_watermark=settings.get('low_watermark', 0.80),
+            min_free_bytes=int(settings.get('min_free_gb', 2) * 1024 ** 3),
+            interval=settings.get('check_interval', 60),
+            policy=settings.get('policy'),
+        )
+
+    def _sort_key(self, recording):
+        return tuple(POLICY_KEYS[key](recording) for key in self.policy)
+
+    def has_headroom(self, root=None) -> bool:
+        """True if a new recording can be started on root (default: any root)"""
+        roots = [os.path.abspath(root)] if root else self.roots
+        return any(shutil.disk_usage(r).free >= self.min_free_bytes for r in roots)
+
+    def enforce(self) -> int:
+        """Evict recordings on roots above the high watermark, returns bytes freed"""
+        freed = 0
+        for root in self.roots:
+            if not os.path.exists(root):
+                continue
+
+            usage = shutil.disk_usage(root)
+            if usage.used / usage.total < self.high_watermark and usage.free >= self.min_free_bytes:
+                continue
+
+            target_used = usage.total * self.low_watermark
+            to_free = max(usage.used - target_used, self.min_free_bytes - usage.free)
+            logger.warning(
+                f"⚠️ Disk {root} at {usage.used / usage.total:.0%}, "
+                f"evicting {to_free / 1024 / 1024:.0f}MB"
+            )
+
+            # A pending upload is still waiting for (or reading) its file
+            candidates = sorted(
+                (r for r in self.catalog.recordings_under(root)
+                 if r.status != RecordingStatus.RECORDING and r.upload_state in EVICTABLE_UPLOAD_STATES),
+                key=self._sort_key
+            )
+
+            root_freed = 0
+            for recording in candidates:
+                if root_freed >= to_free:
+                    break
+                try:
+                    size = os.path.getsize(recording.path) if os.path.exists(recording.path) else 0
+                    if size:
+                        os.remove(recording.path)
+                    self.catalog.remove(recording.id)
+                    root_freed += size
+                    logger.info(
+                        f"🗑️ Evicted {os.path.basename(recording.path)} "
+                        f"({size / 1024 / 1024:.1f}MB, {recording.upload_state})"
+                    )
+                except OSError as e:
+                    logger.error(f"❌ Eviction error for {recording.path}: {e}")
+
+            if root_freed < to_free:
+                logger.error(f"❌ Could only free {root_freed / 1024 / 1024:.0f}MB on {root}")
+            freed += root_freed
+
+        return freed
+
+    def run(self, stop_event: Event = None):
+        """Background loop"""
+        logger.info("🧹 Retention manager started")
+        stop_event = stop_event or Event()
+        while not stop_event.is_set():
+            try:
+                self.enforce()
+            except Exception as e:
+                logger.error(f"❌ Retention error: {e}")
+            stop_event.wait(self.interval)
@@ -0,0 +1,176 @@
+"""
+Sharding of monitored users across several monitor nodes.
+
+Nodes share one user list and a small SQLite coordination store on a
+shared volume. Every node heartbeats into the store; the live nodes
+form a consistent hash ring that decides which node checks which user.
+Starting a recording additionally takes a lease on the user, so a user
+that moves to another node (a node joined or died) is never recorded
+twice. Leases of a dead node expire after lease_ttl and its users are
+picked up by the survivors on their next cycle.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+from threading import Event, Lock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    user TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = sorted(nodes)
+        self._ring = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, key: str):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardCoordinator:
+    """Node membership, user ownership and recording leases"""
+
+    def __init__(self, store_path, node_id=None, lease_ttl=30, vnodes=64):
+        self.store_path = store_path
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.vnodes = vnodes
+        self.ring = HashRing([self.node_id], vnodes)
+        self.held = set()  # users this node holds a lease on
+        self._lock = Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+        # No WAL: it needs shared memory, which network volumes don't provide
+        self._conn = sqlite3.connect(
+            store_path, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self._conn.executescript(SCHEMA)
+        self.heartbeat()
+
+    @classmethod
+    def from_config(cls, settings: dict):
+        """Build from the 'sharding' section of config.json"""
+        return cls(
+            settings.get('store', './shared/monitor.db'),
+            node_id=settings.get('node_id') or None,
+            lease_ttl=settings.get('lease_ttl', 30),
+        )
+
+    def _transaction(self, statements):
+        """Runs (query, params) pairs atomically, returns the last cursor"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = None
+                for query, params in statements:
+                    cursor = self._conn.execute(query, params)
+                self._conn.execute("COMMIT")
+                return cursor
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self) -> list:
+        """Refreshes this node and its leases, rebuilds the ring from the live nodes"""
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        held = list(self.held)
+        statements = [(
+            "INSERT INTO nodes (node_id, started_at, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (node_id) DO UPDATE SET expires_at = excluded.expires_at",
+            (self.node_id, now, expires_at)
+        )]
+        statements += [
+            ("UPDATE leases SET expires_at = ? WHERE user = ? AND node_id = ?",
+             (expires_at, user, self.node_id))
+            for user in held
+        ]
+        statements.append(("DELETE FROM nodes WHERE expires_at < ?", (now - self.lease_ttl,)))
+        statements.append(("SELECT node_id FROM nodes WHERE expires_at >= ?", (now,)))
+
+        nodes = [row[0] for row in self._transaction(statements).fetchall()]
+        if sorted(nodes) != self.ring.nodes:
+            logger.info(f"🧩 Shard ring: {len(nodes)} node(s) {sorted(nodes)}")
+            self.ring = HashRing(nodes, self.vnodes)
+        return nodes
+
+    def owns(self, user: str) -> bool:
+        """True if this node is responsible for checking user"""
+        return self.ring.owner(user) == self.node_id
+
+    def acquire(self, user: str, take_over: str = None) -> bool:
+        """
+        Takes the recording lease on user unless a live node holds it. A
+        lease of node take_over (the previous run of this node, whose
+        recorder is adopted) is taken even before it expires.
+        """
+        now = time.time()
+        cursor = self._transaction([(
+            "INSERT INTO leases (user, node_id, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (user) DO UPDATE SET node_id = excluded.node_id, "
+            "expires_at = excluded.expires_at "
+            "WHERE leases.node_id = excluded.node_id OR leases.expires_at < ? "
+            "OR leases.node_id = ?",
+            (user, self.node_id, now + self.lease_ttl, now, take_over)
+        )])
+        if cursor.rowcount:
+            self.held.add(user)
+            return True
+        return False
+
+    def release(self, user: str):
+        self.held.discard(user)
+        self._transaction([(
+            "DELETE FROM leases WHERE user = ? AND node_id = ?", (user, self.node_id)
+        )])
+
+    def owned(self, users) -> list:
+        return [u for u in users if self.owns(u)]
+
+    def run(self, stop_event: Event = None):
+        """Background heartbeat, keeps membership and leases alive"""
+        logger.info(f"🧩 Sharding as node {self.node_id}")
+        stop_event = stop_event or Event()
+        while not stop_event.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Shard heartbeat error: {e}")
+
+        # Leave cleanly so the survivors take over right away
+        try:
+            self._transaction([
+                ("DELETE FROM leases WHERE node_id = ?", (self.node_id,)),
+                ("DELETE FROM nodes WHERE node_id = ?", (self.node_id,)),
+            ])
+        except sqlite3.Error as e:
+            logger.error(f"❌ Shard leave error: {e}")
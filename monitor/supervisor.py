@@ -0,0 +1,247 @@
+"""
+One supervisor for every recorder subprocess.
+
+A single thread waits on all recorders at once: their event and output
+pipes (see utils.events.RecorderChannel) and, on Linux, a pidfd per
+process that becomes readable when it exits. Elsewhere exits are found
+by polling every poll_interval, and so are the events of a recorder
+without pipes (adopted after a restart) that has read_events(). Events
+are handed to on_event on the supervisor thread, so it must be quick; the handling of an exit runs
+on a small worker pool and may be followed by a restart, as allowed by
+the recording's RestartPolicy.
+"""
+
+import logging
+import os
+import selectors
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Event, Lock
+
+logger = logging.getLogger(__name__)
+
+RESTART_MODES = ('never', 'on-failure', 'always')
+
+
+@dataclass
+class RestartPolicy:
+    mode: str = 'on-failure'  # never, on-failure (non-zero exit) or always
+    max_restarts: int = 3  # within window seconds, then the recording is given up
+    window: float = 600
+    delay: float = 5  # seconds before a restart
+
+    def __post_init__(self):
+        if self.mode not in RESTART_MODES:
+            raise ValueError(f"Unknown restart mode {self.mode!r}, expected one of {RESTART_MODES}")
+
+    @classmethod
+    def from_config(cls, settings: dict):
+        """Build from the 'restart' part of the 'supervisor' section of config.json"""
+        return cls(
+            mode=settings.get('mode', 'on-failure'),
+            max_restarts=settings.get('max_restarts', 3),
+            window=settings.get('window', 600),
+            delay=settings.get('delay', 5),
+        )
+
+    def allows(self, returncode: int, restarts: deque, now: float) -> bool:
+        if self.mode == 'never' or (self.mode == 'on-failure' and returncode == 0):
+            return False
+        while restarts and restarts[0] < now - self.window:
+            restarts.popleft()
+        return len(restarts) < self.max_restarts
+
+
+@dataclass
+class _Watched:
+    username: str
+    process: object  # Popen, or anything with pid and poll()
+    policy: RestartPolicy
+    channel: object = None
+    pidfd: int = None
+    exited: bool = False  # the pidfd fired
+    returncode: int = None
+
+
+class Supervisor:
+    """Watches all recorder processes from one thread"""
+
+    def __init__(self, on_event, on_exit, restart=None, policy=None, workers=4, poll_interval=5):
+        """
+        on_event(username, process, event) is called for every recorder
+        event, on_exit(username, process) once a recorder exited and
+        restart(username, process) when the policy allows a restart.
+        """
+        self.on_event = on_event
+        self.on_exit = on_exit
+        self.restart = restart
+        self.policy = policy or RestartPolicy()
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="supervisor")
+
+        self._selector = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._added = []  # watched by other threads, registered by run()
+        self._watched = {}  # pid -> _Watched
+        self._restarts = {}  # username -> deque of restart times
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    @classmethod
+    def from_config(cls, settings: dict, on_event, on_exit, restart=None):
+        """Build from the 'supervisor' section of config.json"""
+        return cls(
+            on_event, on_exit, restart,
+            policy=RestartPolicy.from_config(settings.get('restart', {})),
+            workers=settings.get('workers', 4),
+            poll_interval=settings.get('poll_interval', 5),
+        )
+
+    def watch(self, username: str, process, policy: RestartPolicy = None):
+        """Supervise a started recorder; its channel attribute, if any, is read too"""
+        watched = _Watched(username, process, policy or self.policy, getattr(process, 'channel', None))
+        if watched.channel:
+            stdout = getattr(process, 'stdout', None)
+            watched.channel.watch(stdout.fileno() if stdout else None)
+        try:
+            watched.pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            pass  # not Linux, or already gone: found by polling
+
+        with self._lock:
+            self._added.append(watched)
+        os.write(self._wakeup_w, b'\0')
+
+    def submit(self, fn, *args):
+        """Run fn on the supervisor's worker pool"""
+        return self.pool.submit(fn, *args)
+
+    @property
+    def watched(self) -> int:
+        with self._lock:
+            return len(self._watched) + len(self._added)
+
+    def _register(self):
+        with self._lock:
+            added, self._added = self._added, []
+        for watched in added:
+            self._watched[watched.process.pid] = watched
+            for fd in watched.channel.open_fds if watched.channel else []:
+                self._selector.register(fd, selectors.EVENT_READ, watched)
+            if watched.pidfd is not None:
+                self._selector.register(watched.pidfd, selectors.EVENT_READ, watched)
+
+    def _handle(self, watched: _Watched, events):
+        for event in events:
+            try:
+                self.on_event(watched.username, watched.process, event)
+            except Exception as e:
+                logger.error(f"❌ Event handler error for {watched.username}: {e}")
+
+    def _read(self, watched: _Watched, fd: int):
+        self._handle(watched, watched.channel.read(fd))
+        if fd not in watched.channel.open_fds:
+            self._selector.unregister(fd)
+
+    def _read_polled(self, watched: _Watched):
+        """Events of a recorder without pipes, if it can tell them"""
+        read_events = getattr(watched.process, 'read_events', None)
+        if watched.channel is None and read_events:
+            self._handle(watched, read_events())
+
+    def _drop_fd(self, fd: int):
+        """Stop watching fd after it failed, so it can't fail every iteration"""
+        try:
+            self._selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def _finish(self, watched: _Watched):
+        """The process exited: drain its pipes and hand it to the pool"""
+        del self._watched[watched.process.pid]
+        if watched.pidfd is not None:
+            self._selector.unregister(watched.pidfd)
+            os.close(watched.pidfd)
+
+        if watched.channel:
+            # What the recorder wrote last may still be in the pipes
+            try:
+                for fd in watched.channel.open_fds:
+                    self._read(watched, fd)
+            except Exception as e:
+                logger.error(f"❌ Could not drain the pipes of {watched.username}: {e}")
+            for fd in watched.channel.open_fds:
+                self._drop_fd(fd)  # kept open by a child of the recorder
+            watched.channel.close()
+        else:
+            try:
+                self._read_polled(watched)
+            except Exception as e:
+                logger.error(f"❌ Could not read the last events of {watched.username}: {e}")
+
+        self.pool.submit(self._exited, watched)
+
+    def _exited(self, watched: _Watched):
+        username, process = watched.username, watched.process
+        try:
+            self.on_exit(username, process)
+        except Exception as e:
+            logger.error(f"❌ Exit handler error for {username}: {e}")
+
+        now = time.time()
+        restarts = self._restarts.setdefault(username, deque())
+        if not self.restart or not watched.policy.allows(watched.returncode, restarts, now):
+            return
+
+        restarts.append(now)
+        logger.info(f"🔁 Restarting recorder of {username} in {watched.policy.delay}s "
+                    f"(exit code {watched.returncode}, restart {len(restarts)}/{watched.policy.max_restarts})")
+        time.sleep(watched.policy.delay)
+        try:
+            self.restart(username, process)
+        except Exception as e:
+            logger.error(f"❌ Restart error for {username}: {e}")
+
+    def run(self, stop_event: Event = None):
+        """Supervisor loop"""
+        logger.info("👁️ Supervisor started")
+        stop_event = stop_event or Event()
+        next_poll = time.time() + self.poll_interval
+        while not stop_event.is_set():
+            for key, _ in self._selector.select(timeout=max(0, next_poll - time.time())):
+                try:
+                    if key.fd == self._wakeup_r:
+                        try:
+                            os.read(self._wakeup_r, 4096)
+                        except BlockingIOError:
+                            pass
+                        self._register()
+                    elif key.fd == key.data.pidfd:
+                        key.data.exited = True
+                    elif key.data.process.pid in self._watched:
+                        self._read(key.data, key.fd)
+                except Exception as e:
+                    # One bad pipe must not stop the supervision of every recorder
+                    logger.error(f"❌ Supervisor error on fd {key.fd}: {e}")
+                    if key.fd != self._wakeup_r:
+                        self._drop_fd(key.fd)
+
+            # A fired pidfd means the process exited (poll() reaps it),
+            # processes without one are polled
+            polling = time.time() >= next_poll
+            if polling:
+                next_poll = time.time() + self.poll_interval
+            for watched in list(self._watched.values()):
+                if watched.exited or polling:
+                    try:
+                        if polling:
+                            self._read_polled(watched)
+                        watched.returncode = watched.process.poll()
+                        if watched.returncode is not None:
+                            self._finish(watched)
+                    except Exception as e:
+                        logger.error(f"❌ Supervisor error for {watched.username}: {e}")
+                        self._watched.pop(watched.process.pid, None)
@@ -2,19 +2,25 @@
 """
 Wrapper to bypass tiktok-live-recorder main.py issues
 """
+import argparse
 import sys
 import os
 import multiprocessing
+import time
+
+started_at = time.perf_counter()
 
 # Add recorder to path
 recorder_path = os.path.join(os.path.dirname(__file__), 'tiktok-live-recorder', 'src')
 sys.path.insert(0, recorder_path)
 
-def record_user(user, output, interval):
+def record_user(user, output, interval, stream_format="flv", catalog_path=None,
+                room_id=None, detected_at=None, proxy=None, min_free_bytes=0):
     """Record a user's live stream"""
     from core.tiktok_recorder import TikTokRecorder
-    from utils.enums import Mode
+    from utils.enums import Mode, StreamFormat
     from utils.utils import read_cookies
+    from utils.startup import log_cold_start
 
     # Read cookies
     try:
@@ -22,31 +28,54 @@ def record_user(user, output, interval):
     except:
         cookies = {}
 
+    log_cold_start(started_at)
+
     # Create recorder
     recorder = TikTokRecorder(
         url=None,
         user=user,
-        room_id=None,
+        room_id=room_id,
         mode=Mode.AUTOMATIC,
         automatic_interval=interval,
         cookies=cookies,
-        proxy=None,
+        proxy=proxy,
         output=output,
         duration=None,
-        use_telegram=False
+        use_telegram=False,
+        stream_format=StreamFormat(stream_format),
+        catalog_path=catalog_path,
+        detected_at=detected_at,
+        min_free_bytes=min_free_bytes
     )
 
     # Run recorder
     recorder.run()
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: record_wrapper.py <username> <output_dir> <interval>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Record a TikTok user's live stream")
+    parser.add_argument("username")
+    parser.add_argument("output_dir", help="output directory, or several comma-separated")
+    parser.add_argument("interval", type=int, help="check interval in minutes")
+    parser.add_argument("format", nargs="?", default="flv", choices=["flv", "hls"])
+    parser.add_argument("--catalog", help="SQLite recording catalog to register in")
+    parser.add_argument("--metrics-dir", help="directory to export metrics snapshots to")
+    parser.add_argument("--room-id", help="room id the caller already resolved")
+    parser.add_argument("--detected-at", type=float, help="epoch when the live was detected")
+    parser.add_argument("--proxy", help="proxy url, or several comma-separated for a pool")
+    parser.add_argument("--min-free-bytes", type=int, default=0,
+                        help="leave out output directories with less free space")
+    args = parser.parse_args()
+
+    # Continue the bot's go-live trace, if any
+    from utils import tracing
+    if tracing.resume_from_env():
+        tracing.event("recorder_process_started", user=args.username)
 
-    username = sys.argv[1]
-    output_dir = sys.argv[2]
-    interval = int(sys.argv[3])
+    if args.metrics_dir:
+        from utils.metrics import TextfileExporter
+        TextfileExporter(args.metrics_dir).start()
 
     multiprocessing.freeze_support()
-    record_user(username, output_dir, interval)
+    output_dirs = [d for d in args.output_dir.split(",") if d]
+    record_user(args.username, output_dirs, args.interval, args.format, args.catalog,
+                args.room_id, args.detected_at, args.proxy, args.min_free_bytes)
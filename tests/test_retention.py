@@ -0,0 +1,68 @@
+import os
+import shutil
+import sys
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'tiktok-live-recorder', 'src'))
+sys.path.insert(0, ROOT)
+
+from monitor.retention import RetentionManager  # noqa: E402
+from utils.catalog import RecordingCatalog  # noqa: E402
+from utils.enums import UploadState  # noqa: E402
+
+MB = 1024 * 1024
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+
+def disk_of(directory, total):
+    """disk_usage of a disk holding only the files of directory"""
+    def disk_usage(path):
+        used = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+        return DiskUsage(total, used, total - used)
+    return disk_usage
+
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_backfilled_recordings_are_evicted(tmp_path, monkeypatch):
+    recordings = tmp_path / 'recordings'
+    recordings.mkdir()
+    for day in range(1, 6):
+        write(recordings / f'TK_user_2024.01.0{day}_12-00-00_flv.mp4', 2 * MB)
+    catalog = RecordingCatalog(str(tmp_path / 'catalog.db'))
+    assert catalog.backfill(str(recordings)) == 5
+
+    # 10MB used of 11MB, down to 6.6MB means evicting the 2 oldest
+    monkeypatch.setattr(shutil, 'disk_usage', disk_of(recordings, 11 * MB))
+    retention = RetentionManager(catalog, [str(recordings)], high_watermark=0.9,
+                                 low_watermark=0.6, min_free_bytes=0)
+
+    assert retention.enforce() == 4 * MB
+    assert sorted(os.listdir(recordings)) == [
+        f'TK_user_2024.01.0{day}_12-00-00_flv.mp4' for day in range(3, 6)
+    ]
+    assert catalog.count() == 3
+
+
+def test_recordings_waiting_for_upload_are_kept(tmp_path, monkeypatch):
+    recordings = tmp_path / 'recordings'
+    recordings.mkdir()
+    catalog = RecordingCatalog(str(tmp_path / 'catalog.db'))
+    for day in range(1, 6):
+        path = recordings / f'TK_user_2024.01.0{day}_12-00-00_flv.mp4'
+        write(path, 2 * MB)
+        recording_id = catalog.register('user', None, str(path))
+        catalog.finish(recording_id, str(path))
+    catalog.set_upload_state(str(recordings / 'TK_user_2024.01.05_12-00-00_flv.mp4'),
+                             UploadState.UPLOADED)
+
+    monkeypatch.setattr(shutil, 'disk_usage', disk_of(recordings, 11 * MB))
+    retention = RetentionManager(catalog, [str(recordings)], high_watermark=0.9,
+                                 low_watermark=0.6, min_free_bytes=0)
+
+    assert retention.enforce() == 2 * MB
+    assert len(os.listdir(recordings)) == 4
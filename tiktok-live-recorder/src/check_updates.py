@@ -1,9 +1,13 @@
 import os
+import time
 from pathlib import Path
+from threading import Thread
 import requests
 import zipfile
 import shutil
 
+from utils.startup import UPDATE_CHECK_TTL
+
 URL = "https://raw.githubusercontent.com/Michele0303/tiktok-live-recorder/main/src/utils/enums.py"
 URL_REPO = (
     "https://github.com/Michele0303/tiktok-live-recorder/archive/refs/heads/main.zip"
@@ -50,40 +54,70 @@ def download_file(url: str, file_name: str) -> None:
         print("Error downloading the file.")
 
 
-def check_updates() -> bool:
+def current_version() -> str:
+    from utils.enums import Info
+
+    return Info.__str__(Info.VERSION)
+
+
+def find_update() -> str | None:
     """
-    Check if there is a new version available and update if necessary.
+    Check if there is a new version available, without installing it.
 
     Returns:
-        bool: True if the update was successful, False otherwise.
+        str | None: The new version, or None if this one is the latest.
+
+    Raises:
+        OSError: If the latest version could not be read.
     """
     download_file(URL, FILE_TEMP)
 
     if not check_file(FILE_TEMP):
         delete_tmp_file()
-        print("The temporary file does not exist.")
-        return False
+        raise OSError("The temporary file does not exist.")
 
     try:
         from enums_temp import Info
-        from utils.enums import Info as InfoOld
     except ImportError:
-        print("Error importing the file or missing module.")
         delete_tmp_file()
-        return False
+        raise OSError("Error importing the file or missing module.")
 
-    if float(Info.__str__(Info.VERSION)) != float(InfoOld.__str__(InfoOld.VERSION)):
-        print(
-            f"Current version: {InfoOld.__str__(InfoOld.VERSION)}\nNew version available: {Info.__str__(Info.VERSION)}"
-        )
-        print("\nNew features:")
-        for feature in Info.NEW_FEATURES:
-            print("*", feature)
-    else:
-        delete_tmp_file()
-        # print("No updates available.")
+    delete_tmp_file()
+    if float(Info.__str__(Info.VERSION)) == float(current_version()):
+        return None
+
+    print(
+        f"Current version: {current_version()}\nNew version available: {Info.__str__(Info.VERSION)}"
+    )
+    print("\nNew features:")
+    for feature in Info.NEW_FEATURES:
+        print("*", feature)
+    return Info.__str__(Info.VERSION)
+
+
+def check_updates() -> bool:
+    """
+    Check if there is a new version available and update if necessary.
+
+    Returns:
+        bool: True if the update was successful, False otherwise.
+    """
+    try:
+        if find_update() is None:
+            return False
+    except OSError as ex:
+        print(ex)
         return False
 
+    install_update()
+    return True
+
+
+def install_update() -> None:
+    """
+    Download the latest version and copy it over the source tree. Only
+    safe while nothing else of the recorder runs.
+    """
     download_file(URL_REPO, FILE_NAME_UPDATE)
 
     dir_path = Path(__file__).parent
@@ -117,18 +151,75 @@ def check_updates() -> bool:
                     sub_destination.parent.mkdir(parents=True, exist_ok=True)
                     shutil.copy2(sub_item, sub_destination)
 
-    # Delete the temporary files and folders
+    # Delete the temporary folder and archive
     shutil.rmtree(temp_update_dir)
-    try:
-        Path(FILE_TEMP).unlink()
-    except Exception as e:
-        print(f"Failed to remove the temporary file {FILE_TEMP}: {e}")
-
-    delete_tmp_file()
 
     try:
         Path(FILE_NAME_UPDATE).unlink()
     except Exception as e:
         print(f"Failed to remove the temporary file {FILE_NAME_UPDATE}: {e}")
 
+
+def install_pending_update() -> bool:
+    """
+    Install the update a background check found during a previous run.
+    Call it at startup, before the recorder imports anything else.
+
+    Returns:
+        bool: True if an update was installed and the program must restart.
+    """
+    from utils.logger_manager import logger
+    from utils.startup import read_stamp, update_stamp
+
+    version = read_stamp().get("update_available")
+    if not version:
+        return False
+    if version == current_version():
+        update_stamp(update_available=None)  # installed by hand meanwhile
+        return False
+
+    logger.info(f"Installing version {version}...\n")
+    try:
+        install_update()
+    except Exception as ex:
+        logger.error(f"Update failed: {ex}")
+        return False
+    update_stamp(update_available=None)
     return True
+
+
+def check_updates_in_background(ttl: float = UPDATE_CHECK_TTL) -> Thread | None:
+    """
+    Look for a new version in a daemon thread, unless a check succeeded
+    less than ttl hours ago. The source tree is not touched while the
+    recorder runs: a new version is installed by install_pending_update()
+    at the next start.
+
+    Args:
+        ttl (float): Minimum hours between two update checks.
+
+    Returns:
+        Thread | None: The running check, or None if it was skipped.
+    """
+    from utils.logger_manager import logger
+    from utils.startup import read_stamp, update_stamp
+
+    if time.time() - read_stamp().get("update_checked_at", 0) < ttl * 3600:
+        logger.info("Update check skipped, last one is recent\n")
+        return None
+
+    def run():
+        try:
+            version = find_update()
+        except Exception as ex:
+            logger.error(f"Update check failed: {ex}")
+            return  # retried at the next start
+        update_stamp(update_checked_at=time.time(), update_available=version)
+        if version:
+            logger.warning(
+                f"Version {version} is available, it will be installed at the next start"
+            )
+
+    thread = Thread(target=run, name="update_check", daemon=True)
+    thread.start()
+    return thread
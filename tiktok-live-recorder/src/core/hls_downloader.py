@@ -0,0 +1,179 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.parse import urljoin
+
+from requests import RequestException
+
+from utils.logger_manager import logger
+
+
+class HLSDownloader:
+    """
+    Pulls an HLS live stream from its m3u8 playlist.
+
+    Segments are fetched concurrently inside a small prefetch window and
+    yielded strictly in playlist order. A segment that still fails after
+    its retries is skipped, so a network drop costs one segment instead
+    of a reconnect gap.
+    """
+
+    # segments behind the live edge to start from on the first playlist read
+    LIVE_EDGE_OFFSET = 3
+
+    def __init__(
+        self,
+        session,
+        playlist_url: str,
+        workers: int = 4,
+        prefetch: int = 8,
+        segment_retries: int = 3,
+        timeout: int = 10,
+    ):
+        self.session = session
+        self.playlist_url = playlist_url
+        self.workers = workers
+        self.prefetch = max(prefetch, workers)
+        self.segment_retries = segment_retries
+        self.timeout = timeout
+
+    def _get(self, url: str):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def _resolve_media_playlist(self) -> None:
+        """
+        If the url points to a master playlist, follow the variant
+        with the highest bandwidth.
+        """
+        content = self._get(self.playlist_url).text
+        if "#EXT-X-STREAM-INF" not in content:
+            return
+
+        best_bandwidth = -1
+        best_uri = None
+        lines = content.splitlines()
+        for i, line in enumerate(lines):
+            if not line.startswith("#EXT-X-STREAM-INF"):
+                continue
+
+            bandwidth = 0
+            for attribute in line.split(":", 1)[1].split(","):
+                if attribute.startswith("BANDWIDTH="):
+                    bandwidth = int(attribute.split("=", 1)[1])
+
+            uri = next(
+                (u.strip() for u in lines[i + 1 :] if u.strip() and u[0] != "#"),
+                None,
+            )
+            if uri and bandwidth > best_bandwidth:
+                best_bandwidth = bandwidth
+                best_uri = uri
+
+        if best_uri:
+            self.playlist_url = urljoin(self.playlist_url, best_uri)
+
+    def _read_playlist(self) -> tuple[int, list[str], float, bool]:
+        """
+        Returns media sequence, segment urls, target duration
+        and whether the playlist has ended.
+        """
+        content = self._get(self.playlist_url).text
+
+        media_sequence = 0
+        target_duration = 2.0
+        ended = False
+        segments = []
+
+        for line in content.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                media_sequence = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-TARGETDURATION:"):
+                target_duration = float(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-ENDLIST"):
+                ended = True
+            elif not line.startswith("#"):
+                segments.append(urljoin(self.playlist_url, line))
+
+        return media_sequence, segments, target_duration, ended
+
+    def _fetch_segment(self, url: str) -> bytes | None:
+        for attempt in range(1, self.segment_retries + 1):
+            try:
+                return self._get(url).content
+            except (RequestException, HTTPException, ConnectionError) as ex:
+                logger.error(
+                    f"Segment fetch failed ({attempt}/{self.segment_retries}): {ex}"
+                )
+                time.sleep(0.5 * attempt)
+
+        logger.error(f"Skipping segment after {self.segment_retries} attempts")
+        return None
+
+    def iter_segments(self):
+        """Generator that yields the stream segments in order."""
+        self._resolve_media_playlist()
+
+        pending = deque()
+        next_seq = None
+        playlist_end = 0
+        playlist_errors = 0
+        last_refresh = 0.0
+        refresh_interval = 1.0
+        ended = False
+        segments = []
+        media_sequence = 0
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                all_scheduled = next_seq is not None and next_seq >= playlist_end
+                refresh_due = time.time() - last_refresh >= refresh_interval
+                if not ended and (next_seq is None or (all_scheduled and refresh_due)):
+                    try:
+                        media_sequence, segments, target, ended = self._read_playlist()
+                        playlist_errors = 0
+                    except (RequestException, HTTPException) as ex:
+                        playlist_errors += 1
+                        if playlist_errors > self.segment_retries:
+                            raise ConnectionError(f"Playlist unavailable: {ex}")
+                        time.sleep(refresh_interval)
+                        continue
+
+                    last_refresh = time.time()
+                    refresh_interval = max(target / 2, 0.5)
+                    playlist_end = media_sequence + len(segments)
+
+                    if next_seq is None:
+                        next_seq = max(
+                            media_sequence, playlist_end - self.LIVE_EDGE_OFFSET
+                        )
+                    elif next_seq < media_sequence:
+                        logger.error(
+                            f"Fell behind the live edge, "
+                            f"lost {media_sequence - next_seq} segments"
+                        )
+                        next_seq = media_sequence
+
+                while len(pending) < self.prefetch and next_seq < playlist_end:
+                    url = segments[next_seq - media_sequence]
+                    pending.append(pool.submit(self._fetch_segment, url))
+                    next_seq += 1
+
+                if pending:
+                    data = pending.popleft().result()
+                    if data:
+                        yield data
+                    continue
+
+                if ended:
+                    return
+
+                time.sleep(max(refresh_interval - (time.time() - last_refresh), 0))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,11 @@
 import json
+import os
 import re
+import time
 
+from core.hls_downloader import HLSDownloader
 from http_utils.http_client import HttpClient
-from utils.enums import StatusCode, TikTokError
+from utils.enums import StatusCode, StreamFormat, TikTokError
 from utils.logger_manager import logger
 from utils.custom_exceptions import (
     UserLiveError,
@@ -10,17 +13,51 @@ from utils.custom_exceptions import (
     LiveNotFound,
 )
 
+# Service base urls; the environment can point them elsewhere, e.g. at
+# the mock server of bench/mock_tiktok.py
+SERVICE_URLS = {
+    "TIKREC_TIKTOK_URL": "https://www.tiktok.com",
+    "TIKREC_WEBCAST_URL": "https://webcast.tiktok.com",
+    "TIKREC_SIGN_URL": "https://tikrec.com",
+}
+
+# Accounts returned per following-list request (the web client's maximum)
+FOLLOWING_PAGE_SIZE = 30
+
+# Seconds between full walks of the following list, which detect unfollows
+FOLLOWING_FULL_SYNC_INTERVAL = 60 * 60
+
+# Room ids checked per check_alive request
+CHECK_ALIVE_BATCH = 50
+
+# Any syntactically valid token makes TikTok hand out a fresh msToken cookie
+MS_TOKEN_SEED = "GphHoLvRR4QxA5AWVwDkrs3AbumoK5H8toE8LVHtj6cce3ToGdXhMfvDWzOXG-0GXUWoaGVHrwGNA4k_NnjuFFnHgv2S5eMjsvtkAhwMPa13xLmvP7tumx0KreFjPwTNnOj-BvAkPdO5Zrev3hoFBD9lHVo="
+
+
+def service_url(name: str) -> str:
+    """
+    Base url of a service, see SERVICE_URLS.
+    """
+    return os.environ.get(name, "").rstrip("/") or SERVICE_URLS[name]
+
 
 class TikTokAPI:
     def __init__(self, proxy, cookies):
-        self.BASE_URL = "https://www.tiktok.com"
-        self.WEBCAST_URL = "https://webcast.tiktok.com"
-        self.API_URL = "https://www.tiktok.com/api-live/user/room/"
+        self.BASE_URL = service_url("TIKREC_TIKTOK_URL")
+        self.WEBCAST_URL = service_url("TIKREC_WEBCAST_URL")
+        self.API_URL = f"{self.BASE_URL}/api-live/user/room/"
         self.EULER_API = "https://tiktok.eulerstream.com"
-        self.TIKREC_API = "https://tikrec.com"
+        self.TIKREC_API = service_url("TIKREC_SIGN_URL")
 
-        self.http_client = HttpClient(proxy, cookies).req
-        self._http_client_stream = HttpClient(proxy, cookies).req_stream
+        client = HttpClient(proxy, cookies)
+        self.http_client = client.req
+        self._http_client_stream = client.req_stream
+        self.proxy_pool = client.proxy_pool
+
+        # Following list cache, refreshed incrementally by sync_followers
+        self.followers = set()
+        self._followers_synced_at = None
+        self._ms_token = None
 
     def _is_authenticated(self) -> bool:
         response = self.http_client.get(f"{self.BASE_URL}/foryou")
@@ -54,6 +91,27 @@ class TikTokAPI:
 
         return data["data"][0].get("alive", False)
 
+    def are_rooms_alive(self, room_ids: list[str]) -> dict[str, bool]:
+        """
+        Checks many rooms at once, CHECK_ALIVE_BATCH ids per request.
+        Returns room_id -> alive.
+        """
+        alive = {}
+        for i in range(0, len(room_ids), CHECK_ALIVE_BATCH):
+            batch = room_ids[i : i + CHECK_ALIVE_BATCH]
+            data = self.http_client.get(
+                f"{self.WEBCAST_URL}/webcast/room/check_alive/"
+                f"?aid=1988&region=CH&room_ids={','.join(batch)}&user_is_login=true"
+            ).json()
+
+            for position, room in enumerate(data.get("data") or []):
+                room_id = room.get("room_id_str") or str(room.get("room_id") or "")
+                if not room_id and position < len(batch):
+                    room_id = batch[position]
+                alive[room_id] = room.get("alive", False)
+
+        return {room_id: alive.get(room_id, False) for room_id in room_ids}
+
     def get_sec_uid(self):
         """
         Returns the sec_uid of the authenticated user.
@@ -156,73 +214,117 @@ class TikTokAPI:
         data = response.json()
         return (data.get("data") or {}).get("user", {}).get("roomId")
 
-    def get_followers_list(self, sec_uid) -> list:
+    def _following_list_url(self, sec_uid: str, cursor: int, ms_token: str) -> str:
+        return (
+            f"{self.BASE_URL}/api/user/list/?"
+            "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web"
+            "&browser_language=it-IT&browser_name=Mozilla&browser_online=true"
+            "&browser_platform=Linux%20x86_64&browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&channel=tiktok_web&"
+            f"cookie_enabled=true&count={FOLLOWING_PAGE_SIZE}&data_collection_enabled=true&device_id=7506194516308166166"
+            "&device_platform=web_pc&focus_state=true&from_page=user&history_len=3&"
+            f"is_fullscreen=false&is_page_visible=true&maxCursor={cursor}&minCursor={cursor}&"
+            "odinId=7246312836442604570&os=linux&priority_region=IT&referer=&"
+            "region=IT&scene=21&screen_height=1080&screen_width=1920"
+            "&tz_name=Europe%2FRome&user_is_login=true&"
+            f"secUid={sec_uid}&verifyFp=verify_mh4yf0uq_rdjp1Xwt_OoTk_4Jrf_AS8H_sp31opbnJFre&"
+            f"webcast_language=it-IT&msToken={ms_token}&X-Bogus=&X-Gnarly="
+        )
+
+    def _fetch_following_page(self, sec_uid: str, cursor: int) -> dict:
         """
-        Returns all followers for the authenticated user by paginating
+        Fetches one page of the following list, reusing the msToken of
+        previous requests and bootstrapping a new one only when needed.
         """
-        followers = []
-        cursor = 0
-        has_more = True
-
-        ms_token = self.http_client.get(
-            f"{self.BASE_URL}/api/user/list/?"
-            "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web&"
-            "browser_language=it-IT&browser_name=Mozilla&browser_online=true&"
-            "browser_platform=Linux%20x86_64&"
-            "browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&"
-            "channel=tiktok_web&cookie_enabled=true&count=5&data_collection_enabled=true&"
-            "device_id=7506194516308166166&device_platform=web_pc&focus_state=true&"
-            "from_page=user&history_len=3&is_fullscreen=false&is_page_visible=true&"
-            "maxCursor=0&minCursor=0&odinId=7246312836442604570&os=linux&priority_region=IT&"
-            "referer=&region=IT&root_referer=https%3A%2F%2Fwww.tiktok.com%2Flive&scene=21&"
-            "screen_height=1080&screen_width=1920&tz_name=Europe%2FRome&user_is_login=true&"
-            "verifyFp=verify_mh4yf0uq_rdjp1Xwt_OoTk_4Jrf_AS8H_sp31opbnJFre&webcast_language=it-IT&"
-            "msToken=GphHoLvRR4QxA5AWVwDkrs3AbumoK5H8toE8LVHtj6cce3ToGdXhMfvDWzOXG-0GXUWoaGVHrwGNA4k_NnjuFFnHgv2S5eMjsvtkAhwMPa13xLmvP7tumx0KreFjPwTNnOj-BvAkPdO5Zrev3hoFBD9lHVo=&X-Bogus=&X-Gnarly="
-        ).cookies["msToken"]
-
-        while has_more:
-            url = (
-                "https://www.tiktok.com/api/user/list/?"
-                "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web"
-                "&browser_language=it-IT&browser_name=Mozilla&browser_online=true"
-                "&browser_platform=Linux%20x86_64&browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&channel=tiktok_web&"
-                "cookie_enabled=true&count=5&data_collection_enabled=true&device_id=7506194516308166166"
-                "&device_platform=web_pc&focus_state=true&from_page=user&history_len=3&"
-                f"is_fullscreen=false&is_page_visible=true&maxCursor={cursor}&minCursor={cursor}&"
-                "odinId=7246312836442604570&os=linux&priority_region=IT&referer=&"
-                "region=IT&scene=21&screen_height=1080&screen_width=1920"
-                "&tz_name=Europe%2FRome&user_is_login=true&"
-                f"secUid={sec_uid}&verifyFp=verify_mh4yf0uq_rdjp1Xwt_OoTk_4Jrf_AS8H_sp31opbnJFre&"
-                f"webcast_language=it-IT&msToken={ms_token}&X-Bogus=&X-Gnarly="
+        for _ in range(2):
+            if self._ms_token is None:
+                self._ms_token = self.http_client.get(
+                    self._following_list_url(sec_uid, 0, MS_TOKEN_SEED)
+                ).cookies["msToken"]
+
+            response = self.http_client.get(
+                self._following_list_url(sec_uid, cursor, self._ms_token)
             )
+            if response.status_code == StatusCode.OK and response.text:
+                # TikTok rotates the token on every response
+                self._ms_token = response.cookies.get("msToken") or self._ms_token
+                return response.json()
 
-            response = self.http_client.get(url)
+            # Expired token: fetch a fresh one and try once more
+            self._ms_token = None
 
-            if response.status_code != StatusCode.OK:
-                raise TikTokRecorderError("Failed to retrieve followers list.")
+        raise TikTokRecorderError("Failed to retrieve followers list.")
 
-            data = response.json()
-            user_list = data.get("userList", [])
+    def sync_followers(self, sec_uid) -> tuple[set, set]:
+        """
+        Refreshes the cached following list and returns the (added, removed)
+        usernames since the previous call.
 
-            for user in user_list:
-                username = user.get("user", {}).get("uniqueId")
-                if username:
-                    followers.append(username)
+        The list comes newest first, so between full syncs paging stops at
+        the first user already known. Unfollows are only noticed by the full
+        sync done every FOLLOWING_FULL_SYNC_INTERVAL seconds.
+        """
+        now = time.time()
+        full = (
+            self._followers_synced_at is None
+            or now - self._followers_synced_at >= FOLLOWING_FULL_SYNC_INTERVAL
+        )
 
-            has_more = data.get("hasMore", False)
-            new_cursor = data.get("minCursor", 0)
+        fetched = []
+        cursor = 0
+        while True:
+            data = self._fetch_following_page(sec_uid, cursor)
+            page = [
+                user.get("user", {}).get("uniqueId")
+                for user in data.get("userList", [])
+            ]
+            page = [username for username in page if username]
+
+            if not full:
+                known = next(
+                    (i for i, u in enumerate(page) if u in self.followers), None
+                )
+                if known is not None:
+                    fetched.extend(page[:known])
+                    break
+
+            fetched.extend(page)
 
-            if new_cursor == cursor:
+            new_cursor = data.get("minCursor", 0)
+            if not data.get("hasMore", False) or new_cursor == cursor:
                 break
-
             cursor = new_cursor
 
-        if not followers:
+        added = set(fetched) - self.followers
+        if full:
+            removed = self.followers - set(fetched)
+            self.followers = set(fetched)
+            self._followers_synced_at = now
+        else:
+            removed = set()
+            self.followers |= added
+
+        if added or removed:
+            logger.info(
+                f"Following list: {len(added)} added, {len(removed)} removed "
+                f"({len(self.followers)} total)"
+            )
+
+        return added, removed
+
+    def get_followers_list(self, sec_uid) -> list:
+        """
+        Returns all followers for the authenticated user (see sync_followers)
+        """
+        self.sync_followers(sec_uid)
+
+        if not self.followers:
             raise TikTokRecorderError("Followers list is empty.")
 
-        return followers
+        return list(self.followers)
 
-    def get_live_url(self, room_id: str) -> str | None:
+    def get_live_url(
+        self, room_id: str, stream_format: StreamFormat = StreamFormat.FLV
+    ) -> str | None:
         """
         Return the cdn (flv or m3u8) of the streaming
         """
@@ -244,6 +346,16 @@ class TikTokAPI:
             logger.warning(
                 "No SDK stream data found. Falling back to legacy URLs. Consider contacting the developer to update the code."
             )
+            if stream_format == StreamFormat.HLS:
+                hls_map = stream_url.get("hls_pull_url_map", {})
+                return (
+                    hls_map.get("FULL_HD1")
+                    or hls_map.get("HD1")
+                    or hls_map.get("SD2")
+                    or hls_map.get("SD1")
+                    or stream_url.get("hls_pull_url", "")
+                )
+
             return (
                 stream_url.get("flv_pull_url", {}).get("FULL_HD1")
                 or stream_url.get("flv_pull_url", {}).get("HD1")
@@ -266,18 +378,18 @@ class TikTokAPI:
         level_map = {q["sdk_key"]: q["level"] for q in qualities}
 
         best_level = -1
-        best_flv = None
+        best_url = None
         for sdk_key, entry in sdk_data.items():
             level = level_map.get(sdk_key, -1)
             stream_main = entry.get("main", {})
-            if level > best_level:
+            if level > best_level and stream_main.get(stream_format.value):
                 best_level = level
-                best_flv = stream_main.get("flv")
+                best_url = stream_main.get(stream_format.value)
 
-        if not best_flv and data.get("status_code") == 4003110:
+        if not best_url and data.get("status_code") == 4003110:
             raise UserLiveError(TikTokError.LIVE_RESTRICTION)
 
-        return best_flv
+        return best_url
 
     def download_live_stream(self, live_url: str):
         """Generator that returns the live stream for a given room_id."""
@@ -285,3 +397,8 @@ class TikTokAPI:
         for chunk in stream.iter_content(chunk_size=4096):
             if chunk:
                 yield chunk
+
+    def download_live_stream_hls(self, live_url: str):
+        """Generator that returns the HLS segments of the live stream in order."""
+        downloader = HLSDownloader(self._http_client_stream, live_url)
+        yield from downloader.iter_segments()
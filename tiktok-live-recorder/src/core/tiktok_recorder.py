@@ -1,16 +1,55 @@
 import os
 import time
 from http.client import HTTPException
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Thread, local
 
 from requests import RequestException
 
 from core.tiktok_api import TikTokAPI
+from utils.catalog import RecordingCatalog
 from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+from utils.output_roots import OutputRouter
+from utils.retry import Backoff
+from utils.tracing import detach, event, span
 from utils.video_management import VideoManagement
-from upload.telegram import Telegram
-from utils.custom_exceptions import LiveNotFound, UserLiveError, TikTokRecorderError
-from utils.enums import Mode, Error, TimeOut, TikTokError
+from utils.events import PROGRESS_INTERVAL, emit
+from utils.flv_index import KeyframeIndex
+from utils.flv_parser import FlvTagParser
+from utils.custom_exceptions import (
+    IPBlockedByWAF,
+    LiveNotFound,
+    UserLiveError,
+    TikTokRecorderError,
+)
+from utils.enums import (
+    Mode,
+    Error,
+    RecordingStatus,
+    StreamFormat,
+    TimeOut,
+    TikTokError,
+)
+
+
+BYTES_RECEIVED = REGISTRY.counter(
+    "recording_bytes_received_total", "Stream bytes received.", ["user"]
+)
+BYTES_WRITTEN = REGISTRY.counter(
+    "recording_bytes_written_total", "Stream bytes written to disk.", ["user"]
+)
+TIME_TO_FIRST_BYTE = REGISTRY.histogram(
+    "go_live_time_to_first_byte_seconds",
+    "Time from live detection to the first byte of the stream.",
+    buckets=(1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60),
+)
+RECONNECTS = REGISTRY.counter(
+    "recording_reconnects_total", "Stream reconnections during a recording.", ["user"]
+)
+
+# Concurrent room id lookups in followers mode
+FOLLOWERS_LOOKUP_WORKERS = 8
 
 
 class TikTokRecorder:
@@ -26,9 +65,16 @@ class TikTokRecorder:
         output,
         duration,
         use_telegram,
+        stream_format=StreamFormat.FLV,
+        catalog_path=None,
+        detected_at=None,
+        min_free_bytes=0,
     ):
         # Setup TikTok API client
         self.tiktok = TikTokAPI(proxy=proxy, cookies=cookies)
+        self.cookies = cookies
+        self.proxy = proxy
+        self._lookup_local = local()
 
         # TikTok Data
         self.url = url
@@ -39,43 +85,57 @@ class TikTokRecorder:
         self.mode = mode
         self.automatic_interval = automatic_interval
         self.duration = duration
-        self.output = output
+        self.output = output[0] if isinstance(output, list) and output else output
+        self.stream_format = stream_format
+
+        # When the live was detected (epoch), to measure time to first byte
+        self.detected_at = detected_at
 
         # Upload Settings
         self.use_telegram = use_telegram
 
-        # Check if the user's country is blacklisted
-        self.check_country_blacklisted()
+        # Recording index shared with other processes (optional)
+        self.catalog = RecordingCatalog(catalog_path) if catalog_path else None
 
-        # Retrieve sec_uid if the mode is FOLLOWERS
-        if self.mode == Mode.FOLLOWERS:
-            self.sec_uid = self.tiktok.get_sec_uid()
-            if self.sec_uid is None:
-                raise TikTokRecorderError("Failed to retrieve sec_uid.")
+        # Several output roots: place each recording on the least busy one
+        self.output_router = None
+        if isinstance(output, list) and len(output) > 1:
+            self.output_router = OutputRouter(output, self.catalog, min_free_bytes)
 
-            logger.info("Followers mode activated\n")
-        else:
-            # Get live information based on the provided user data
-            if self.url:
-                self.user, self.room_id = self.tiktok.get_room_and_user_from_url(
-                    self.url
-                )
+        with span("recorder_init", mode=self.mode.name):
+            # Check if the user's country is blacklisted
+            self.check_country_blacklisted()
+
+            # Retrieve sec_uid if the mode is FOLLOWERS
+            if self.mode == Mode.FOLLOWERS:
+                self.sec_uid = self.tiktok.get_sec_uid()
+                if self.sec_uid is None:
+                    raise TikTokRecorderError("Failed to retrieve sec_uid.")
+
+                logger.info("Followers mode activated\n")
+            else:
+                # Get live information based on the provided user data
+                if self.url:
+                    self.user, self.room_id = self.tiktok.get_room_and_user_from_url(
+                        self.url
+                    )
 
-            if not self.user:
-                self.user = self.tiktok.get_user_from_room_id(self.room_id)
+                if not self.user:
+                    self.user = self.tiktok.get_user_from_room_id(self.room_id)
 
-            if not self.room_id:
-                self.room_id = self.tiktok.get_room_id_from_user(self.user)
+                if not self.room_id:
+                    self.room_id = self.tiktok.get_room_id_from_user(self.user)
 
-            logger.info(f"USERNAME: {self.user}" + ("\n" if not self.room_id else ""))
-            if self.room_id:
                 logger.info(
-                    f"ROOM_ID:  {self.room_id}"
-                    + ("\n" if not self.tiktok.is_room_alive(self.room_id) else "")
+                    f"USERNAME: {self.user}" + ("\n" if not self.room_id else "")
                 )
+                if self.room_id:
+                    logger.info(f"ROOM_ID:  {self.room_id}")
 
-        # If proxy is provided, set up the HTTP client without the proxy
-        if proxy:
+        # If a single proxy is provided (only needed to get past the login
+        # restriction), set up the HTTP client without the proxy. A proxy
+        # pool keeps spreading the API requests.
+        if proxy and self.tiktok.proxy_pool is None:
             self.tiktok = TikTokAPI(proxy=None, cookies=cookies)
 
     def run(self):
@@ -109,12 +169,20 @@ class TikTokRecorder:
         self.start_recording(self.user, self.room_id)
 
     def automatic_mode(self):
+        # The room_id resolved on init (or given by the caller) is still fresh
+        known_room_id = self.room_id is not None
+        backoff = Backoff("automatic_mode")
+
         while True:
             try:
-                self.room_id = self.tiktok.get_room_id_from_user(self.user)
+                if not known_room_id:
+                    self.room_id = self.tiktok.get_room_id_from_user(self.user)
+                known_room_id = False
                 self.manual_mode()
+                backoff.reset()
 
             except UserLiveError as ex:
+                backoff.reset()
                 logger.info(ex)
                 logger.info(
                     f"Waiting {self.automatic_interval} minutes before recheck\n"
@@ -122,94 +190,152 @@ class TikTokRecorder:
                 time.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
 
             except LiveNotFound as ex:
+                backoff.reset()
                 logger.error(f"Live not found: {ex}")
                 logger.info(
                     f"Waiting {self.automatic_interval} minutes before recheck\n"
                 )
                 time.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
 
-            except ConnectionError:
-                logger.error(Error.CONNECTION_CLOSED_AUTOMATIC)
-                time.sleep(TimeOut.CONNECTION_CLOSED * TimeOut.ONE_MINUTE)
+            except IPBlockedByWAF as ex:
+                logger.warning(ex)
+                backoff.wait(ex)
+
+            except ConnectionError as ex:
+                backoff.wait(ex, Error.CONNECTION_CLOSED)
 
             except Exception as ex:
                 logger.error(f"Unexpected error: {ex}\n")
+                backoff.wait(ex)
 
-    def followers_mode(self):
-        active_recordings = {}  # follower -> Process
+    def _new_client(self) -> TikTokAPI:
+        """
+        A TikTokAPI for another thread, HTTP sessions are not shared
+        between threads.
+        """
+        proxy = self.proxy if self.tiktok.proxy_pool else None
+        return TikTokAPI(proxy=proxy, cookies=self.cookies)
 
-        while True:
-            try:
-                followers = self.tiktok.get_followers_list(self.sec_uid)
+    def _lookup_room_id(self, user: str) -> str | None:
+        """
+        get_room_id_from_user on a TikTokAPI of the calling lookup thread
+        """
+        client = getattr(self._lookup_local, "tiktok", None)
+        if client is None:
+            client = self._lookup_local.tiktok = self._new_client()
+        return client.get_room_id_from_user(user)
 
-                for follower in followers:
-                    if follower in active_recordings:
-                        if not active_recordings[follower].is_alive():
-                            logger.info(f"Recording of @{follower} finished.")
-                            del active_recordings[follower]
-                        else:
-                            continue
+    def _resolve_room_ids(self, pool: ThreadPoolExecutor, users: list) -> dict:
+        """
+        Looks up the room id of every user concurrently. Users without a
+        room or whose lookup failed are left out.
+        """
+        futures = {pool.submit(self._lookup_room_id, user): user for user in users}
 
-                    try:
-                        room_id = self.tiktok.get_room_id_from_user(follower)
+        room_ids = {}
+        for future in as_completed(futures):
+            user = futures[future]
+            try:
+                room_id = future.result()
+            except Exception as e:
+                logger.error(f"Error while processing @{user}: {e}")
+                continue
+            if room_id:
+                room_ids[user] = str(room_id)
 
-                        if not room_id or not self.tiktok.is_room_alive(room_id):
-                            # logger.info(f"@{follower} is not live. Skipping...")
-                            continue
+        return room_ids
 
-                        logger.info(f"@{follower} is live. Starting recording...")
+    def followers_mode(self):
+        active_recordings = {}  # follower -> Thread
+        lookups = ThreadPoolExecutor(
+            max_workers=FOLLOWERS_LOOKUP_WORKERS, thread_name_prefix="room_id"
+        )
+        backoff = Backoff("followers_mode")
 
-                        thread = Thread(
-                            target=self.start_recording,
-                            args=(follower, room_id),
-                            daemon=True,
-                        )
-                        thread.start()
-                        active_recordings[follower] = thread
+        while True:
+            try:
+                self.tiktok.sync_followers(self.sec_uid)
+                followers = self.tiktok.followers
+                if not followers:
+                    raise TikTokRecorderError("Followers list is empty.")
+
+                for follower, thread in list(active_recordings.items()):
+                    if not thread.is_alive():
+                        logger.info(f"Recording of @{follower} finished.")
+                        del active_recordings[follower]
+
+                candidates = [f for f in followers if f not in active_recordings]
+                room_ids = self._resolve_room_ids(lookups, candidates)
+                alive = self.tiktok.are_rooms_alive(list(room_ids.values()))
+
+                for follower, room_id in room_ids.items():
+                    if not alive.get(room_id):
+                        continue
 
-                        time.sleep(2.5)
+                    logger.info(f"@{follower} is live. Starting recording...")
 
-                    except Exception as e:
-                        logger.error(f"Error while processing @{follower}: {e}")
-                        continue
+                    thread = Thread(
+                        target=self.start_recording,
+                        args=(follower, room_id, self._new_client()),
+                        daemon=True,
+                    )
+                    thread.start()
+                    active_recordings[follower] = thread
 
+                backoff.reset()
                 print()
                 delay = self.automatic_interval * TimeOut.ONE_MINUTE
                 logger.info(f"Waiting {delay} minutes for the next check...")
                 time.sleep(delay)
 
             except UserLiveError as ex:
+                backoff.reset()
                 logger.info(ex)
                 logger.info(
                     f"Waiting {self.automatic_interval} minutes before recheck\n"
                 )
                 time.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
 
-            except ConnectionError:
-                logger.error(Error.CONNECTION_CLOSED_AUTOMATIC)
-                time.sleep(TimeOut.CONNECTION_CLOSED * TimeOut.ONE_MINUTE)
+            except IPBlockedByWAF as ex:
+                logger.warning(ex)
+                backoff.wait(ex)
+
+            except ConnectionError as ex:
+                backoff.wait(ex, Error.CONNECTION_CLOSED)
 
             except Exception as ex:
                 logger.error(f"Unexpected error: {ex}\n")
+                backoff.wait(ex)
 
-    def start_recording(self, user, room_id):
+    def start_recording(self, user, room_id, tiktok=None):
         """
-        Start recording live
+        Start recording live, with tiktok (default self.tiktok) when run
+        on a thread of its own
         """
-        live_url = self.tiktok.get_live_url(room_id)
+        tiktok = tiktok or self.tiktok
+        with span("get_live_url", user=user):
+            live_url = tiktok.get_live_url(room_id, self.stream_format)
         if not live_url:
             raise LiveNotFound(TikTokError.RETRIEVE_LIVE_URL)
 
         current_date = time.strftime("%Y.%m.%d_%H-%M-%S", time.localtime())
 
-        if isinstance(self.output, str) and self.output != "":
-            if not (self.output.endswith("/") or self.output.endswith("\\")):
+        output_dir = self.output_router.pick() if self.output_router else self.output
+
+        if isinstance(output_dir, str) and output_dir != "":
+            if not (output_dir.endswith("/") or output_dir.endswith("\\")):
                 if os.name == "nt":
-                    self.output = self.output + "\\"
+                    output_dir = output_dir + "\\"
                 else:
-                    self.output = self.output + "/"
+                    output_dir = output_dir + "/"
+
+        suffix = VideoManagement.RAW_SUFFIXES[self.stream_format]
+        output = f"{output_dir if output_dir else ''}TK_{user}_{current_date}{suffix}"
 
-        output = f"{self.output if self.output else ''}TK_{user}_{current_date}_flv.mp4"
+        if self.stream_format == StreamFormat.HLS:
+            download_live_stream = tiktok.download_live_stream_hls
+        else:
+            download_live_stream = tiktok.download_live_stream
 
         if self.duration:
             logger.info(f"Started recording for {self.duration} seconds ")
@@ -219,34 +345,113 @@ class TikTokRecorder:
         buffer_size = 512 * 1024  # 512 KB buffer
         buffer = bytearray()
 
+        # Bitrate, fps, keyframes and gaps, without an ffprobe pass afterwards,
+        # and the keyframe index /clip cuts the recording in progress with
+        flv_stats = flv_index = None
+        if self.stream_format == StreamFormat.FLV:
+            flv_index = KeyframeIndex(output)
+            flv_stats = FlvTagParser(flv_index)
+
+        recording_id = None
+        if self.catalog:
+            recording_id = self.catalog.register(user, room_id, output)
+        last_catalog_update = last_progress = time.time()
+        emit(
+            "started",
+            user=user,
+            room_id=room_id,
+            path=os.path.abspath(output),
+            recording_id=recording_id,
+        )
+
         logger.info("[PRESS CTRL + C ONCE TO STOP]")
         with open(output, "wb") as out_file:
             stop_recording = False
+            connections = 0
+            first_byte = False
+            backoff = Backoff("recording")
             while not stop_recording:
                 try:
-                    if not self.tiktok.is_room_alive(room_id):
-                        logger.info("User is no longer live. Stopping recording.")
-                        break
+                    if connections:
+                        RECONNECTS.inc(user=user)
+                        emit("reconnect", user=user, reconnects=connections)
+                        if flv_stats:
+                            flv_stats.new_connection()
+                    connections += 1
+
+                    # Liveness was checked right before the first connection
+                    if connections > 1:
+                        try:
+                            alive = tiktok.is_room_alive(room_id)
+                        except IPBlockedByWAF:
+                            # Can't ask TikTok right now, the stream server will tell
+                            alive = True
+                        if not alive:
+                            logger.info("User is no longer live. Stopping recording.")
+                            break
 
                     start_time = time.time()
-                    for chunk in self.tiktok.download_live_stream(live_url):
+                    received = False
+                    for chunk in download_live_stream(live_url):
+                        if not received:
+                            received = True
+                            backoff.reset()
+
+                        if not first_byte:
+                            event("first_byte", user=user)
+                            self._record_time_to_first_byte(user)
+                            first_byte = True
+
+                        BYTES_RECEIVED.inc(len(chunk), user=user)
+                        if flv_stats:
+                            flv_stats.feed(chunk)
                         buffer.extend(chunk)
                         if len(buffer) >= buffer_size:
                             out_file.write(buffer)
+                            BYTES_WRITTEN.inc(len(buffer), user=user)
                             buffer.clear()
+                            if flv_index:
+                                out_file.flush()
+                                flv_index.flush()
+
+                            if recording_id and time.time() - last_catalog_update > 30:
+                                self.catalog.update_size(
+                                    recording_id,
+                                    out_file.tell(),
+                                    flv_stats.summary()
+                                    if flv_stats and flv_stats.valid
+                                    else None,
+                                )
+                                last_catalog_update = time.time()
+
+                            if time.time() - last_progress >= PROGRESS_INTERVAL:
+                                emit(
+                                    "progress",
+                                    user=user,
+                                    bytes=out_file.tell(),
+                                    stats=flv_stats.summary()
+                                    if flv_stats and flv_stats.valid
+                                    else None,
+                                )
+                                last_progress = time.time()
 
                         elapsed_time = time.time() - start_time
                         if self.duration and elapsed_time >= self.duration:
                             stop_recording = True
                             break
 
-                except ConnectionError:
+                    # Don't hammer a stream server that closes right away
+                    if not received:
+                        backoff.wait(ConnectionError("Stream closed without data"))
+
+                except ConnectionError as ex:
                     if self.mode == Mode.AUTOMATIC:
-                        logger.error(Error.CONNECTION_CLOSED_AUTOMATIC)
-                        time.sleep(TimeOut.CONNECTION_CLOSED * TimeOut.ONE_MINUTE)
+                        backoff.wait(ex, Error.CONNECTION_CLOSED)
+                    else:
+                        backoff.wait(ex)
 
-                except (RequestException, HTTPException):
-                    time.sleep(2)
+                except (RequestException, HTTPException) as ex:
+                    backoff.wait(ex)
 
                 except KeyboardInterrupt:
                     logger.info("Recording stopped by user.")
@@ -259,14 +464,62 @@ class TikTokRecorder:
                 finally:
                     if buffer:
                         out_file.write(buffer)
+                        BYTES_WRITTEN.inc(len(buffer), user=user)
                         buffer.clear()
                     out_file.flush()
 
+        # Later recordings of this process are not part of the go-live trace
+        detach()
+
         logger.info(f"Recording finished: {output}\n")
+        if flv_index:
+            flv_index.remove()
         VideoManagement.convert_flv_to_mp4(output)
 
+        final_output = VideoManagement.converted_path(output)
+        status = (
+            RecordingStatus.FINISHED
+            if os.path.exists(final_output)
+            else RecordingStatus.FAILED
+        )
+        stats = flv_stats.summary() if flv_stats and flv_stats.valid else None
+        if stats:
+            logger.info(
+                f"Stream: {stats['duration']}s, {stats['video_kbps']} kbps video, "
+                f"{stats['fps']} fps, {stats['gaps']} gaps"
+            )
+        if recording_id:
+            self.catalog.finish(recording_id, final_output, status, stats)
+        emit(
+            "finished",
+            user=user,
+            path=os.path.abspath(final_output),
+            status=status.value,
+            stats=stats,
+        )
+
         if self.use_telegram:
-            Telegram().upload(output.replace("_flv.mp4", ".mp4"))
+            # Importing Telethon costs more than the rest of the recorder
+            from upload.telegram import Telegram
+
+            Telegram().upload(final_output)
+
+    def _record_time_to_first_byte(self, user):
+        if self.detected_at is None:
+            return
+
+        ttfb = time.time() - self.detected_at
+        TIME_TO_FIRST_BYTE.observe(ttfb)
+        if ttfb > TimeOut.FIRST_BYTE_BUDGET:
+            logger.error(
+                f"@{user}: first byte {ttfb:.2f}s after detection "
+                f"(budget {TimeOut.FIRST_BYTE_BUDGET.value}s)"
+            )
+        else:
+            logger.info(f"@{user}: first byte {ttfb:.2f}s after detection")
+
+        # Only the first recording of this process belongs to the detection
+        self.detected_at = None
 
     def check_country_blacklisted(self):
         is_blacklisted = self.tiktok.is_country_blacklisted()
@@ -0,0 +1,284 @@
+"""
+Request budget shared by every process that talks to TikTok.
+
+The bot, its recorder subprocesses and the children of main.py all
+throttle through the same SQLite file (named by TIKREC_GOVERNOR_DB,
+which subprocesses inherit):
+
+- each endpoint has a token bucket (rate per second, burst);
+- a global circuit breaker opens on a WAF answer and fails requests
+  fast with IPBlockedByWAF. After an exponentially growing back-off a
+  single process is allowed one probe request; it closes the breaker
+  if it gets through and re-opens it for longer if it is blocked again.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from utils.custom_exceptions import IPBlockedByWAF
+from utils.enums import TikTokError
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+
+ENV_GOVERNOR_DB = "TIKREC_GOVERNOR_DB"
+
+# endpoint label -> (requests per second, burst)
+DEFAULT_RATES = {
+    "tikrec_sign": (1, 5),
+    "user_room": (1, 5),
+    "check_alive": (2, 10),
+    "room_info": (1, 5),
+    "euler_room_info": (0.5, 3),
+    "user_list": (1, 5),
+    "live_page": (0.5, 3),
+    "live": (0.5, 3),
+    "foryou": (0.5, 3),
+    "other": (2, 10),
+}
+
+# Not TikTok, or not subject to the WAF
+UNGOVERNED = {"stream", "telegram", "proxy_check"}
+
+BASE_BACKOFF = 30  # seconds the breaker stays open after the first trip
+MAX_BACKOFF = 30 * 60
+PROBE_TIMEOUT = 60  # a probe not reported back by then is given to another process
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    endpoint TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    burst REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS breaker (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    state TEXT NOT NULL,
+    trips INTEGER NOT NULL,
+    retry_at REAL NOT NULL,
+    probe_until REAL NOT NULL
+);
+INSERT OR IGNORE INTO breaker VALUES (1, 'closed', 0, 0, 0);
+"""
+
+BREAKER_TRIPS = REGISTRY.counter(
+    "governor_breaker_trips_total", "Times the WAF circuit breaker opened."
+)
+REJECTED = REGISTRY.counter(
+    "governor_rejected_total",
+    "Requests failed fast while the breaker was open.",
+    ["endpoint"],
+)
+THROTTLE_WAIT = REGISTRY.histogram(
+    "governor_wait_seconds",
+    "Time requests waited for a token.",
+    ["endpoint"],
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+
+class Governor:
+    def __init__(self, db_path: str, rates: dict | None = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+        if rates:
+            self.set_rates(rates)
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so keep one per process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.db_path, timeout=10, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, fn):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def set_rates(self, rates: dict) -> None:
+        """
+        Overrides the rate and burst of endpoints, for every process.
+        """
+
+        def update(conn):
+            for endpoint, (rate, burst) in rates.items():
+                conn.execute(
+                    "INSERT INTO buckets VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (endpoint) DO UPDATE SET "
+                    "rate = excluded.rate, burst = excluded.burst",
+                    (endpoint, rate, burst, burst, time.time()),
+                )
+
+        self._transaction(update)
+
+    def _check_breaker(self, conn, now: float) -> bool:
+        """
+        Returns True if the caller is the half-open probe, raises if the
+        breaker rejects the request.
+        """
+        state, trips, retry_at, probe_until = conn.execute(
+            "SELECT state, trips, retry_at, probe_until FROM breaker"
+        ).fetchone()
+
+        if state == "closed":
+            return False
+
+        if (state == "open" and now >= retry_at) or (
+            state == "half_open" and now >= probe_until
+        ):
+            conn.execute(
+                "UPDATE breaker SET state = 'half_open', probe_until = ?",
+                (now + PROBE_TIMEOUT,),
+            )
+            return True
+
+        raise IPBlockedByWAF(
+            f"{TikTokError.WAF_BLOCKED} Backing off for "
+            f"{max(retry_at, probe_until) - now:.0f}s."
+        )
+
+    def _take_token(self, conn, endpoint: str, now: float) -> float:
+        """
+        Takes a token, or returns how long to wait for one.
+        """
+        row = conn.execute(
+            "SELECT rate, burst, tokens, updated_at FROM buckets WHERE endpoint = ?",
+            (endpoint,),
+        ).fetchone()
+        if row is None:
+            rate, burst = DEFAULT_RATES.get(endpoint, DEFAULT_RATES["other"])
+            tokens, updated_at = burst, now
+        else:
+            rate, burst, tokens, updated_at = row
+
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        if not wait:
+            tokens -= 1
+
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+            (endpoint, rate, burst, tokens, now),
+        )
+        return wait
+
+    def acquire(self, endpoint: str) -> bool:
+        """
+        Blocks until endpoint may be called. Returns True if this request
+        is the breaker's probe, which must be reported with report().
+        """
+        if endpoint in UNGOVERNED:
+            return False
+
+        waited = 0.0
+        while True:
+
+            def attempt(conn):
+                now = time.time()
+                probe = self._check_breaker(conn, now)
+                # The probe is not rate limited, the others are
+                return probe, 0.0 if probe else self._take_token(conn, endpoint, now)
+
+            try:
+                probe, wait = self._transaction(attempt)
+            except IPBlockedByWAF:
+                REJECTED.inc(endpoint=endpoint)
+                raise
+
+            if not wait:
+                THROTTLE_WAIT.observe(waited, endpoint=endpoint)
+                return probe
+
+            time.sleep(wait)
+            waited += wait
+
+    def report(self, endpoint: str, probe: bool, blocked: bool, failed=False) -> None:
+        """
+        Feeds the outcome of a request back into the breaker.
+        """
+        if endpoint in UNGOVERNED or not (probe or blocked):
+            return
+
+        def update(conn):
+            now = time.time()
+            state, trips = conn.execute("SELECT state, trips FROM breaker").fetchone()
+            if blocked and not probe and state != "closed":
+                return None  # another request already opened it
+            if blocked:
+                trips += 1
+                backoff = min(BASE_BACKOFF * 2 ** (trips - 1), MAX_BACKOFF)
+                conn.execute(
+                    "UPDATE breaker SET state = 'open', trips = ?, retry_at = ?, "
+                    "probe_until = 0",
+                    (trips, now + backoff),
+                )
+                return backoff
+            if failed:
+                # The probe didn't reach TikTok: try again later, same trip count
+                conn.execute(
+                    "UPDATE breaker SET state = 'open', retry_at = ?, probe_until = 0",
+                    (now + BASE_BACKOFF,),
+                )
+                return None
+            conn.execute(
+                "UPDATE breaker SET state = 'closed', trips = 0, retry_at = 0, "
+                "probe_until = 0"
+            )
+            return 0
+
+        backoff = self._transaction(update)
+        if backoff:
+            BREAKER_TRIPS.inc()
+            logger.warning(f"TikTok WAF block on {endpoint}, pausing for {backoff}s")
+        elif backoff == 0:
+            logger.info("TikTok WAF probe went through, resuming requests")
+
+
+_governor = None
+
+
+def configure(db_path: str | None, rates: dict | None = None) -> None:
+    """
+    Enables the governor for this process and its subprocesses.
+    """
+    global _governor
+    if db_path is None:
+        os.environ.pop(ENV_GOVERNOR_DB, None)
+        _governor = None
+        return
+
+    db_path = os.path.abspath(db_path)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    os.environ[ENV_GOVERNOR_DB] = db_path
+    _governor = Governor(db_path, rates)
+
+
+def get_governor() -> Governor | None:
+    """
+    The governor named by TIKREC_GOVERNOR_DB, if any.
+    """
+    global _governor
+    db_path = os.environ.get(ENV_GOVERNOR_DB)
+    if not db_path:
+        return None
+    if _governor is None or _governor.db_path != db_path:
+        _governor = Governor(db_path)
+    return _governor
@@ -1,14 +1,125 @@
+import time
+from urllib.parse import urlparse
+
 import requests
 
+from http_utils.governor import get_governor
+from http_utils.proxy_pool import ProxyPool, is_blocked
 from utils.enums import StatusCode
 from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+from utils.tracing import span
 from utils.utils import is_termux
 
 
+HTTP_REQUESTS = REGISTRY.counter(
+    "tiktok_http_requests_total",
+    "HTTP requests made to TikTok and related services.",
+    ["endpoint", "status"],
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "tiktok_http_request_duration_seconds",
+    "Time until the response headers of an HTTP request were received.",
+    ["endpoint"],
+)
+
+# url path prefix -> endpoint label
+ENDPOINTS = {
+    "/tiktok/room/api/sign": "tikrec_sign",
+    "/api-live/user/room": "user_room",
+    "/webcast/room/check_alive": "check_alive",
+    "/webcast/room/info": "room_info",
+    "/webcast/room_info": "euler_room_info",
+    "/api/user/list": "user_list",
+    "/foryou": "foryou",
+    "/live": "live",
+    "/ip": "proxy_check",
+    "/bot": "telegram",
+}
+
+
+def endpoint_name(url: str) -> str:
+    """
+    Maps a url to a low cardinality label for metrics.
+    """
+    parsed = urlparse(url)
+    for prefix, name in ENDPOINTS.items():
+        if parsed.path.startswith(prefix):
+            return name
+    if "tiktok.com" in parsed.netloc and parsed.path.endswith("/live"):
+        return "live_page"
+    return "stream" if parsed.path.endswith((".flv", ".m3u8", ".ts")) else "other"
+
+
+class InstrumentedSession:
+    """
+    Wraps a requests / curl_cffi session and records the count and
+    latency of every request made through it. With a proxy pool, each
+    request goes through the proxy the pool picks and reports back.
+    Requests wait for the cross-process governor, if one is configured.
+    """
+
+    def __init__(self, session, proxy_pool: ProxyPool = None):
+        self._session = session
+        self.proxy_pool = proxy_pool
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def request(self, method, url, **kwargs):
+        endpoint = endpoint_name(url)
+        governor = get_governor()
+        probe = governor.acquire(endpoint) if governor else False
+
+        proxy = None
+        if self.proxy_pool is not None and "proxies" not in kwargs:
+            proxy = self.proxy_pool.pick()
+            if proxy:
+                kwargs["proxies"] = {"http": proxy, "https": proxy}
+
+        response = None
+        status = "error"
+        start = time.perf_counter()
+        try:
+            with span(endpoint):
+                response = self._session.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_LATENCY.observe(elapsed, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=status)
+            blocked = response is not None and is_blocked(
+                response, kwargs.get("stream", False)
+            )
+            if proxy:
+                self.proxy_pool.report(
+                    proxy,
+                    ok=response is not None and response.status_code < 500,
+                    latency=elapsed,
+                    blocked=blocked,
+                )
+            if governor:
+                # A block on one proxy is the pool's business, not everyone's
+                governor.report(
+                    endpoint,
+                    probe=probe,
+                    blocked=blocked and (proxy is None or probe),
+                    failed=response is None,
+                )
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
 class HttpClient:
     def __init__(self, proxy=None, cookies=None):
         self.req = None
         self.req_stream = requests
+        self.proxy_pool = None
 
         self.proxy = proxy
         self.cookies = cookies
@@ -32,17 +143,19 @@ class HttpClient:
         self.configure_session()
 
     def configure_session(self) -> None:
-        self.req_stream = requests.Session()
+        self.req_stream = InstrumentedSession(requests.Session())
 
         if is_termux():
             self.req = self.req_stream
         else:
             from curl_cffi import Session, CurlSslVersion, CurlOpt
 
-            self.req = Session(
-                impersonate="chrome136",
-                http_version="v1",
-                curl_options={CurlOpt.SSLVERSION: CurlSslVersion.TLSv1_2},
+            self.req = InstrumentedSession(
+                Session(
+                    impersonate="chrome136",
+                    http_version="v1",
+                    curl_options={CurlOpt.SSLVERSION: CurlSslVersion.TLSv1_2},
+                )
             )
 
         self.req.headers.update(self.headers)
@@ -58,6 +171,12 @@ class HttpClient:
         if self.proxy is None:
             return
 
+        # Several comma-separated proxies: spread API requests over a pool
+        if "," in self.proxy:
+            self.proxy_pool = ProxyPool.shared(self.proxy)
+            self.req.proxy_pool = self.proxy_pool
+            return
+
         logger.info(f"Testing {self.proxy}...")
         proxies = {"http": self.proxy, "https": self.proxy}
 
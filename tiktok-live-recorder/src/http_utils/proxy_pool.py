@@ -0,0 +1,236 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+
+PROXY_REQUESTS = REGISTRY.counter(
+    "proxy_requests_total",
+    "Requests sent through each proxy of the pool.",
+    ["proxy", "outcome"],
+)
+PROXIES_HEALTHY = REGISTRY.gauge(
+    "proxy_pool_healthy", "Proxies of the pool that are not quarantined."
+)
+
+PROBE_URL = "https://ifconfig.me/ip"
+
+# Consecutive failures that quarantine a proxy (a WAF block does it at once)
+MAX_CONSECUTIVE_FAILURES = 3
+
+_shared_pools = {}
+_shared_lock = threading.Lock()
+
+
+# Start of the page the TikTok WAF answers with, whatever the status
+WAF_MARKER = b"Please wait"
+WAF_CONTENT_TYPES = ("text/html", "json")
+
+
+def is_blocked(response, streamed: bool = False) -> bool:
+    """
+    Whether a response looks like the TikTok WAF turned us away: a 429,
+    or the WAF page. Other 403s (an expired stream token) are not blocks.
+    """
+    if response.status_code == 429:
+        return True
+    # The body of a streamed download must not be consumed here, and
+    # media (HLS segments) is never the WAF page
+    content_type = response.headers.get("Content-Type", "")
+    if streamed or not any(t in content_type for t in WAF_CONTENT_TYPES):
+        return False
+    return WAF_MARKER in response.content[:2048]
+
+
+def proxy_label(proxy: str) -> str:
+    """
+    host:port of a proxy url, without credentials.
+    """
+    parsed = urlparse(proxy)
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+
+
+class ProxyStats:
+    def __init__(self, url: str):
+        self.url = url
+        self.label = proxy_label(url)
+        self.successes = 0
+        self.failures = 0
+        self.blocks = 0
+        self.consecutive_failures = 0
+        self.latency = None  # exponentially weighted, seconds
+        self.strikes = 0  # quarantines in a row, doubles the quarantine time
+        self.quarantined_until = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace smoothing, so a new proxy starts at 0.5 rather than 0 or 1
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else 1.0
+        return self.success_rate / (latency + 0.1)
+
+
+class ProxyPool:
+    """
+    Spreads requests over several proxies, weighted by success rate and
+    latency. A proxy that is WAF blocked or keeps failing is quarantined
+    and re-probed in the background before it gets traffic again.
+    """
+
+    def __init__(self, proxies: list[str], quarantine: int = 300, probe_interval=30):
+        self.proxies = {url: ProxyStats(url) for url in proxies}
+        self.quarantine_time = quarantine
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._prober = None
+        PROXIES_HEALTHY.set(len(self.proxies))
+
+    @classmethod
+    def from_spec(cls, spec: str | list | None) -> "ProxyPool | None":
+        """
+        Builds a pool from a comma-separated string or list of proxy urls.
+        """
+        if isinstance(spec, str):
+            spec = spec.split(",")
+        proxies = [p.strip() for p in spec or [] if p and p.strip()]
+        return cls(proxies) if proxies else None
+
+    @classmethod
+    def shared(cls, spec: str) -> "ProxyPool | None":
+        """
+        One probed and running pool per proxy list and process, so every
+        HttpClient built from the same -proxy value shares the statistics.
+        """
+        with _shared_lock:
+            pool = _shared_pools.get(spec)
+            if pool is None:
+                pool = cls.from_spec(spec)
+                if pool is None:
+                    return None
+                pool.probe_all()
+                pool.start()
+                _shared_pools[spec] = pool
+            return pool
+
+    def _healthy(self, now: float) -> list[ProxyStats]:
+        return [p for p in self.proxies.values() if p.quarantined_until <= now]
+
+    def pick(self) -> str | None:
+        """
+        Returns the proxy for the next request, None if all are quarantined.
+        """
+        with self._lock:
+            healthy = self._healthy(time.time())
+            if not healthy:
+                return None
+            weights = [p.score() for p in healthy]
+            return random.choices(healthy, weights)[0].url
+
+    def report(self, proxy: str, ok: bool, latency: float = None, blocked=False):
+        """
+        Records the outcome of a request sent through proxy.
+        """
+        stats = self.proxies.get(proxy)
+        if stats is None:
+            return
+
+        outcome = "blocked" if blocked else "ok" if ok else "error"
+        PROXY_REQUESTS.inc(proxy=stats.label, outcome=outcome)
+
+        with self._lock:
+            if latency is not None:
+                stats.latency = (
+                    latency
+                    if stats.latency is None
+                    else 0.8 * stats.latency + 0.2 * latency
+                )
+
+            if ok and not blocked:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                return
+
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if blocked:
+                stats.blocks += 1
+
+            if blocked or stats.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                self._quarantine(stats, "WAF blocked" if blocked else "failing")
+
+    def _quarantine(self, stats: ProxyStats, reason: str) -> None:
+        duration = min(self.quarantine_time * 2**stats.strikes, 3600)
+        stats.strikes += 1
+        stats.consecutive_failures = 0
+        stats.quarantined_until = time.time() + duration
+        PROXIES_HEALTHY.set(len(self._healthy(time.time())))
+        logger.warning(f"Proxy {stats.label} quarantined for {duration}s ({reason})")
+
+    def probe(self, proxy: str) -> bool:
+        """
+        Checks that a proxy forwards requests at all.
+        """
+        proxies = {"http": proxy, "https": proxy}
+        try:
+            response = requests.get(PROBE_URL, proxies=proxies, timeout=10)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def reprobe(self) -> None:
+        """
+        Probes quarantined proxies whose time is up; the ones that answer
+        get their traffic back, the others stay out twice as long.
+        """
+        now = time.time()
+        with self._lock:
+            due = [p for p in self.proxies.values() if 0 < p.quarantined_until <= now]
+            # Keep them out of pick() while probing
+            for stats in due:
+                stats.quarantined_until = now + self.probe_interval
+
+        for stats in due:
+            ok = self.probe(stats.url)
+            with self._lock:
+                if ok:
+                    stats.strikes = max(stats.strikes - 1, 0)
+                    stats.quarantined_until = 0.0
+                    logger.info(f"Proxy {stats.label} is back in the pool")
+                else:
+                    self._quarantine(stats, "probe failed")
+
+        with self._lock:
+            PROXIES_HEALTHY.set(len(self._healthy(time.time())))
+
+    def probe_all(self) -> None:
+        """
+        Initial check of every proxy, failing ones start quarantined.
+        """
+        for stats in self.proxies.values():
+            logger.info(f"Testing {stats.label}...")
+            if not self.probe(stats.url):
+                with self._lock:
+                    self._quarantine(stats, "probe failed")
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                self.reprobe()
+            except Exception as ex:
+                logger.error(f"Proxy re-probe failed: {ex}")
+
+    def start(self) -> None:
+        """
+        Starts re-probing quarantined proxies in the background.
+        """
+        if self._prober is None:
+            self._prober = threading.Thread(target=self._run, daemon=True)
+            self._prober.start()
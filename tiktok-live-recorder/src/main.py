@@ -1,12 +1,27 @@
 import sys
 import os
 import multiprocessing
+import tempfile
+import time
+
+STARTED_AT = time.perf_counter()
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 def record_user(
-    user, url, room_id, mode, interval, proxy, output, duration, use_telegram, cookies
+    user,
+    url,
+    room_id,
+    mode,
+    interval,
+    proxy,
+    output,
+    duration,
+    use_telegram,
+    cookies,
+    stream_format,
+    catalog_path,
 ):
     from core.tiktok_recorder import TikTokRecorder
     from utils.logger_manager import logger
@@ -23,6 +38,8 @@ def record_user(
             output=output,
             duration=duration,
             use_telegram=use_telegram,
+            stream_format=stream_format,
+            catalog_path=catalog_path,
         ).run()
     except Exception as e:
         logger.error(f"{e}")
@@ -45,6 +62,8 @@ def run_recordings(args, mode, cookies):
                     args.duration,
                     args.telegram,
                     cookies,
+                    args.stream_format,
+                    args.catalog,
                 ),
             )
             p.start()
@@ -74,6 +93,8 @@ def run_recordings(args, mode, cookies):
             args.duration,
             args.telegram,
             cookies,
+            args.stream_format,
+            args.catalog,
         )
 
 
@@ -82,23 +103,36 @@ def main():
     from utils.utils import read_cookies
     from utils.logger_manager import logger
     from utils.custom_exceptions import TikTokRecorderError
-    from check_updates import check_updates
+    from check_updates import check_updates_in_background, install_pending_update
+    from http_utils import governor
+    from http_utils.governor import ENV_GOVERNOR_DB
+    from utils.startup import log_cold_start
 
     try:
         # validate and parse command line arguments
         args, mode = validate_and_parse_args()
 
-        # check for updates
+        # install the update found by the last run, then check for the next
+        # one, at most once per TTL and without delaying the start
         if args.update_check is True:
-            logger.info("Checking for updates...\n")
-            if check_updates():
+            if install_pending_update():
+                logger.warning("Updated to a new version, restart to use it")
                 exit()
+            check_updates_in_background(args.update_check_ttl)
         else:
             logger.info("Skipped update check\n")
 
         # read cookies from the config file
         cookies = read_cookies()
 
+        # share one request budget with every recording process
+        if not os.environ.get(ENV_GOVERNOR_DB):
+            governor.configure(
+                os.path.join(tempfile.gettempdir(), "tiktok-recorder-governor.db")
+            )
+
+        log_cold_start(STARTED_AT)
+
         # run the recordings based on the parsed arguments
         run_recordings(args, mode, cookies)
 
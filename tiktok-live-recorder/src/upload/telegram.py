@@ -1,12 +1,27 @@
 import asyncio
+import time
 from pathlib import Path
 
 from telethon import TelegramClient
 
 from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+from utils.retry import Backoff, classify
 from utils.utils import read_telegram_config
 
 
+UPLOAD_BYTES = REGISTRY.counter(
+    "upload_bytes_total", "Bytes uploaded successfully.", ["uploader"]
+)
+UPLOAD_DURATION = REGISTRY.histogram(
+    "upload_duration_seconds",
+    "Time spent uploading a recording.",
+    ["uploader"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+UPLOAD_ATTEMPTS = 3
+
 FREE_USER_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
 PREMIUM_USER_MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024
 
@@ -63,19 +78,37 @@ class Telegram:
                     "This may take a while depending on file size."
                 )
 
-                await self.client.send_file(
-                    entity=self.chat_id,
-                    file=file_path,
-                    caption=(
-                        "🎥 <b>Video recorded via "
-                        '<a href="https://github.com/Michele0303/'
-                        'tiktok-live-recorder">'
-                        "TikTok Live Recorder</a></b>"
-                    ),
-                    parse_mode="html",
-                    force_document=True,
+                start = time.perf_counter()
+                backoff = Backoff("telethon_upload")
+                for attempt in range(UPLOAD_ATTEMPTS):
+                    try:
+                        await self.client.send_file(
+                            entity=self.chat_id,
+                            file=file_path,
+                            caption=(
+                                "🎥 <b>Video recorded via "
+                                '<a href="https://github.com/Michele0303/'
+                                'tiktok-live-recorder">'
+                                "TikTok Live Recorder</a></b>"
+                            ),
+                            parse_mode="html",
+                            force_document=True,
+                        )
+                        break
+                    except Exception as ex:
+                        if (
+                            classify(ex) == "unexpected"
+                            or attempt == UPLOAD_ATTEMPTS - 1
+                        ):
+                            raise
+                        delay = backoff.delay(ex)
+                        logger.info(f"Upload failed ({ex}), retrying in {delay:.0f}s")
+                        await asyncio.sleep(delay)
+
+                UPLOAD_DURATION.observe(
+                    time.perf_counter() - start, uploader="telethon"
                 )
-
+                UPLOAD_BYTES.inc(file_size, uploader="telethon")
                 logger.info("File successfully uploaded to Telegram.\n")
 
             except Exception as e:
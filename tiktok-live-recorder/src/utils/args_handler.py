@@ -2,7 +2,8 @@ import argparse
 import re
 
 from utils.custom_exceptions import ArgsParseError
-from utils.enums import Mode, Regex
+from utils.enums import Mode, Regex, StreamFormat
+from utils.startup import UPDATE_CHECK_TTL
 
 
 def parse_args():
@@ -62,6 +63,8 @@ def parse_args():
         dest="proxy",
         help=(
             "Use HTTP proxy to bypass login restrictions in some countries.\n"
+            "Several comma-separated proxies form a pool that TikTok API\n"
+            "requests are spread over.\n"
             "Example: -proxy http://127.0.0.1:8080"
         ),
         action="store",
@@ -70,7 +73,11 @@ def parse_args():
     parser.add_argument(
         "-output",
         dest="output",
-        help=("Specify the output directory where recordings will be saved.\n"),
+        help=(
+            "Specify the output directory where recordings will be saved.\n"
+            "Several comma-separated directories spread recordings over "
+            "the one with the most free space and the least write load."
+        ),
         action="store",
     )
 
@@ -83,6 +90,31 @@ def parse_args():
         action="store",
     )
 
+    parser.add_argument(
+        "-format",
+        dest="stream_format",
+        help=(
+            "Stream format to record: (flv, hls) [Default: flv]\n"
+            "[flv] => Single long-lived FLV connection.\n"
+            "[hls] => m3u8 playlist with parallel segment fetching, "
+            "more resilient on flaky networks."
+        ),
+        default="flv",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-catalog",
+        dest="catalog",
+        help=(
+            "Path of a SQLite catalog where every recording is registered "
+            "(user, room_id, path, size, status).\n"
+            "Example: -catalog recordings/catalog.db"
+        ),
+        default=None,
+        action="store",
+    )
+
     parser.add_argument(
         "-telegram",
         dest="telegram",
@@ -101,6 +133,18 @@ def parse_args():
         ),
     )
 
+    parser.add_argument(
+        "-update-check-ttl",
+        dest="update_check_ttl",
+        type=float,
+        default=UPDATE_CHECK_TTL,
+        help=(
+            f"Minimum hours between two update checks (default: {UPDATE_CHECK_TTL}). "
+            "The check runs in the background, a new version is installed "
+            "at the next start."
+        ),
+    )
+
     args = parser.parse_args()
 
     return args
@@ -155,11 +199,18 @@ def validate_and_parse_args():
     ):
         raise ArgsParseError("Please provide only one among username, room ID, or URL.")
 
+    if args.output and "," in args.output:
+        args.output = [o.strip() for o in args.output.split(",") if o.strip()]
+
     if args.automatic_interval < 1:
         raise ArgsParseError(
             "Incorrect automatic_interval value. Must be one minute or more."
         )
 
+    if args.stream_format not in [f.value for f in StreamFormat]:
+        raise ArgsParseError("Incorrect format value. Choose between 'flv' or 'hls'.")
+    args.stream_format = StreamFormat(args.stream_format)
+
     if args.mode == "manual":
         mode = Mode.MANUAL
     elif args.mode == "automatic":
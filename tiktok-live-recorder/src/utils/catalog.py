@@ -0,0 +1,268 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from utils.enums import RecordingStatus, UploadState
+from utils.logger_manager import logger
+
+
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version)
+MIGRATIONS = [
+    """
+    CREATE TABLE recordings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT NOT NULL,
+        room_id TEXT,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL DEFAULT 0,
+        duration REAL,
+        status TEXT NOT NULL,
+        upload_state TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        finished_at REAL
+    );
+    CREATE INDEX idx_recordings_user ON recordings (user, started_at);
+    CREATE INDEX idx_recordings_started ON recordings (started_at);
+    CREATE INDEX idx_recordings_upload ON recordings (upload_state, status);
+    """,
+    """
+    CREATE INDEX idx_recordings_status ON recordings (status);
+    """,
+    """
+    ALTER TABLE recordings ADD COLUMN stats TEXT;
+    """,
+]
+
+# TK_<user>_<YYYY.MM.DD_HH-MM-SS>[_flv.mp4|_hls.ts|.mp4]
+RECORDING_NAME = re.compile(
+    r"^TK_(?P<user>.+)_(?P<date>\d{4}\.\d{2}\.\d{2}_\d{2}-\d{2}-\d{2})"
+    r"(?:_flv\.mp4|_hls\.ts|\.mp4)$"
+)
+
+
+@dataclass
+class Recording:
+    id: int
+    user: str
+    room_id: str | None
+    path: str
+    size: int
+    duration: float | None
+    status: RecordingStatus
+    upload_state: UploadState
+    started_at: float
+    finished_at: float | None
+    stats: dict | None  # stream statistics of utils.flv_parser, if parsed
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Recording":
+        return cls(
+            id=row["id"],
+            user=row["user"],
+            room_id=row["room_id"],
+            path=row["path"],
+            size=row["size"],
+            duration=row["duration"],
+            status=RecordingStatus(row["status"]),
+            upload_state=UploadState(row["upload_state"]),
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+            stats=json.loads(row["stats"]) if row["stats"] else None,
+        )
+
+
+class RecordingCatalog:
+    """
+    SQLite index of every recording: who, where, how big and whether it
+    was uploaded. Shared between the recorder processes and the bot, so
+    lookups never have to glob and stat the output directory.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(
+            db_path, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                for i, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    for statement in migration.split(";"):
+                        if statement.strip():
+                            self._conn.execute(statement)
+                    self._conn.execute(f"PRAGMA user_version={i}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _execute(self, query: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(query, params)
+
+    def register(self, user: str, room_id: str | None, path: str) -> int:
+        """
+        Adds a recording that has just started and returns its id.
+        """
+        cursor = self._execute(
+            "INSERT OR REPLACE INTO recordings "
+            "(user, room_id, path, status, upload_state, started_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                user,
+                room_id,
+                os.path.abspath(path),
+                RecordingStatus.RECORDING.value,
+                UploadState.PENDING.value,
+                time.time(),
+            ),
+        )
+        return cursor.lastrowid
+
+    def update_size(
+        self, recording_id: int, size: int, stats: dict | None = None
+    ) -> None:
+        """
+        Progress of a recording, for processes that don't get its events.
+        """
+        self._execute(
+            "UPDATE recordings SET size = ?, stats = COALESCE(?, stats) WHERE id = ?",
+            (size, json.dumps(stats) if stats else None, recording_id),
+        )
+
+    def finish(
+        self,
+        recording_id: int,
+        path: str,
+        status: RecordingStatus = RecordingStatus.FINISHED,
+        stats: dict | None = None,
+    ) -> None:
+        """
+        Marks a recording as ended, pointing it at its final file. Stream
+        statistics, if given, replace the ones stored before.
+        """
+        size = Path(path).stat().st_size if Path(path).exists() else 0
+        now = time.time()
+        self._execute(
+            "UPDATE OR REPLACE recordings SET path = ?, size = ?, status = ?, "
+            "finished_at = ?, duration = ? - started_at, "
+            "stats = COALESCE(?, stats) WHERE id = ?",
+            (
+                os.path.abspath(path),
+                size,
+                status.value,
+                now,
+                now,
+                json.dumps(stats) if stats else None,
+                recording_id,
+            ),
+        )
+
+    def set_upload_state(self, path: str, state: UploadState) -> None:
+        self._execute(
+            "UPDATE recordings SET upload_state = ? WHERE path = ?",
+            (state.value, os.path.abspath(path)),
+        )
+
+    def latest_for_user(self, user: str) -> Recording | None:
+        row = self._execute(
+            "SELECT * FROM recordings WHERE user = ? ORDER BY started_at DESC LIMIT 1",
+            (user,),
+        ).fetchone()
+        return Recording.from_row(row) if row else None
+
+    def list_recordings(self, limit: int = 10, offset: int = 0) -> list[Recording]:
+        rows = self._execute(
+            "SELECT * FROM recordings ORDER BY started_at DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+        return [Recording.from_row(row) for row in rows]
+
+    def recordings_under(self, root: str) -> list[Recording]:
+        """
+        Returns every recording whose file lives below the given directory.
+        """
+        prefix = os.path.join(os.path.abspath(root), "")
+        rows = self._execute(
+            "SELECT * FROM recordings WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix),
+        ).fetchall()
+        return [Recording.from_row(row) for row in rows]
+
+    def pending_uploads(self, user: str, since: float = 0) -> list[Recording]:
+        """
+        Finished recordings of user started at or after since whose upload
+        has not run yet, oldest first.
+        """
+        rows = self._execute(
+            "SELECT * FROM recordings WHERE user = ? AND started_at >= ? "
+            "AND status = ? AND upload_state = ? ORDER BY started_at",
+            (user, since, RecordingStatus.FINISHED.value, UploadState.PENDING.value),
+        ).fetchall()
+        return [Recording.from_row(row) for row in rows]
+
+    def recordings_with_status(self, status: RecordingStatus) -> list[Recording]:
+        rows = self._execute(
+            "SELECT * FROM recordings WHERE status = ?", (status.value,)
+        ).fetchall()
+        return [Recording.from_row(row) for row in rows]
+
+    def remove(self, recording_id: int) -> None:
+        self._execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+
+    def backfill(self, directory: str) -> int:
+        """
+        One-off import of recordings that were saved before the catalog
+        existed, as uploaded: the bot that recorded them already handed
+        them to the uploader. Returns the number of files added.
+        """
+        if not Path(directory).exists():
+            return 0
+
+        added = 0
+        for entry in os.scandir(directory):
+            match = RECORDING_NAME.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            started_at = time.mktime(
+                time.strptime(match.group("date"), "%Y.%m.%d_%H-%M-%S")
+            )
+            cursor = self._execute(
+                "INSERT OR IGNORE INTO recordings "
+                "(user, path, size, status, upload_state, started_at, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    match.group("user"),
+                    os.path.abspath(entry.path),
+                    stat.st_size,
+                    RecordingStatus.FINISHED.value,
+                    UploadState.UPLOADED.value,
+                    started_at,
+                    stat.st_mtime,
+                ),
+            )
+            added += cursor.rowcount
+
+        if added:
+            logger.info(f"Catalog: imported {added} existing recordings")
+        return added
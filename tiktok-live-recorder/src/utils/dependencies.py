@@ -4,6 +4,7 @@ import platform
 from subprocess import SubprocessError
 
 from .logger_manager import logger
+from .startup import environment_key, read_stamp, update_stamp
 from .utils import is_linux
 
 
@@ -154,6 +155,11 @@ def install_requirements():
 
 
 def check_and_install_dependencies():
+    # Nothing changed since the last successful check
+    key = environment_key()
+    if read_stamp().get("dependencies") == key:
+        return
+
     logger.info("Checking and Installing dependencies...")
 
     dependencies = [
@@ -163,7 +169,6 @@ def check_and_install_dependencies():
         check_curl_cffi_library(),
         check_requests_library(),
         check_telethon_library(),
-        check_ffmpeg_binary(),
     ]
 
     if False in dependencies:
@@ -171,3 +176,5 @@ def check_and_install_dependencies():
 
     if not check_ffmpeg_binary():
         install_ffmpeg_binary()
+
+    update_stamp(dependencies=key)
@@ -18,7 +18,7 @@ class TimeOut(IntEnum):
 
     ONE_MINUTE = 60
     AUTOMATIC_MODE = 5
-    CONNECTION_CLOSED = 2
+    FIRST_BYTE_BUDGET = 10  # seconds from detection to the first stream byte
 
 
 class StatusCode(IntEnum):
@@ -37,6 +37,44 @@ class Mode(IntEnum):
     FOLLOWERS = 2
 
 
+class StreamFormat(Enum):
+    """
+    Enumeration that represents the stream formats that can be recorded.
+    """
+
+    def __str__(self):
+        return str(self.value)
+
+    FLV = "flv"
+    HLS = "hls"
+
+
+class RecordingStatus(Enum):
+    """
+    Enumeration that represents the lifecycle of a cataloged recording.
+    """
+
+    def __str__(self):
+        return str(self.value)
+
+    RECORDING = "recording"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class UploadState(Enum):
+    """
+    Enumeration that represents the upload state of a cataloged recording.
+    """
+
+    def __str__(self):
+        return str(self.value)
+
+    PENDING = "pending"
+    UPLOADED = "uploaded"
+    FAILED = "failed"
+
+
 class Error(Enum):
     """
     Enumeration that contains possible errors while using TikTok-Live-Recorder.
@@ -46,7 +84,6 @@ class Error(Enum):
         return str(self.value)
 
     CONNECTION_CLOSED = "Connection broken by the server."
-    CONNECTION_CLOSED_AUTOMATIC = f"{CONNECTION_CLOSED}. Try again after delay of {TimeOut.CONNECTION_CLOSED} minutes"
 
 
 class TikTokError(Enum):
@@ -0,0 +1,163 @@
+"""
+Structured progress events from a recorder to the process that started it.
+
+The parent creates a RecorderChannel, starts the recorder with its
+environment and passes it the write end of the channel's pipe. The
+recorder then writes one JSON line per event:
+
+    started    a recording began (user, room_id, path, recording_id)
+    progress   bytes written and stream stats so far, at most every
+               PROGRESS_INTERVAL
+    reconnect  the stream connection was reopened
+    finished   the recording ended (path of the final file, status, stats)
+
+Without the environment variable emit() does nothing, so a recorder run
+from the command line is unaffected. The channel reads the events and
+the recorder's log output as they arrive and only keeps the latest of
+each, so a recording of many hours costs the parent bounded memory.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+ENV_EVENTS_FD = "TIKREC_EVENTS_FD"
+
+# Seconds between two progress events of a recording
+PROGRESS_INTERVAL = 10
+
+_emit_lock = threading.Lock()
+_stream = None  # text stream on the pipe, False when there is none
+
+
+def _open_stream():
+    global _stream
+    if _stream is None:
+        fd = os.environ.get(ENV_EVENTS_FD)
+        try:
+            _stream = os.fdopen(int(fd), "w", buffering=1) if fd else False
+        except (OSError, ValueError):
+            _stream = False
+    return _stream
+
+
+def emit(event: str, **fields) -> None:
+    """
+    Sends an event to the parent process, if it asked for them.
+    """
+    global _stream
+    with _emit_lock:
+        stream = _open_stream()
+        if not stream:
+            return
+        try:
+            stream.write(
+                json.dumps({"event": event, "t": time.time(), **fields}) + "\n"
+            )
+        except (OSError, ValueError):
+            _stream = False  # the parent went away
+
+
+class RecorderChannel:
+    """
+    Parent side of the events of one recorder process.
+
+    recording holds the last started/progress event of the recording in
+    progress (None between recordings), events and output the latest
+    events and log lines.
+    """
+
+    def __init__(self, max_events: int = 100, max_output: int = 200):
+        self.events = deque(maxlen=max_events)
+        self.output = deque(maxlen=max_output)
+        self.recording = None
+        self.reconnects = 0
+        self._read_fd, self.write_fd = os.pipe()
+        self._stdout_fd = None
+        self._partial = {}  # fd -> incomplete last line
+
+    def env(self) -> dict:
+        """
+        Environment variables for the recorder, which must also get
+        write_fd through Popen's pass_fds.
+        """
+        return {ENV_EVENTS_FD: str(self.write_fd)}
+
+    def close_write_end(self) -> None:
+        """
+        Closes the parent's copy of the write end once the recorder is
+        started (or failed to), so the pipe ends when the recorder does.
+        """
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def _apply(self, event: dict) -> None:
+        self.events.append(event)
+        kind = event.get("event")
+        if kind == "started":
+            self.recording = {**event, "bytes": 0}
+            self.reconnects = 0
+        elif kind == "progress" and self.recording:
+            self.recording["bytes"] = event.get("bytes", 0)
+            self.recording["stats"] = event.get("stats")
+        elif kind == "reconnect":
+            self.reconnects += 1
+        elif kind == "finished":
+            self.recording = None
+
+    def watch(self, stdout_fd: int | None = None) -> None:
+        """
+        Starts reading the events and the recorder output (stdout_fd, if
+        piped). Wait on open_fds and call read() for the ready ones.
+        """
+        self._partial = {fd: b"" for fd in (self._read_fd, stdout_fd) if fd is not None}
+        self._stdout_fd = stdout_fd
+        for fd in self._partial:
+            os.set_blocking(fd, False)
+
+    @property
+    def open_fds(self) -> list[int]:
+        """The watched file descriptors the recorder has not closed yet"""
+        return list(self._partial)
+
+    def read(self, fd: int) -> list[dict]:
+        """
+        Reads everything available on fd and returns the new events. Once
+        the recorder closed it, fd is no longer in open_fds.
+        """
+        data, closed = b"", False
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                break  # nothing more for now, which may be nothing at all
+            if not chunk:
+                closed = True
+                break
+            data += chunk
+
+        *lines, self._partial[fd] = (self._partial[fd] + data).split(b"\n")
+        if closed:
+            lines.append(self._partial.pop(fd))
+
+        if fd == self._stdout_fd:
+            self.output.extend(line.decode(errors="replace") for line in lines if line)
+            return []
+
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+            self._apply(events[-1])
+        return events
+
+    def close(self) -> None:
+        """Closes the read end of the event pipe"""
+        self._partial.pop(self._read_fd, None)
+        os.close(self._read_fd)
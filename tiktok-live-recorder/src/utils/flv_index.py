@@ -0,0 +1,227 @@
+"""
+Keyframe index kept next to an FLV recording, for clips of a live.
+
+While recording, the FlvTagParser reports to a KeyframeIndex where in
+the file each connection's FLV header, its script and sequence header
+tags and every keyframe are. The index is a JSON-lines sidecar
+(recording + INDEX_SUFFIX):
+
+    {"header": [offset, length]}       an FLV header, a new connection
+    {"config": [offset, length]}       a script or sequence header tag
+    {"keyframe": offset, "ms": ms, "ts": ts}
+                                       a keyframe, at ms of stream time
+                                       (continuous over reconnects) and
+                                       with ts as its tag timestamp
+
+cut_clip() then copies the tail of a recording in progress: the FLV
+header and sequence headers of the connection the clip starts in, and
+the bytes from the right keyframe to the end of the file. Nothing is
+re-encoded and the recorder is not disturbed. Timestamps restart at
+every reconnect, so the tags of later connections are copied one by one
+with their timestamps moved to follow on; the connection the clip
+starts in is copied as is.
+"""
+
+import json
+import os
+
+INDEX_SUFFIX = ".idx"
+COPY_CHUNK = 1024 * 1024
+TAG_HEADER_SIZE = 11
+
+
+def index_path(recording: str) -> str:
+    return recording + INDEX_SUFFIX
+
+
+class KeyframeIndex:
+    """Writer of the index of one recording"""
+
+    def __init__(self, recording: str):
+        self.path = index_path(recording)
+        try:
+            self._file = open(self.path, "w")
+        except OSError:
+            self._file = None  # clips are a nicety, the recording goes on
+
+    def _write(self, entry: dict) -> None:
+        if not self._file:
+            return
+        try:
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except (OSError, ValueError):
+            self.close()
+
+    def header(self, offset: int, length: int) -> None:
+        self._write({"header": [offset, length]})
+
+    def config(self, offset: int, length: int) -> None:
+        self._write({"config": [offset, length]})
+
+    def keyframe(self, offset: int, ms: int, ts: int) -> None:
+        self._write({"keyframe": offset, "ms": ms, "ts": ts})
+
+    def flush(self) -> None:
+        """Called once the recorded bytes the entries point to are written"""
+        if self._file:
+            try:
+                self._file.flush()
+            except OSError:
+                self.close()
+
+    def close(self) -> None:
+        if self._file:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def remove(self) -> None:
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def load_index(recording: str, size: int) -> list[dict]:
+    """
+    The connections of a recording, each with its header, config tags and
+    (offset, ms, ts) keyframes, limited to the first size bytes of the file.
+    """
+    connections = []
+    try:
+        with open(index_path(recording)) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return connections
+
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # being written
+        if "header" in entry:
+            offset, length = entry["header"]
+            if offset + length > size:
+                break
+            connections.append(
+                {"header": (offset, length), "configs": [], "keyframes": []}
+            )
+        elif not connections:
+            continue
+        elif "config" in entry:
+            offset, length = entry["config"]
+            if offset + length <= size:
+                connections[-1]["configs"].append((offset, length))
+        elif entry.get("keyframe", size) < size:
+            connections[-1]["keyframes"].append(
+                (entry["keyframe"], entry["ms"], entry.get("ts"))
+            )
+    return connections
+
+
+def _copy_range(src, dst, offset: int, length: int) -> None:
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _tags(src, offset: int, end: int):
+    """
+    The (offset, header, length) of the tags from offset to end. A tag cut
+    off by end (the connection dropped, or it is still being written)
+    ends them.
+    """
+    while offset + TAG_HEADER_SIZE <= end:
+        src.seek(offset)
+        header = bytearray(src.read(TAG_HEADER_SIZE))
+        if len(header) < TAG_HEADER_SIZE:
+            return
+        length = TAG_HEADER_SIZE + int.from_bytes(header[1:4], "big") + 4
+        if offset + length > end:
+            return
+        yield offset, header, length
+        offset += length
+
+
+def _complete_end(src, offset: int, end: int) -> int:
+    """Where the last complete tag from offset (a tag start) to end ends"""
+    for tag_offset, _, length in _tags(src, offset, end):
+        offset = tag_offset + length
+    return offset
+
+
+def _copy_tags(src, dst, offset: int, end: int, shift: int) -> None:
+    """Copies the tags from offset to end with shift added to their timestamps"""
+    for tag_offset, header, length in _tags(src, offset, end):
+        timestamp = int.from_bytes(header[4:7], "big") | header[7] << 24
+        timestamp = max(0, timestamp + shift) & 0xFFFFFFFF
+        header[4:7] = (timestamp & 0xFFFFFF).to_bytes(3, "big")
+        header[7] = timestamp >> 24
+        dst.write(header)
+        _copy_range(src, dst, tag_offset + TAG_HEADER_SIZE, length - TAG_HEADER_SIZE)
+
+
+def cut_clip(recording: str, seconds: float, output: str) -> float | None:
+    """
+    Writes the last seconds of a recording to output as FLV, starting at
+    a keyframe. Returns the seconds of stream the clip starts before the
+    last indexed keyframe, or None if there is no index to cut with.
+    """
+    size = os.path.getsize(recording)
+    connections = load_index(recording, size)
+    keyframes = [
+        (ms, i, offset, ts)
+        for i, c in enumerate(connections)
+        for offset, ms, ts in c["keyframes"]
+    ]
+    if not keyframes:
+        return None
+
+    # The last keyframe at least seconds before the end, else the first one
+    target = keyframes[-1][0] - seconds * 1000
+    start_ms, first, start, start_ts = keyframes[0]
+    for ms, i, offset, ts in keyframes:
+        if ms > target:
+            break
+        start_ms, first, start, start_ts = ms, i, offset, ts
+
+    # Later connections need their first keyframe to place them in time;
+    # one that has none yet (or an index without timestamps) ends the clip
+    later = []
+    for connection in connections[first + 1 :]:
+        if not connection["keyframes"] or None in (
+            start_ts,
+            connection["keyframes"][0][2],
+        ):
+            break
+        later.append(connection)
+    ends = [c["header"][0] for c in connections[first + 1 :]] + [size]
+
+    with open(recording, "rb") as src, open(output, "wb") as dst:
+        _copy_range(src, dst, *connections[first]["header"])
+        for offset, length in connections[first]["configs"]:
+            if offset < start:
+                _copy_range(src, dst, offset, length)
+        end = ends[0]
+        if later:
+            # Leave out the tag the connection dropped in the middle of,
+            # looking no further back than its last keyframe
+            end = _complete_end(src, connections[first]["keyframes"][-1][0], end)
+        _copy_range(src, dst, start, end - start)
+
+        # After a reconnect, without the FLV header and with the timestamps
+        # moved from where that connection restarted to the stream time
+        for connection, end in zip(later, ends[1:]):
+            _, ms, ts = connection["keyframes"][0]
+            shift = (ms - ts) - (start_ms - start_ts)
+            offset, length = connection["header"]
+            _copy_tags(src, dst, offset + length, end, shift)
+
+    return (keyframes[-1][0] - start_ms) / 1000
@@ -0,0 +1,223 @@
+"""
+Streaming FLV tag parser for live statistics.
+
+The recorder feeds it every chunk it writes. Only the 11-byte tag
+headers and the first bytes of audio/video payloads are looked at, the
+rest is skipped by length, so the cost is a few operations per tag
+(~100 tags per second for a typical live) whatever the bitrate.
+
+Timestamps restart on every connection (new_connection()) and may jump
+back within one; each run of increasing timestamps is a segment and the
+duration is the sum of the segments. A forward jump of more than
+GAP_THRESHOLD between two video tags is a gap (frames TikTok dropped).
+
+Given an index (see utils.flv_index), the parser also reports where in
+the file each FLV header, script/sequence header tag and keyframe is.
+"""
+
+from dataclasses import dataclass
+
+FLV_SIGNATURE = b"FLV"
+FLV_HEADER_SIZE = 9 + 4  # header and the first PreviousTagSize
+TAG_HEADER_SIZE = 11
+
+AUDIO, VIDEO, SCRIPT = 8, 9, 18
+KEYFRAME = 1
+AVC, HEVC = 7, 12  # legacy codec ids that carry a packet type byte
+AAC = 10  # sound format whose packet type 0 is the decoder config
+
+GAP_THRESHOLD = 1000  # ms between two video tags
+RESET_THRESHOLD = 1000  # ms a timestamp may go back before it starts a segment
+
+
+@dataclass
+class FlvStats:
+    tags: int = 0
+    video_bytes: int = 0
+    audio_bytes: int = 0
+    video_frames: int = 0
+    keyframes: int = 0
+    keyframe_span: int = 0  # ms from the first to the last keyframe of segments
+    keyframe_intervals: int = 0
+    duration: int = 0  # ms of the finished segments
+    gaps: int = 0
+    gap_duration: int = 0  # ms
+    resets: int = 0  # timestamps going back within a connection
+    connections: int = 0
+
+
+class FlvTagParser:
+    """Incremental FLV demuxer that only counts"""
+
+    def __init__(self, index=None):
+        self.stats = FlvStats()
+        self.index = index
+        self.valid = True  # False once the stream turned out not to be FLV
+        self.position = 0  # bytes fed so far, the offset in the recorded file
+        self._first_ts = self._last_ts = None  # ms, of the current segment
+        self._last_video_ts = self._last_keyframe_ts = None
+        self.new_connection()
+
+    def new_connection(self) -> None:
+        """The next bytes are a new stream, starting with an FLV header"""
+        self._close_segment()
+        self.stats.connections += 1
+        self._state = self._on_file_header
+        self._want = FLV_HEADER_SIZE
+        self._buffer = bytearray()
+        self._skip = 0
+
+    def _close_segment(self) -> None:
+        if self._first_ts is not None:
+            self.stats.duration += self._last_ts - self._first_ts
+        self._first_ts = self._last_ts = None
+        self._last_video_ts = self._last_keyframe_ts = None
+
+    def feed(self, data: bytes) -> None:
+        if not self.valid:
+            return
+
+        view = memoryview(data)
+        pos, end = 0, len(view)
+        while pos < end:
+            if self._skip:
+                step = min(self._skip, end - pos)
+                pos += step
+                self.position += step
+                self._skip -= step
+                continue
+
+            take = min(self._want - len(self._buffer), end - pos)
+            self._buffer += view[pos : pos + take]
+            pos += take
+            self.position += take
+            if len(self._buffer) == self._want:
+                buffer, self._buffer = self._buffer, bytearray()
+                self._state(buffer)
+                if not self.valid:
+                    return
+
+    def _expect_tag(self, skip: int = 0) -> None:
+        self._skip = skip
+        self._state = self._on_tag_header
+        self._want = TAG_HEADER_SIZE
+
+    def _on_file_header(self, header: bytearray) -> None:
+        if header[:3] != FLV_SIGNATURE:
+            self.valid = False
+            return
+        # The header may announce more than 9 bytes
+        extra = max(0, int.from_bytes(header[5:9], "big") - 9)
+        if self.index:
+            self.index.header(self.position - FLV_HEADER_SIZE, FLV_HEADER_SIZE + extra)
+        self._expect_tag(extra)
+
+    def _on_tag_header(self, header: bytearray) -> None:
+        tag_type = header[0] & 0x1F
+        size = int.from_bytes(header[1:4], "big")
+        timestamp = int.from_bytes(header[4:7], "big") | header[7] << 24
+        self.stats.tags += 1
+        self._tag_offset = self.position - TAG_HEADER_SIZE
+        self._tag_length = TAG_HEADER_SIZE + size + 4
+
+        # Look at the first two payload bytes, skip the rest and PreviousTagSize
+        if tag_type == VIDEO and size >= 2:
+            self.stats.video_bytes += size
+            self._state = self._on_video
+        elif tag_type == AUDIO and size >= 2:
+            self.stats.audio_bytes += size
+            self._state = self._on_audio
+        else:
+            if tag_type == SCRIPT and self.index:
+                self.index.config(self._tag_offset, self._tag_length)
+            self._expect_tag(size + 4)
+            return
+        self._tag_timestamp, self._tag_rest = timestamp, size - 2 + 4
+        self._want = 2
+
+    def _timestamp(self, timestamp: int) -> None:
+        """Segments follow the media frames; config tags are often stamped 0"""
+        if self._first_ts is None:
+            self._first_ts = self._last_ts = timestamp
+        elif timestamp < self._last_ts - RESET_THRESHOLD:
+            self.stats.resets += 1
+            self._close_segment()
+            self._first_ts = self._last_ts = timestamp
+        else:
+            self._last_ts = max(self._last_ts, timestamp)
+
+    def _on_video(self, head: bytearray) -> None:
+        first = head[0]
+        if first & 0x80:
+            # Enhanced RTMP: frame type and packet type (0 = sequence start)
+            frame_type, is_config = first >> 4 & 0x07, first & 0x0F == 0
+        else:
+            frame_type = first >> 4
+            is_config = first & 0x0F in (AVC, HEVC) and head[1] == 0
+        self._expect_tag(self._tag_rest)
+        if is_config:
+            if self.index:
+                self.index.config(self._tag_offset, self._tag_length)
+            return
+
+        stats, timestamp = self.stats, self._tag_timestamp
+        self._timestamp(timestamp)
+        stats.video_frames += 1
+        if (
+            self._last_video_ts is not None
+            and timestamp - self._last_video_ts > GAP_THRESHOLD
+        ):
+            stats.gaps += 1
+            stats.gap_duration += timestamp - self._last_video_ts
+        self._last_video_ts = timestamp
+
+        if frame_type == KEYFRAME:
+            stats.keyframes += 1
+            if (
+                self._last_keyframe_ts is not None
+                and timestamp >= self._last_keyframe_ts
+            ):
+                stats.keyframe_span += timestamp - self._last_keyframe_ts
+                stats.keyframe_intervals += 1
+            self._last_keyframe_ts = timestamp
+            if self.index:
+                ms = stats.duration + timestamp - self._first_ts
+                self.index.keyframe(self._tag_offset, ms, timestamp)
+
+    def _on_audio(self, head: bytearray) -> None:
+        self._expect_tag(self._tag_rest)
+        if head[0] >> 4 == AAC and head[1] == 0:
+            if self.index:
+                self.index.config(self._tag_offset, self._tag_length)
+        else:
+            self._timestamp(self._tag_timestamp)
+
+    @property
+    def duration(self) -> float:
+        """Seconds of stream so far"""
+        current = self._last_ts - self._first_ts if self._first_ts is not None else 0
+        return (self.stats.duration + current) / 1000
+
+    def summary(self) -> dict:
+        """The statistics so far, in the units people read"""
+        stats, seconds = self.stats, self.duration
+        return {
+            "duration": round(seconds, 1),
+            "video_kbps": round(stats.video_bytes * 8 / seconds / 1000)
+            if seconds
+            else 0,
+            "audio_kbps": round(stats.audio_bytes * 8 / seconds / 1000)
+            if seconds
+            else 0,
+            "fps": round(stats.video_frames / seconds, 1) if seconds else 0,
+            "keyframes": stats.keyframes,
+            "keyframe_interval": (
+                round(stats.keyframe_span / stats.keyframe_intervals / 1000, 2)
+                if stats.keyframe_intervals
+                else None
+            ),
+            "gaps": stats.gaps,
+            "gap_seconds": round(stats.gap_duration / 1000, 1),
+            "timestamp_resets": stats.resets,
+            "connections": stats.connections,
+        }
@@ -30,6 +30,9 @@ class LoggerManager:
             self.logger = logging.getLogger("logger")
             self.logger.setLevel(logging.INFO)
 
+            # Has its own handlers, don't duplicate into a host app's root logger
+            self.logger.propagate = False
+
             # 1) INFO handler
             info_handler = logging.StreamHandler()
             info_handler.setLevel(logging.INFO)
@@ -0,0 +1,309 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.logger_manager import logger
+
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    """
+    Base class of a metric family with optional labels.
+    """
+
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(k), v] for k, v in self._samples.items()]
+        return {
+            "type": self.TYPE,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": samples,
+        }
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._samples[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [per-bucket counts..., sum, count]
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[i] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+class Registry:
+    """
+    Process-wide collection of metrics, rendered in the Prometheus
+    text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def render(self, extra_snapshots=()) -> str:
+        """
+        Renders this registry merged with snapshots of other processes.
+        Samples with the same name and labels are summed.
+        """
+        families = {}
+        for snapshot in [self.snapshot(), *extra_snapshots]:
+            for name, family in snapshot.items():
+                merged = families.setdefault(name, {**family, "samples": {}})
+                for labels, value in family["samples"]:
+                    key = tuple(labels)
+                    current = merged["samples"].get(key)
+                    if current is None:
+                        merged["samples"][key] = value
+                    elif isinstance(value, list):
+                        merged["samples"][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged["samples"][key] = current + value
+
+        lines = []
+        for name, family in sorted(families.items()):
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            labelnames = family["labelnames"]
+            for key, value in sorted(family["samples"].items()):
+                pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, key)]
+                if family["type"] != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {value}")
+                    continue
+
+                for bound, count in zip(family["buckets"], value):
+                    bucket_pairs = pairs + [f'le="{bound}"']
+                    lines.append(f"{name}_bucket{_labels(bucket_pairs)} {count}")
+                inf_pairs = pairs + ['le="+Inf"']
+                lines.append(f"{name}_bucket{_labels(inf_pairs)} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(pairs)} {value[-2]}")
+                lines.append(f"{name}_count{_labels(pairs)} {value[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: list[str]) -> str:
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+REGISTRY = Registry()
+
+
+class TextfileExporter:
+    """
+    Periodically dumps this process' registry into a shared directory,
+    so that a MetricsServer in another process can expose it.
+    """
+
+    def __init__(self, directory: str, interval: int = 10):
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+
+    def write(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(REGISTRY.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as ex:
+                logger.error(f"Metrics export failed: {ex}")
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.write)
+        threading.Thread(target=self._run, daemon=True).start()
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics on a local port from a background thread.
+    Snapshots exported by other processes into textfile_dir are merged
+    in; the ones not refreshed for stale_after seconds are discarded,
+    after their counters and histograms were folded into the totals of
+    exited processes, so those never go down.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9108, textfile_dir=None, stale_after=300):
+        self.host = host
+        self.port = port
+        self.textfile_dir = textfile_dir
+        self.stale_after = stale_after
+        self._exited = {}  # name -> family, samples keyed by label values
+        self._lock = threading.Lock()
+
+    def _retire(self, snapshot: dict) -> None:
+        """Adds the cumulative samples of an exited process' snapshot to _exited"""
+        for name, family in snapshot.items():
+            if family["type"] not in ("counter", "histogram"):
+                continue  # a gauge of an exited process means nothing
+            retired = self._exited.setdefault(name, {**family, "samples": {}})
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                current = retired["samples"].get(key)
+                if current is None:
+                    retired["samples"][key] = value
+                elif isinstance(value, list):
+                    retired["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    retired["samples"][key] = current + value
+
+    def _read_textfiles(self) -> list[dict]:
+        if not self.textfile_dir or not os.path.isdir(self.textfile_dir):
+            return []
+
+        snapshots = []
+        now = time.time()
+        with self._lock:
+            for entry in os.scandir(self.textfile_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stale = now - entry.stat().st_mtime > self.stale_after
+                    with open(entry.path) as f:
+                        snapshot = json.load(f)
+                    if stale:
+                        self._retire(snapshot)
+                        os.remove(entry.path)
+                        continue
+                except (OSError, ValueError):
+                    continue
+                snapshots.append(snapshot)
+
+            snapshots.append(
+                {
+                    name: {
+                        **family,
+                        "samples": [[list(k), v] for k, v in family["samples"].items()],
+                    }
+                    for name, family in self._exited.items()
+                }
+            )
+        return snapshots
+
+    def start(self) -> None:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = REGISTRY.render(server._read_textfiles()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        logger.info(f"Metrics available on http://{self.host}:{self.port}/metrics")
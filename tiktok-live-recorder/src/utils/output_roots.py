@@ -0,0 +1,93 @@
+import os
+import shutil
+import time
+
+from utils.enums import RecordingStatus
+from utils.logger_manager import logger
+
+
+# Write rate assumed for a recording that has not reported its size yet
+DEFAULT_WRITE_RATE = 256 * 1024  # bytes per second, ~2 Mbit/s live stream
+
+# Free space is compared in steps of this, so that write load decides
+# between roots with about as much room
+FREE_SPACE_STEP = 1024**3
+
+
+class OutputRouter:
+    """
+    Spreads new recordings over several output directories.
+
+    Roots with less than min_free_bytes free are left out. Each recording
+    goes to the root with the most free space, and between roots with
+    about as much to the one with the lowest write load. Load is estimated
+    from the recordings that the catalog reports as in progress, grouped
+    per device so two roots on the same disk share it.
+    """
+
+    def __init__(self, roots: list[str], catalog=None, min_free_bytes: int = 0):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.catalog = catalog
+        self.min_free_bytes = min_free_bytes
+
+        for root in self.roots:
+            os.makedirs(root, exist_ok=True)
+
+    def _write_load(self) -> dict[int, float]:
+        """
+        Returns the estimated bytes/s being written, per device.
+        """
+        load = {}
+        if self.catalog is None:
+            return load
+
+        now = time.time()
+        for recording in self.catalog.recordings_with_status(RecordingStatus.RECORDING):
+            root = self.root_of(recording.path)
+            if root is None:
+                continue
+
+            elapsed = now - recording.started_at
+            rate = recording.size / elapsed if recording.size and elapsed > 0 else 0
+            try:
+                device = os.stat(root).st_dev
+            except OSError:
+                continue  # unmounted or removed, pick() skips it too
+            load[device] = load.get(device, 0) + max(rate, DEFAULT_WRITE_RATE)
+
+        return load
+
+    def root_of(self, path: str) -> str | None:
+        """
+        Returns the configured root that contains the given file.
+        """
+        path = os.path.abspath(path)
+        for root in self.roots:
+            if path.startswith(os.path.join(root, "")):
+                return root
+        return None
+
+    def pick(self) -> str:
+        """
+        Returns the root a new recording should be written to.
+        """
+        if len(self.roots) == 1:
+            return self.roots[0]
+
+        load = self._write_load()
+        stats = []
+        for root in self.roots:
+            try:
+                free = shutil.disk_usage(root).free
+                device = os.stat(root).st_dev
+            except OSError as ex:
+                logger.error(f"Output root {root} unavailable: {ex}")
+                continue
+            stats.append((root, free, load.get(device, 0)))
+
+        usable = [s for s in stats if s[1] >= self.min_free_bytes] or stats
+        if not usable:
+            return self.roots[0]
+
+        root, _, _ = max(usable, key=lambda s: (s[1] // FREE_SPACE_STEP, -s[2]))
+        return root
@@ -0,0 +1,136 @@
+"""
+One retry policy for every loop that talks to the network.
+
+Errors are classified (network, throttled, waf, unexpected), each kind backs off
+exponentially from its own base up to its own cap, and every delay is
+jittered so processes that failed together don't retry together.
+"""
+
+import random
+import time
+from http.client import HTTPException
+
+from utils.custom_exceptions import IPBlockedByWAF
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+
+RETRIES = REGISTRY.counter(
+    "retries_total",
+    "Retries after a failure, per loop and error kind.",
+    ["loop", "kind"],
+)
+
+# kind -> (base delay, cap) in seconds
+BACKOFF = {
+    "network": (2, 120),
+    "throttled": (5, 600),
+    "waf": (60, 1800),
+    "unexpected": (5, 600),
+}
+
+
+class RetryableStatus(Exception):
+    """
+    Raised by callers for an HTTP answer worth retrying (429, 5xx).
+    """
+
+    def __init__(self, status_code: int, retry_after: float | None = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def classify(ex: BaseException) -> str:
+    """
+    Maps an exception to a BACKOFF kind.
+    """
+    if isinstance(ex, IPBlockedByWAF):
+        return "waf"
+    if _server_delay(ex):
+        return "throttled"
+    # requests, curl_cffi and socket errors are all OSErrors
+    if isinstance(ex, (OSError, HTTPException, RetryableStatus)):
+        return "network"
+    return "unexpected"
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Delay before retry number attempt (0-based): exponential, capped,
+    with "equal jitter" (between half and all of the step).
+    """
+    step = min(cap, base * 2**attempt)
+    return random.uniform(step / 2, step)
+
+
+def _server_delay(ex: BaseException) -> float | None:
+    # RetryableStatus / Telegram 429 carry retry_after, Telethon's FloodWait seconds
+    for attr in ("retry_after", "seconds"):
+        value = getattr(ex, attr, None)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    return None
+
+
+class Backoff:
+    """
+    Retry state of one loop. Call wait(ex) after a failure and reset()
+    after a success; consecutive failures of a kind grow its delay.
+    """
+
+    def __init__(self, loop: str, sleep=time.sleep):
+        self.loop = loop
+        self.attempts = {}
+        self._sleep = sleep
+
+    def delay(self, ex: BaseException) -> float:
+        kind = classify(ex)
+        attempt = self.attempts.get(kind, 0)
+        self.attempts[kind] = attempt + 1
+
+        delay = backoff_delay(attempt, *BACKOFF[kind])
+        server_delay = _server_delay(ex)
+        if server_delay:
+            delay = max(delay, server_delay)
+
+        RETRIES.inc(loop=self.loop, kind=kind)
+        return delay
+
+    def wait(self, ex: BaseException, error=None) -> float:
+        """
+        Sleeps for the delay of ex. An error message given is logged with
+        the delay, instead of the retry line.
+        """
+        delay = self.delay(ex)
+        if error:
+            logger.error(f"{error} Retrying in {delay:.0f}s.")
+        else:
+            logger.info(f"Retrying {self.loop} in {delay:.1f}s ({classify(ex)}: {ex})")
+        self._sleep(delay)
+        return delay
+
+    def reset(self) -> None:
+        self.attempts.clear()
+
+
+def retry_call(
+    fn,
+    *args,
+    loop: str,
+    attempts: int = 3,
+    retry_on=("network", "throttled", "waf"),
+    **kwargs,
+):
+    """
+    Calls fn until it succeeds, retrying failures of the given kinds up
+    to attempts times in total. The last error is re-raised.
+    """
+    backoff = Backoff(loop)
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as ex:
+            if classify(ex) not in retry_on or attempt == attempts - 1:
+                raise
+            backoff.wait(ex)
@@ -0,0 +1,78 @@
+"""
+Startup state cached across runs in a stamp file.
+
+The dependency check imports every library and runs the ffmpeg binary,
+and its result only changes when the interpreter, the ffmpeg binary or
+requirements.txt change. It is stored under a key derived from them and
+skipped while the key matches. The stamp also remembers when updates
+were last checked, so that happens at most once per TTL, and which new
+version to install at the next start.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+from utils.logger_manager import logger
+
+CACHE_DIR = os.environ.get("TIKREC_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "tiktok-live-recorder"
+)
+STAMP_FILE = os.path.join(CACHE_DIR, "startup.json")
+
+UPDATE_CHECK_TTL = 24  # hours between two update checks
+
+REQUIREMENTS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "requirements.txt"
+)
+
+
+def environment_key() -> str:
+    """
+    Identifies the interpreter, the ffmpeg binary and the requirements
+    without running or importing anything.
+    """
+    parts = [sys.executable, sys.version]
+    for path in (shutil.which("ffmpeg"), REQUIREMENTS_FILE):
+        try:
+            stat = os.stat(path)
+            parts += [path, stat.st_size, stat.st_mtime_ns]
+        except (OSError, TypeError):
+            parts.append(None)
+
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def read_stamp() -> dict:
+    try:
+        with open(STAMP_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_stamp(**values) -> None:
+    """
+    Merges values into the stamp file. Failing to write it only costs
+    the next start some time.
+    """
+    stamp = {**read_stamp(), **values}
+    tmp = f"{STAMP_FILE}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(stamp, f)
+        os.replace(tmp, STAMP_FILE)
+    except OSError as ex:
+        logger.debug(f"Could not write {STAMP_FILE}: {ex}")
+
+
+def log_cold_start(started_at: float) -> None:
+    """
+    Logs the time since started_at (a time.perf_counter() taken as the
+    first thing of the entry point).
+    """
+    logger.info(f"Started in {time.perf_counter() - started_at:.2f}s")
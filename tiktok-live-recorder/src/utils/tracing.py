@@ -0,0 +1,256 @@
+"""
+Lightweight span tracing for the go-live critical path.
+
+A trace is started when a user is checked. Spans opened while it is
+active (including every request made through InstrumentedSession) are
+buffered and only exported, as JSON lines, if the trace is kept, i.e.
+the check turned into a recording. The trace context is handed to the
+recorder subprocess through environment variables so its spans land in
+the same trace.
+
+Render a waterfall with: python -m utils.tracing traces.jsonl [trace_id]
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+ENV_TRACE_ID = "TIKREC_TRACE_ID"
+ENV_PARENT_ID = "TIKREC_TRACE_PARENT"
+ENV_TRACE_START = "TIKREC_TRACE_START"
+ENV_TRACE_FILE = "TIKREC_TRACE_FILE"
+
+_export_lock = threading.Lock()
+_export_path = os.environ.get(ENV_TRACE_FILE)
+
+# (Trace, current span id) of the running context
+_current = contextvars.ContextVar("tiktok_trace", default=None)
+
+
+def configure(path: str | None) -> None:
+    """
+    Sets the JSON lines file spans are exported to (None disables tracing).
+    """
+    global _export_path
+    _export_path = path
+
+
+def _export(records: list[dict]) -> None:
+    if not _export_path or not records:
+        return
+
+    data = "".join(json.dumps(r) + "\n" for r in records)
+    with _export_lock:
+        with open(_export_path, "a") as f:
+            f.write(data)
+
+
+class Trace:
+    def __init__(self, trace_id: str, start: float, buffered: bool):
+        self.trace_id = trace_id
+        self.start = start
+        self.buffered = buffered
+        self.keep = not buffered
+        self.records = []
+        self.flushed = False
+        self._lock = threading.Lock()
+
+    def record(self, record: dict) -> None:
+        with self._lock:
+            if self.buffered and not self.flushed:
+                self.records.append(record)
+                return
+        # Unbuffered, or a side task that finished after the root span
+        if self.keep:
+            _export([record])
+
+    def flush(self) -> None:
+        with self._lock:
+            records, self.records = self.records, []
+            self.flushed = True
+        if self.keep:
+            _export(records)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def _span(trace: Trace, parent_id: str | None, name: str, attrs: dict):
+    span_id = _new_id()
+    token = _current.set((trace, span_id))
+    start = time.time()
+    try:
+        yield trace
+    finally:
+        end = time.time()
+        _current.reset(token)
+        trace.record(
+            {
+                "trace_id": trace.trace_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start": start,
+                "end": end,
+                "duration": end - start,
+                "pid": os.getpid(),
+                "attrs": attrs,
+            }
+        )
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    Starts a new buffered trace. Set `.keep = True` on the yielded
+    Trace to export it when the root span ends.
+    """
+    if not _export_path:
+        yield Trace(_new_id(), time.time(), buffered=True)
+        return
+
+    new_trace = Trace(_new_id(), time.time(), buffered=True)
+    try:
+        with _span(new_trace, None, name, attrs):
+            yield new_trace
+    finally:
+        new_trace.flush()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Opens a child span of the current one. No-op outside of a trace.
+    """
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+
+    trace_, parent_id = current
+    with _span(trace_, parent_id, name, attrs):
+        yield trace_
+
+
+def event(name: str, **attrs) -> None:
+    """
+    Records a zero-length span, e.g. the first byte of the stream.
+    """
+    current = _current.get()
+    if current is None:
+        return
+
+    trace_, parent_id = current
+    attrs["since_trace_start"] = round(time.time() - trace_.start, 3)
+    with _span(trace_, parent_id, name, attrs):
+        pass
+
+
+def current_trace() -> Trace | None:
+    current = _current.get()
+    return current[0] if current else None
+
+
+def context_env() -> dict:
+    """
+    Environment variables that carry the current trace to a subprocess.
+    """
+    current = _current.get()
+    if current is None or not _export_path:
+        return {}
+
+    trace_, span_id = current
+    trace_.keep = True
+    return {
+        ENV_TRACE_ID: trace_.trace_id,
+        ENV_PARENT_ID: span_id,
+        ENV_TRACE_START: str(trace_.start),
+        ENV_TRACE_FILE: os.path.abspath(_export_path),
+    }
+
+
+def resume_from_env() -> bool:
+    """
+    Continues the trace of the parent process, if it passed one.
+    """
+    trace_id = os.environ.get(ENV_TRACE_ID)
+    if not trace_id or not _export_path:
+        return False
+
+    start = float(os.environ.get(ENV_TRACE_START, time.time()))
+    _current.set(
+        (Trace(trace_id, start, buffered=False), os.environ.get(ENV_PARENT_ID))
+    )
+    return True
+
+
+def detach() -> None:
+    """
+    Leaves the current trace; later spans in this context are not recorded.
+    """
+    _current.set(None)
+
+
+def waterfall(records: list[dict]) -> str:
+    """
+    Renders the spans of one trace as an indented waterfall.
+    """
+    records = sorted(records, key=lambda r: r["start"])
+    start = min(r["start"] for r in records)
+    children = {}
+    for r in records:
+        children.setdefault(r["parent_id"], []).append(r)
+    ids = {r["span_id"] for r in records}
+
+    lines = []
+
+    def walk(record, depth):
+        attrs = " ".join(f"{k}={v}" for k, v in record["attrs"].items())
+        lines.append(
+            f"  +{record['start'] - start:8.3f}s {record['duration']:8.3f}s  "
+            f"{'  ' * depth}{record['name']} {attrs}".rstrip()
+        )
+        for child in children.get(record["span_id"], []):
+            walk(child, depth + 1)
+
+    for root in [r for r in records if r["parent_id"] not in ids]:
+        walk(root, 0)
+
+    first_byte = [r for r in records if r["name"] == "first_byte"]
+    if first_byte:
+        ttfb = first_byte[0]["start"] - start
+        lines.append(f"  time to first byte: {ttfb:.3f}s")
+
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> None:
+    if not argv:
+        print("Usage: python -m utils.tracing <traces.jsonl> [trace_id]")
+        return
+
+    traces = {}
+    with open(argv[0]) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces.setdefault(record["trace_id"], []).append(record)
+
+    for trace_id, records in traces.items():
+        if len(argv) > 1 and trace_id != argv[1]:
+            continue
+        print(f"trace {trace_id}")
+        print(waterfall(records))
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
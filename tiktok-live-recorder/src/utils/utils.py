@@ -1,5 +1,6 @@
 import json
 import os
+from functools import lru_cache
 
 from utils.enums import Info
 
@@ -31,6 +32,7 @@ def read_telegram_config():
         return json.load(f)
 
 
+@lru_cache(maxsize=None)
 def is_termux() -> bool:
     """
     Checks if the script is running in Termux.
@@ -1,12 +1,35 @@
 import os
 import time
 
-import ffmpeg
-
+from utils.enums import StreamFormat
 from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+
+CONVERSION_DURATION = REGISTRY.histogram(
+    "conversion_duration_seconds",
+    "Time spent remuxing a recording to MP4.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
 
 
 class VideoManagement:
+    # suffix of the raw file written while recording, per stream format
+    RAW_SUFFIXES = {
+        StreamFormat.FLV: "_flv.mp4",
+        StreamFormat.HLS: "_hls.ts",
+    }
+
+    @staticmethod
+    def converted_path(file):
+        """
+        Returns the path of the MP4 file produced from a raw recording.
+        """
+        for suffix in VideoManagement.RAW_SUFFIXES.values():
+            if file.endswith(suffix):
+                return file[: -len(suffix)] + ".mp4"
+        return file
+
     @staticmethod
     def wait_for_file_release(file, timeout=10):
         """
@@ -24,8 +47,11 @@ class VideoManagement:
     @staticmethod
     def convert_flv_to_mp4(file):
         """
-        Convert the video from flv format to mp4 format
+        Convert the video from flv (or mpeg-ts) format to mp4 format
         """
+        # Only needed once a recording ends, keep it off the startup path
+        import ffmpeg
+
         logger.info("Converting {} to MP4 format...".format(file))
 
         if not VideoManagement.wait_for_file_release(file):
@@ -35,11 +61,12 @@ class VideoManagement:
             return
 
         try:
-            ffmpeg.input(file).output(
-                file.replace("_flv.mp4", ".mp4"),
-                c="copy",
-                y="-y",
-            ).run(quiet=True)
+            with CONVERSION_DURATION.time():
+                ffmpeg.input(file).output(
+                    VideoManagement.converted_path(file),
+                    c="copy",
+                    y="-y",
+                ).run(quiet=True)
         except ffmpeg.Error as e:
             logger.error(
                 f"ffmpeg error: {e.stderr.decode() if hasattr(e, 'stderr') else str(e)}"
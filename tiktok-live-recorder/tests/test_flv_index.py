@@ -0,0 +1,123 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from utils.flv_index import KeyframeIndex, cut_clip  # noqa: E402
+from utils.flv_parser import AUDIO, SCRIPT, VIDEO, FlvTagParser  # noqa: E402
+
+FLV_HEADER = b"FLV\x01\x05\x00\x00\x00\x09" + b"\x00\x00\x00\x00"
+
+
+def tag(tag_type: int, timestamp: int, payload: bytes) -> bytes:
+    header = (
+        bytes([tag_type])
+        + len(payload).to_bytes(3, "big")
+        + (timestamp & 0xFFFFFF).to_bytes(3, "big")
+        + bytes([timestamp >> 24])
+        + b"\x00\x00\x00"
+    )
+    return header + payload + (11 + len(payload)).to_bytes(4, "big")
+
+
+def connection(seconds: int, start: int = 0) -> bytes:
+    """One connection of a 30 fps live with a keyframe every 2s"""
+    data = FLV_HEADER + tag(SCRIPT, 0, b"\x02\x00\x0aonMetaData")
+    data += tag(VIDEO, 0, b"\x17\x00avcC") + tag(AUDIO, 0, b"\xaf\x00asc")
+    for frame in range(seconds * 30):
+        timestamp = start + frame * 1000 // 30
+        kind = b"\x17" if frame % 60 == 0 else b"\x27"
+        data += tag(VIDEO, timestamp, kind + b"\x01" + b"v" * 200)
+        if frame % 2 == 0:
+            data += tag(AUDIO, timestamp, b"\xaf\x01" + b"a" * 50)
+    return data
+
+
+def record(path, *connections: bytes) -> None:
+    """Writes the connections the way the recorder does, indexing them"""
+    index = KeyframeIndex(str(path))
+    parser = FlvTagParser(index)
+    with open(path, "wb") as out:
+        for i, data in enumerate(connections):
+            if i:
+                parser.new_connection()
+            for pos in range(0, len(data), 4096):
+                parser.feed(data[pos : pos + 4096])
+                out.write(data[pos : pos + 4096])
+    index.close()
+
+
+def tags(data: bytes) -> list[tuple[int, int]]:
+    """(type, timestamp) of every tag of a single FLV stream, asserting it is whole"""
+    assert data[:3] == b"FLV"
+    assert data.count(b"FLV\x01") == 1
+    result, pos = [], len(FLV_HEADER)
+    while pos < len(data):
+        size = int.from_bytes(data[pos + 1 : pos + 4], "big")
+        assert data[pos] in (AUDIO, VIDEO, SCRIPT)
+        assert (
+            int.from_bytes(data[pos + 11 + size : pos + 15 + size], "big") == size + 11
+        )
+        timestamp = int.from_bytes(data[pos + 4 : pos + 7], "big") | data[pos + 7] << 24
+        result.append((data[pos], timestamp))
+        pos += 15 + size
+    assert pos == len(data)
+    return result
+
+
+def media_timestamps(clip_tags) -> list[int]:
+    return [ts for kind, ts in clip_tags if kind != SCRIPT]
+
+
+def test_clip_within_one_connection_starts_with_headers_and_a_keyframe(tmp_path):
+    recording = tmp_path / "TK_user_flv.mp4"
+    record(recording, connection(20))
+
+    clip = tmp_path / "clip.flv"
+    covered = cut_clip(str(recording), 5, str(clip))
+
+    assert 5 <= covered < 8
+    clip_tags = tags(clip.read_bytes())
+    assert [kind for kind, _ in clip_tags[:3]] == [SCRIPT, VIDEO, AUDIO]
+    assert clip.read_bytes()[len(FLV_HEADER) :].count(b"\x17\x00avcC") == 1
+    timestamps = media_timestamps(clip_tags[3:])
+    assert timestamps == sorted(timestamps)
+
+
+def test_clip_over_a_reconnect_keeps_timestamps_increasing(tmp_path):
+    recording = tmp_path / "TK_user_flv.mp4"
+    # The second connection restarts its timestamps at 0
+    record(recording, connection(20, start=5000), connection(10))
+
+    clip = tmp_path / "clip.flv"
+    covered = cut_clip(str(recording), 15, str(clip))
+
+    assert 15 <= covered < 18
+    clip_tags = tags(clip.read_bytes())
+    timestamps = media_timestamps(clip_tags[3:])
+    assert timestamps == sorted(timestamps)
+
+    parser = FlvTagParser()
+    parser.feed(clip.read_bytes())
+    assert parser.valid
+    assert parser.stats.resets == 0
+    assert abs(parser.duration - covered) < 2.5
+
+
+def test_clip_over_a_connection_dropped_mid_tag(tmp_path):
+    recording = tmp_path / "TK_user_flv.mp4"
+    dropped = connection(20)[:-100]
+    record(recording, dropped, connection(10))
+
+    clip = tmp_path / "clip.flv"
+    cut_clip(str(recording), 15, str(clip))
+
+    timestamps = media_timestamps(tags(clip.read_bytes())[3:])
+    assert timestamps == sorted(timestamps)
+
+
+def test_no_clip_without_an_index(tmp_path):
+    recording = tmp_path / "TK_user_hls.ts"
+    recording.write_bytes(b"\x47" * 1000)
+
+    assert cut_clip(str(recording), 5, str(tmp_path / "clip.flv")) is None